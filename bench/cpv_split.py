@@ -0,0 +1,67 @@
+"""
+Measures the throughput of cpv_split over the ebuilds of a repository
+(a full gentoo tree, if its location is passed, or a synthetic listing
+of a similar size): the memoized single-atom calls, cold and on repeated atoms,
+and the batch cpv_split_many.
+Usage: python bench/cpv_split.py [repository location] [runs]
+"""
+import os
+import sys
+from os import path
+from time import perf_counter
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from pomu.util.pkg import _cpv_split, cpv_split, cpv_split_many
+
+def list_atoms(location):
+    """Lists category/name-version atoms of the ebuilds in a repository"""
+    res = []
+    for category in sorted(os.listdir(location)):
+        cdir = path.join(location, category)
+        if '-' not in category or not path.isdir(cdir):
+            continue
+        for name in os.listdir(cdir):
+            pdir = path.join(cdir, name)
+            if path.isdir(pdir):
+                res.extend(category + '/' + x[:-7] for x in os.listdir(pdir)
+                        if x.endswith('.ebuild'))
+    return res
+
+def synthetic_atoms(count=32000):
+    """Generates atoms resembling the ebuilds of the gentoo tree"""
+    vers = ['1.0', '2.4.1', '0.9.8z_p8', '3.2_rc1-r1', '20170101', '1.2.3-r2', '5_alpha']
+    return ['cat-{}/pkg-name{}-{}'.format(i % 160, i // 2, vers[i % len(vers)])
+            for i in range(count)]
+
+def measure(func, runs):
+    best = None
+    for _ in range(runs):
+        start = perf_counter()
+        func()
+        t = perf_counter() - start
+        best = t if best is None or t < best else best
+    return best
+
+def main():
+    atoms = list_atoms(sys.argv[1]) if len(sys.argv) > 1 else synthetic_atoms()
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    def cold():
+        _cpv_split.cache_clear()
+        for atom in atoms:
+            cpv_split(atom)
+    # repeated lookups of a working set, which fits into the memo
+    n = min(len(atoms), _cpv_split.cache_info().maxsize // 2)
+    hot = [atoms[i % n] for i in range(len(atoms))]
+    def warm():
+        for atom in hot:
+            cpv_split(atom)
+    cases = [('cpv_split (cold)', cold), ('cpv_split (warm)', warm),
+            ('cpv_split_many', lambda: cpv_split_many(atoms))]
+    print('{} atoms'.format(len(atoms)))
+    for name, func in cases:
+        t = measure(func, runs)
+        print('{:<20} {:8.1f}ms  {:10.0f} atoms/s'.format(name, t * 1000, len(atoms) / t))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Measures the time it takes to list the configured portage repositories,
+through pomu (parsing repos.conf) and through the portage configuration.
+Runs against a scratch configuration root with a few repositories.
+Usage: python bench/startup.py [runs]
+"""
+import subprocess
+import sys
+from os import environ, makedirs, path
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+SNIPPETS = {
+    'python startup': 'pass',
+    'pomu repo config': 'from pomu.repo.config import repo_config; repo_config.repositories()',
+    'portage config': 'import portage; portage.db[portage.root]["vartree"].settings.repositories.prepos_order',
+}
+
+def make_config_root():
+    croot = mkdtemp()
+    conf = path.join(croot, 'etc', 'portage', 'repos.conf')
+    makedirs(conf)
+    with open(path.join(conf, 'repos.conf'), 'w') as f:
+        f.write('[DEFAULT]\nmain-repo = gentoo\n')
+        for name in ['gentoo', 'foo', 'bar']:
+            makedirs(path.join(croot, 'repos', name, 'profiles'))
+            makedirs(path.join(croot, 'repos', name, 'metadata'))
+            with open(path.join(croot, 'repos', name, 'profiles', 'repo_name'), 'w') as r:
+                r.write(name + '\n')
+            with open(path.join(croot, 'repos', name, 'metadata', 'layout.conf'), 'w') as r:
+                r.write('masters = gentoo\n' if name != 'gentoo' else 'masters =\n')
+            f.write('[{}]\nlocation = {}\n'.format(name, path.join(croot, 'repos', name)))
+    return croot
+
+def measure(code, runs, env):
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, check=True,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(perf_counter() - start)
+    return min(times), sum(times) / len(times)
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    croot = make_config_root()
+    env = dict(environ, PORTAGE_CONFIGROOT=croot)
+    try:
+        for name, code in SNIPPETS.items():
+            best, avg = measure(code, runs, env)
+            print('{:<20} best {:7.1f}ms  avg {:7.1f}ms'.format(name, best * 1000, avg * 1000))
+    finally:
+        rmtree(croot)
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,20 @@
 """pomu command line interface"""
+import json
+import os
+import sys
+
 import click
 
 from os import path
 
-from pomu.data.zugaina import ZugainaDataSource
-from pomu.patch.patch import process_changes
-from pomu.repo.init import init_plain_repo, init_portage_repo
 from pomu.repo.repo import portage_repo_path, portage_repos, pomu_active_repo
-from pomu.search import PSPrompt
 from pomu.source import dispatcher
-from pomu.util.pkg import cpv_split
+from pomu.util.git import index_stats
 from pomu.util.result import ResultException
 
+# Subsystems with heavy dependencies (portage, GitPython, curtsies, lxml)
+# are imported by the commands which use them, to keep the startup fast
+
 #TODO: global --repo option, (env var?)
 
 class GlobalVars():
@@ -39,10 +42,14 @@ pass_globals = click.make_pass_decorator(GlobalVars, ensure=True)
         help='Do not setup the portage repo')
 @click.option('--repo-path',
         help='Path to the repo directory (used with --no-portage)')
-def main(no_portage, repo_path):
+@click.option('--stats', is_flag=True,
+        help='Report the number of git index writes and their duration')
+def main(no_portage, repo_path, stats):
     """A utility to import and manage ebuilds portage overlays"""
     g_params.no_portage = no_portage
     g_params.repo_path = repo_path
+    if stats:
+        click.get_current_context().call_on_close(lambda: print(index_stats))
 
 @main.command()
 @click.option('--list-repos', is_flag=True,
@@ -54,6 +61,7 @@ def main(no_portage, repo_path):
 @click.argument('repo', required=False)
 def init(list_repos, create, repo_dir, repo):
     """Initialise a pomu repository"""
+    from pomu.repo.init import init_plain_repo, init_portage_repo
     if list_repos:
         print('Available repos:')
         for prepo in portage_repos():
@@ -75,14 +83,31 @@ def status():
         print('pomu is initialized at', repo.root)
 
 @main.command(name='import')
-@click.argument('package', required=True)
+@click.argument('packages', nargs=-1)
 @click.option('--patch', nargs=1, multiple=True)
+@click.option('--from-file', 'spec_file', type=click.File('r'), default=None,
+        help='Read package specs from a file, one per line (- for stdin)')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=None,
+        help='Number of concurrent manifest generation jobs (default: CPU count)')
 @needs_repo
-def import_cmd(package, patch):
-    """Import a package into a repository"""
-    pkg = dispatcher.get_package(package).expect()
-    pkg.patch(patch)
-    res = pomu_active_repo().merge(pkg).expect()
+def import_cmd(packages, patch, spec_file, jobs):
+    """Import packages into a repository (in a single commit)"""
+    specs = list(packages)
+    if spec_file:
+        specs.extend(x.strip() for x in spec_file
+                if x.strip() and not x.lstrip().startswith('#'))
+    if not specs:
+        raise click.UsageError('No packages specified')
+    if patch and len(specs) > 1:
+        raise click.UsageError('--patch may only be used to import a single package')
+    pkgs = []
+    for spec in specs:
+        pkgs.extend(dispatcher.get_packages(spec).expect())
+    if patch and len(pkgs) > 1:
+        raise click.UsageError('--patch may only be used to import a single package')
+    for pkg in pkgs:
+        pkg.patch(list(patch))
+    res = pomu_active_repo().merge(pkgs, jobs).expect()
     print(res)
 
 @main.command()
@@ -90,6 +115,7 @@ def import_cmd(package, patch):
 @click.argument('patch', type=click.Path(exists=True), nargs=-1, required=True)
 def patch(package):
     """Patch an existing package"""
+    from pomu.util.pkg import cpv_split
     category, name, _ = cpv_split(package)
     pkg = pomu_active_repo().get_package(name=name, category=category).expect()
     pkg.patch(patch).expect()
@@ -98,6 +124,7 @@ def patch(package):
 @click.option('--single', is_flag=True, required=False, default=False)
 def commit(single):
     """Commit user changes"""
+    from pomu.patch.patch import process_changes
     repo = pomu_active_repo()
     change_map = process_changes(repo, single).expect()
 
@@ -122,19 +149,21 @@ def uninstall(uri, package):
         help='Specify fetch destination')
 def fetch(package, into):
     """Fetch a package into a directory (or display its contents)"""
-    pkg = dispatcher.get_package(package).expect()
-    print('Fetched package', pkg, 'at', pkg.root)
-    print('Contents:')
-    for f in pkg.files:
-        print('  ', path.join(*f))
-    if into:
-        pkg.merge_into(into).expect()
-        print('Copied to', into, 'successfully')
+    for pkg in dispatcher.get_packages(package).expect():
+        print('Fetched package', pkg, 'at', pkg.root)
+        print('Contents:')
+        for f in pkg.files:
+            print('  ', path.join(*f))
+        if into:
+            pkg.merge_into(into).expect()
+            print('Copied to', into, 'successfully')
 
 @main.command()
 @click.argument('package', required=True)
+@click.option('--revalidate', is_flag=True, default=False,
+        help='Check that the package is still available from its source')
 @needs_repo
-def show(package):
+def show(package, revalidate):
     """Display installed package info"""
     repo = pomu_active_repo()
     category, _, name = package.rpartition('/')
@@ -147,15 +176,50 @@ def show(package):
     if pkg.backend:
         print('Backend:', pkg.backend.__cname__)
         print('Backend detailes:', pkg.backend)
+        if revalidate:
+            res = pkg.backend.revalidate()
+            print('Source:', 'available' if res.is_ok() else res.err())
 
 @main.command()
 @click.argument('query', required=True)
 @click.option('--fetch-only', default=False, is_flag=True)
-def search(query, fetch_only):
+@click.option('--cache-ttl', type=click.IntRange(min=0), default=None,
+        help='Seconds to reuse cached search results for (0 to always refetch)')
+@click.option('--cache-size', type=click.IntRange(min=1), default=None,
+        envvar='POMU_SEARCH_CACHE_SIZE',
+        help='Maximum size of the search result cache (in MiB)')
+@click.option('--format', 'fmt', type=click.Choice(['json', 'tsv']), default=None,
+        help='Print the results (as JSON lines or tab-separated values) instead of prompting')
+@click.option('--limit', type=click.IntRange(min=0), default=None,
+        help='Maximum number of results to print')
+def search(query, fetch_only, cache_ttl, cache_size, fmt, limit):
     """Search gpo.zugaina.org"""
-    ds = ZugainaDataSource(query)
-    p = PSPrompt(ds)
-    packages = p.run()
+    from pomu.data.zugaina import SearchCache, ZugainaDataSource, TTL, CACHE_SIZE
+    cache = SearchCache(TTL if cache_ttl is None else cache_ttl,
+            CACHE_SIZE if cache_size is None else cache_size * 1024 * 1024)
+    ds = ZugainaDataSource(query, cache=cache)
+    try:
+        if fmt:
+            print_results(ds.iter_results(limit), fmt)
+        else:
+            from pomu.search import PSPrompt
+            p = PSPrompt(ds)
+            packages = p.run()
+    finally:
+        ds.close()
+
+def print_results(results, fmt):
+    """Prints search results, (package, description) pairs, as they come"""
+    try:
+        for package, description in results:
+            description = ' '.join((description or '').split())
+            if fmt == 'json':
+                line = json.dumps({'package': package, 'description': description})
+            else:
+                line = package + '\t' + description
+            click.echo(line)
+    except BrokenPipeError: # the consumer has stopped reading
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
 
 def main_():
     try:
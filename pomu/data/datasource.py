@@ -17,3 +17,13 @@ class DataSource():
 
     def get_item(self, ident):
         pass
+
+    def iter_results(self, limit=None):
+        """Yields search results page by page, as they get fetched"""
+        n = 0
+        for page in range(1, self.page_count() + 1):
+            for item in self.get_page(page):
+                if limit is not None and n >= limit:
+                    return
+                n += 1
+                yield item
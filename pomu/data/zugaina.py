@@ -1,63 +1,199 @@
 """
 gpo.zugaina.org searcher and fetcher
+Requests share a pooled session, and the pages which are likely to be
+requested next (the next search page, ebuild lists of the search results)
+are prefetched in background.
+Parsed search pages and ebuild lists are kept in a persistent cache,
+so repeated searches do not hit the site until the entries expire;
+their raw HTML is not cached.
 """
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
 import lxml.html
 import requests
 
 from pomu.data.datasource import DataSource
+from pomu.util.http import HTTPCache, fetch_text
 from pomu.util.pkg import cpv_split
 
 BASE_URL = 'https://gpo.zugaina.org/'
-SBASE_URL = BASE_URL + 'Search?search={}&page={}'
+SEARCH_PATH = 'Search?search={}&page={}'
+JOBS = 4
+TTL = 24 * 60 * 60
+CACHE_SIZE = 16 * 1024 * 1024
+
+class SearchCache():
+    """A persistent cache of parsed search results, whose entries expire"""
+    def __init__(self, ttl=TTL, max_size=CACHE_SIZE, directory=None):
+        """
+        Parameters:
+            ttl - time (in seconds) for entries to be kept for (0 disables the cache)
+            max_size - maximum total size of the entries (in bytes)
+            directory - cache directory (a subdirectory of the pomu cache by default)
+        """
+        self.ttl = ttl
+        self.cache = HTTPCache(directory, max_size, subdir='search')
+
+    def get(self, key):
+        """Gets a value (or None, if it is not cached, or expired)"""
+        if not self.ttl:
+            return None
+        hit = self.cache.lookup(key)
+        if not hit or hit[0].get('time', 0) + self.ttl < time():
+            return None
+        try:
+            return json.loads(hit[1].decode('utf-8'))
+        except ValueError:
+            return None
+
+    def put(self, key, value):
+        if self.ttl:
+            self.cache.store(key, json.dumps(value).encode('utf-8'), time=time())
+
+def parse_page(text):
+    """Parses a search page into (package, description) pairs and the result count"""
+    doc = lxml.html.document_fromstring(text)
+    field = doc.xpath('//div[@class="pager"]/span')
+    return {
+        'count': int(field[0].text.split(' ')[-1]) if field else None,
+        'items': [(x.text.strip(), x.getchildren()[0].text)
+            for x in doc.xpath('//div[@id="search_results"]/a/div')]
+    }
+
+def parse_items(text):
+    """Parses a package page into (id, version, overlay) of its ebuilds"""
+    doc = lxml.html.document_fromstring(text)
+    res = []
+    for div in doc.xpath('//div[@id="ebuild_list"]/ul/div'):
+        id_ = div.xpath('li/a')[0].get('href').split('/')[3]
+        pv = div.xpath('li/div/b')[0].text
+        v = cpv_split(pv)[2]
+        overlay = div.xpath('@id')[0]
+        res.append((id_, v, overlay))
+    return res
 
 class ZugainaDataSource(DataSource):
 
-    def __init__(self, query):
+    def __init__(self, query, base_url=BASE_URL, jobs=JOBS, cache=None):
+        """
+        Parameters:
+            query - the search query
+            base_url - base URL of the zugaina instance
+            jobs - number of concurrent (prefetching) connections
+            cache - persistent cache of the results (a SearchCache)
+        """
         self.query = query
-        self.pagecache = {}
-        self.itemcache = {}
+        self.base_url = base_url
+        self.jobs = jobs
+        self.cache = cache or SearchCache()
+        self.pagecache = {} # page -> parsed page
+        self.itemcache = {} # package -> its ebuilds
         self.pagecount = -1
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=jobs + 1)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pool = ThreadPoolExecutor(max_workers=jobs)
+        self.pending = {} # url -> future
+        self.lock = threading.Lock()
 
     def page_count(self):
         if self.pagecount > 0:
             return self.pagecount
-        text = self.fetch_page(1)
-        doc = lxml.html.document_fromstring(text)
-        field = doc.xpath('//div[@class="pager"]/span')[0].text
-        self.pagecount = (int(field.split(' ')[-1]) + 49) // 50
+        count = self.fetch_page(1)['count'] or 0
+        self.pagecount = (count + 49) // 50
         return self.pagecount
 
     def get_page(self, page):
-        text = self.fetch_page(page)
-        doc = lxml.html.document_fromstring(text)
-        return [(x.text.strip(), x.getchildren()[0].text)
-                for x in doc.xpath('//div[@id="search_results"]/a/div')]
+        res = [tuple(x) for x in self.fetch_page(page)['items']]
+        # the user is likely to look at these next
+        if page < self.page_count():
+            self.prefetch(self.pagecache, page + 1, self.page_url(page + 1), parse_page)
+        for ident, _ in res:
+            self.prefetch(self.itemcache, ident, self.base_url + ident, parse_items)
+        return res
 
     def list_items(self, ident):
-        text = self.fetch_item(ident)
-        doc = lxml.html.document_fromstring(text)
-        res = []
-        for div in doc.xpath('//div[@id="ebuild_list"]/ul/div'):
-            id_ = div.xpath('li/a')[0].get('href').split('/')[3]
-            pv = div.xpath('li/div/b')[0].text
-            v = cpv_split(pv)[2]
-            overlay = div.xpath('@id')[0]
-            res.append((id_, v, overlay))
-        return res
+        return [tuple(x) for x in self.fetch_item(ident)]
+
+    def iter_results(self, limit=None):
+        """
+        Yields search results page by page, as they get parsed,
+        fetching the following pages concurrently
+        """
+        pages = self.page_count()
+        if limit is not None:
+            pages = min(pages, (limit + 49) // 50)
+        n = 0
+        for page in range(1, pages + 1):
+            for p in range(page + 1, min(page + self.jobs, pages) + 1):
+                self.prefetch(self.pagecache, p, self.page_url(p), parse_page)
+            for item in self.fetch_page(page)['items']:
+                if limit is not None and n >= limit:
+                    return
+                n += 1
+                yield tuple(item)
 
     def get_item(self, ident):
-        return requests.get(BASE_URL + 'AJAX/Ebuild/' + str(ident)).text
+        return fetch_text(self.base_url + 'AJAX/Ebuild/' + str(ident), self.session).expect()
 
     def fetch_item(self, ident):
-        if ident in self.itemcache:
-            return self.itemcache[ident]
-        res = requests.get(BASE_URL + ident).text
-        return res
-
+        return self.fetch(self.itemcache, ident, self.base_url + ident, parse_items)
 
     def fetch_page(self, page):
-        if page in self.pagecache:
-            return self.pagecache[page]
-        res = requests.get(SBASE_URL.format(self.query, page)).text
-        self.pagecache[page] = res
-        return res
+        return self.fetch(self.pagecache, page, self.page_url(page), parse_page)
+
+    def page_url(self, page):
+        return self.base_url + SEARCH_PATH.format(self.query, page)
+
+    def download(self, cache, key, url, parse):
+        """Fetches and parses a URL into a cache"""
+        try:
+            res = parse(fetch_text(url, self.session, cached=False).expect())
+            cache[key] = res
+            self.cache.put(url, res)
+            return res
+        finally:
+            with self.lock:
+                self.pending.pop(url, None)
+
+    def fetch(self, cache, key, url, parse):
+        """
+        Gets a parsed page from the cache (or from the persistent cache),
+        waiting for it to be prefetched, or fetching it
+        """
+        if key in cache:
+            return cache[key]
+        res = self.cache.get(url)
+        if res is not None:
+            cache[key] = res
+            return res
+        with self.lock:
+            future = self.pending.get(url)
+        if future and not future.cancelled():
+            return future.result()
+        return self.download(cache, key, url, parse)
+
+    def prefetch(self, cache, key, url, parse):
+        """Schedules a page to be fetched in background (unless it is cached)"""
+        if key in cache:
+            return
+        with self.lock:
+            if url in self.pending:
+                return
+            res = self.cache.get(url)
+            if res is not None:
+                cache[key] = res
+                return
+            self.pending[url] = self.pool.submit(self.download, cache, key, url, parse)
+
+    def close(self):
+        """Cancels pending prefetches and closes the connections"""
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+        self.pool.shutdown(wait=True)
+        self.session.close()
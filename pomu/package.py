@@ -8,16 +8,12 @@ A package is supposed to know, where it came from.
 from os import path, walk, makedirs
 from shutil import copy2
 
-import subprocess
-
-from patch import PatchSet
-
 from pomu.util.fs import strip_prefix
 from pomu.util.misc import list_add
 from pomu.util.result import Result
 
 class Package():
-    def __init__(self, name, root, backend=None, category=None, version=None, slot='0', d_path=None, files=None, filemap=None, patches=[]):
+    def __init__(self, name, root, backend=None, category=None, version=None, slot='0', d_path=None, files=None, filemap=None, patches=None, dist=None):
         """
         Parameters:
             backend - specific source module object/class
@@ -28,6 +24,8 @@ class Package():
             files - a set of files to build a package from
             filemap - a mapping from destination files to files in the filesystem
             category, version, slot - self-descriptive
+            dist - a mapping from directories (relative to the root) to DIST
+                entries of their Manifests (see pomu.util.manifest.dist_entries)
         """
         self.backend = backend
         self.name = name
@@ -36,7 +34,8 @@ class Package():
         self.version = version
         self.slot = slot
         self.filemap = {}
-        self.patches = patches
+        self.patches = patches if patches is not None else []
+        self.dist = dist or {}
         if d_path is None and files is None and filemap is None:
             self.d_path = None
             self.read_path(self.root)
@@ -100,6 +99,7 @@ class Package():
 
     def apply_patches(self, revert=False):
         """Applies a sequence of patches at the root (after merging)"""
+        from patch import PatchSet
         ps = PatchSet()
         for p in self.patches:
             ps.parse(open(p, 'r'))
@@ -122,25 +122,10 @@ class Package():
             ps.apply(root=self.root)
         return Result.Ok()
 
-    def gen_manifests(self, dst):
-        """
-        Generate manifests for the installed package (in the dst directory).
-        TODO: use portage APIs instead of calling repoman.
-        """
-        dirs = [wd for wd, f in self.files if f.endswith('.ebuild')]
-        dirs = list(set(dirs))
-        res = []
-        for d_ in dirs:
-            d = path.join(dst, d_)
-            ret = subprocess.run(['repoman', 'manifest'],
-                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                    cwd=d)
-            if ret.returncode != 0:
-                return Result.Err('Failed to generate manifest at ' + d)
-            if path.exists(path.join(d, 'Manifest')):
-                res.append(path.join(d, 'Manifest'))
-        return Result.Ok(res)
-
+    @property
+    def manifest_dirs(self):
+        """Directories (relative to the root) containing ebuilds"""
+        return sorted(set(wd for wd, f in self.files if f.endswith('.ebuild')))
 
     def __str__(self):
         s = ''
@@ -160,4 +145,4 @@ class PatchList():
         self.name = name
         self.version = version
         self.slot = slot
-        self.patches = patches
+        self.patches = patches if patches is not None else []
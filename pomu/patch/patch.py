@@ -6,6 +6,7 @@ from time import time
 
 from git.repo import Repo
 
+from pomu.util.git import IndexUpdate
 from pomu.util.pkg import cpv_split
 from pomu.util.result import Result
 
@@ -19,6 +20,7 @@ def process_changes(_repo, single):
     paths = {x: [] for x in all_pkgs}
     multi = not single
     chanpaks = ([],[],[]) # import, order, apply
+    index = IndexUpdate(repo) # written once per commit
 
     ## Process user-made changes to package files
     for f in new_files: # process untracked files
@@ -33,20 +35,18 @@ def process_changes(_repo, single):
             res[pkpref].append('\n'.join(diff_header(diff.a_path, diff.b_path)) +
                     diff.diff.decode('utf-8'))
     res = {x: res[x] for x in res if res[x]}
-    paths = {x: paths[x] for x in paths if res[x]}
+    paths = {x: paths[x] for x in paths if x in res}
     for _pkg, diffs in res.items(): # add each change as its own patch
         cat, name, _ = cpv_split(_pkg)
         patch_contents = '\n'.join(diffs)
         pkg = _repo.get_package(name, cat).expect()
         patch_name = '{}-user_changes.patch'.format(int(time()))
-        had_order = path.exists(path.join(pkg.pkgdir, 'patches', 'PATCH_ORDER'))
         pkg.add_patch(patch_contents, patch_name)
-        repo.index.add([p for ps in paths for p in paths[ps]])
-        repo.index.add([path.join(pkg.pkgdir, 'patches', patch_name)])
-        if not had_order:
-            repo.index.add([path.join(pkg.pkgdir, 'PATCH_ORDER')])
+        index.add(paths[_pkg])
+        index.add([path.join(pkg.pkgdir, 'patches', patch_name),
+            path.join(pkg.pkgdir, 'PATCH_ORDER')])
         if multi:
-            repo.index.commit('{}/{}: imported user changes'.format(cat, name))
+            index.commit('{}/{}: imported user changes'.format(cat, name))
         else:
             chanpaks[0].append('{}/{}'.format(cat, name))
 
@@ -62,17 +62,17 @@ def process_changes(_repo, single):
         if '/'.join([cat, name]) not in res:
             continue
         orig = repo.odb.stream(diff.a_blob.binsha).read().decode('utf-8')
-        pkg = _repo.get_package(name, cat)
+        pkg = _repo.get_package(name, cat).expect()
         orig_lines = [path.join(pkg.pkgdir, x.strip()) for x in orig.split('\n') if x.strip() != '']
         pkg.patches = orig_lines
         pkg.apply_patches(revert=True)
-        pkg = _repo.get_package(name, cat)
+        pkg = _repo.get_package(name, cat).expect()
         pkg.patches = pkg.patch_list
         applied['{}/{}'.format(cat, name)].extend(pkg.patches)
         pkg.apply_patches()
-        repo.index.add([diff.a_path, pkg.root])
+        index.add([diff.a_path, path.join(cat, name)])
         if multi:
-            repo.index.commit('{}/{}: modified patch order'.format(cat, name))
+            index.commit('{}/{}: modified patch order'.format(cat, name))
         else:
             chanpaks[1].append('{}/{}'.format(cat, name))
 
@@ -83,19 +83,18 @@ def process_changes(_repo, single):
         if not f.startswith('metadata/') or f.split('/')[-1] == 'PATCH_ORDER':
             continue
         pkpref = '/'.join(path.dirname(f).split('/')[2:4])
-        if f.split('/')[-1] in applied[pkpref]: #skip, we've added the patch in the previous step
+        if pkpref not in res or f.split('/')[-1] in applied[pkpref]: #skip, we've added the patch in the previous step
             continue
-        if pkpref in res:
-            res[pkpref].append(f)
+        res[pkpref].append(f)
+    res = {x: res[x] for x in res if res[x]}
     for _pkg, diffs in res.items(): # apply each newly added patch
         cat, name, _ = cpv_split(_pkg)
         pkg = _repo.get_package(name, cat).expect()
         for d in diffs:
             pkg.patch(d)
-        repo.index.add(diffs)
-        repo.index.add([path.join(cat, name)])
+        index.add(diffs + [path.join(cat, name)])
         if multi:
-            repo.index.commit('{}/{}: applied patches'.format(cat, name))
+            index.commit('{}/{}: applied patches'.format(cat, name))
         else:
             chanpaks[2].append('{}/{}'.format(cat, name))
 
@@ -107,6 +106,8 @@ def process_changes(_repo, single):
             msg += '\nmodified patch order:\n' + '\n'.join(chanpaks[1]) + '\n'
         if chanpaks[2]:
             msg += '\napplied patches:\n' + '\n'.join(chanpaks[2]) + '\n'
+        if any(chanpaks):
+            index.commit(msg)
 
     return Result.Ok()
 
@@ -0,0 +1,110 @@
+"""
+Portage repository configuration.
+Parses repos.conf directly (instead of initializing the whole portage
+configuration) and memoizes the repository name -> location mapping,
+until any of the configuration files changes. The files are checked
+for changes at most once in a while (or after an invalidation), as the
+locations get looked up in loops.
+Falls back to portage, if there is no repos.conf to read.
+"""
+from configparser import ConfigParser, Error
+from os import environ, listdir, path, stat
+from time import monotonic
+
+GLOBAL_REPOS_CONF = '/usr/share/portage/config/repos.conf'
+
+def config_root():
+    """The portage configuration root ($PORTAGE_CONFIGROOT)"""
+    return environ.get('PORTAGE_CONFIGROOT', '/')
+
+def repos_conf_path():
+    """Path to the user repos.conf (a file, or a directory)"""
+    return path.join(config_root(), 'etc', 'portage', 'repos.conf')
+
+def _conf_files(fpath):
+    """Lists configuration files at a path (recursing into directories)"""
+    if path.isdir(fpath):
+        res = []
+        for f in sorted(listdir(fpath)):
+            if f.startswith('.') or f.endswith('~'):
+                continue
+            res.extend(_conf_files(path.join(fpath, f)))
+        return res
+    return [fpath] if path.isfile(fpath) else []
+
+def _stamp(files, user_conf):
+    res = [user_conf]
+    for f in files + [user_conf]:
+        try:
+            res.append((f, stat(f).st_mtime_ns))
+        except OSError:
+            pass
+    return tuple(res)
+
+def _parse(files):
+    """Parses repos.conf files into an ordered list of (name, location)"""
+    cp = ConfigParser(interpolation=None, strict=False)
+    try:
+        cp.read(files)
+    except Error:
+        return None
+    main_repo = cp.defaults().get('main-repo')
+    repos = []
+    for name in cp.sections():
+        location = cp.get(name, 'location', fallback=None)
+        if not location or not path.isdir(location):
+            continue
+        priority = cp.get(name, 'priority', fallback=None)
+        try:
+            priority = int(priority) if priority is not None else None
+        except ValueError:
+            priority = None
+        if priority is None:
+            priority = -1000 if name == main_repo else 0
+        repos.append((priority, name, location.rstrip('/') or '/'))
+    return [(name, location) for _, name, location in sorted(repos)]
+
+def _from_portage():
+    import portage
+    rsets = portage.db[portage.root]['vartree'].settings.repositories
+    return [(x, rsets.prepos[x].location) for x in rsets.prepos_order]
+
+class _RepoConfig():
+    def __init__(self, ttl=60):
+        """
+        Parameters:
+            ttl - time (in seconds) for the configuration files not to be
+                checked for changes for
+        """
+        self.ttl = ttl
+        self.stamp = None
+        self.checked = None # (time of the last check, user repos.conf path)
+        self.repos = []
+
+    def repositories(self):
+        """Lists (name, location) of the configured repositories, by priority"""
+        user_conf = repos_conf_path()
+        if (self.stamp is not None and self.checked[1] == user_conf
+                and monotonic() < self.checked[0] + self.ttl):
+            return self.repos
+        user_files = _conf_files(user_conf)
+        files = _conf_files(GLOBAL_REPOS_CONF) + user_files
+        stamp = _stamp(files, user_conf)
+        if stamp != self.stamp:
+            repos = _parse(files) if user_files else None
+            self.repos = repos if repos is not None else _from_portage()
+            self.locations = dict(self.repos)
+            self.stamp = stamp
+        self.checked = (monotonic(), user_conf)
+        return self.repos
+
+    def location(self, repo):
+        """Gets the location of a repository (or None)"""
+        self.repositories()
+        return self.locations.get(repo)
+
+    def invalidate(self):
+        """Forgets the memoized configuration (it is reread on the next use)"""
+        self.stamp = None
+
+repo_config = _RepoConfig()
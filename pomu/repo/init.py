@@ -3,8 +3,8 @@ from shutil import rmtree
 
 from git import Repo
 from os import path, makedirs
-import portage
 
+from pomu.repo.config import repo_config, repos_conf_path
 from pomu.util.result import Result, ResultException
 
 def init_plain_repo(create, repo_path):
@@ -46,9 +46,8 @@ def init_portage_repo(create, repo, repo_dir):
     """
     if not repo:
         return Result.Err('repository name required')
-    rsets = portage.db[portage.root]['vartree'].settings.repositories
     if create:
-        if repo in rsets.prepos_order:
+        if repo_config.location(repo):
             return Result.Err('a repository with such name already exists!')
         repo_path = path.join(repo_dir, repo)
         try:
@@ -56,9 +55,14 @@ def init_portage_repo(create, repo, repo_dir):
         except PermissionError:
             return Result.Err('you do not have enough permissions to create the git repository')
         try:
-            with open(path.join(portage.root, 'etc/portage/repos.conf', 'pomu.conf'), 'a') as f:
+            conf = repos_conf_path()
+            if not path.isfile(conf): # repos.conf may be a file, or a directory
+                makedirs(conf, exist_ok=True)
+                conf = path.join(conf, 'pomu.conf')
+            with open(conf, 'a') as f:
                 f.write('[' + repo + ']' + '\n')
                 f.write('location = ' + repo_path + '\n')
+            repo_config.invalidate()
         except PermissionError:
             rmtree(repo_path)
             return Result.Err('you do not have enough permissions to setup a portage repo')
@@ -69,9 +73,9 @@ def init_portage_repo(create, repo, repo_dir):
             rmtree(repo_path)
             return Result.Err(str(e))
     else:
-        if repo not in rsets.prepos_order:
+        if not repo_config.location(repo):
             return Result.Err('repository not found')
-        return init_pomu(rsets.prepos[repo], repo)
+        return init_pomu(repo_config.location(repo), repo)
 
 def init_new(repo_path, name=''):
     """
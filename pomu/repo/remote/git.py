@@ -1,23 +1,70 @@
-"""A class for remote git repos"""
+"""
+A class for remote git repos.
+Remotes are cloned partially (only the tip commit), and the trees and
+blobs are fetched on demand, and only along the paths being accessed,
+so importing a package transfers just its directory, and the trees
+leading to it. If the server does not support partial clones, the clone
+is complete, and nothing is fetched afterwards.
+Clones are kept in the mirror cache, and updated (only the new tip commit
+gets fetched) when the remote is used again.
+"""
 from os import path
 from shutil import rmtree
-from subprocess import call
+from subprocess import call, DEVNULL
 from tempfile import mkdtemp
 
-from git import Repo
-
 from pomu.repo.remote.remote import RemoteRepo, normalize_key
-from pomu.util.git import parse_object
+from pomu.util.git import head_rev, parse_tree_entries
+from pomu.util.mirror import mirror_cache
+from pomu.util.pack import ObjectStore, PackError
+from pomu.util.portage import misc_dirs
+from pomu.util.remote import RemoteTree, filelist_to_cpvs
 from pomu.util.result import Result
 
 class RemoteGitRepo(RemoteRepo):
     """A class responsible for git remotes"""
-    def __init__(self, url):
+    def __init__(self, url, partial=True, cache=mirror_cache):
+        """
+        Parameters:
+            url - URL of the remote
+            partial - whether to fetch trees and blobs on demand
+            cache - a MirrorCache to keep the clone in (None for a temporary clone)
+        """
         self.uri = url
-        self.dir = mkdtemp()
-        if call(['git', 'clone', '--depth=1', '--bare', url, self.dir]) > 0: # we've a problem
-            raise RuntimeError()
-        self.repo = Repo(self.dir)
+        self.partial = partial
+        self.mirror = None
+        if cache:
+            res = cache.open('git', url, self.clone, self.update)
+            if res.is_err(): # we've a problem
+                raise RuntimeError(res.err())
+            self.mirror = res.ok()
+            self.dir = self.mirror.dir
+        else:
+            self.dir = mkdtemp()
+            if not self.clone(self.dir): # we've a problem
+                raise RuntimeError()
+        self.objects = ObjectStore(path.join(self.dir, 'objects'))
+        self.trees = {} # tree id -> [(is_dir, sha, name)]
+        self._tree = None
+
+    def filter_args(self):
+        return ['--filter=tree:0'] if self.partial else []
+
+    def clone(self, directory):
+        """Clones the remote into a directory"""
+        return call(['git', 'clone', '--quiet', '--depth=1', '--bare'] +
+                self.filter_args() + [self.uri, directory]) == 0
+
+    def update(self, directory):
+        """Fetches the new tip commit into an existing clone"""
+        try:
+            with open(path.join(directory, 'HEAD'), 'r') as f:
+                head = f.readline().strip()
+        except OSError:
+            return False
+        ref = head[5:] if head.startswith('ref: ') else 'HEAD'
+        return call(['git', '-C', directory, 'fetch', '--quiet', '--no-tags',
+            '--depth=1'] + self.filter_args() + ['origin', '+HEAD:' + ref]) == 0
 
     def __enter__(self):
         pass
@@ -25,48 +72,149 @@ class RemoteGitRepo(RemoteRepo):
     def __exit__(self, *_):
         self.cleanup()
 
+    def fetch_objects(self, oids):
+        """Fetches objects missing from the (partial) clone, in a single request"""
+        missing = [x for x in oids if x not in self.objects]
+        if not missing:
+            return
+        call(['git', '-C', self.dir, '-c', 'fetch.negotiationAlgorithm=noop',
+            'fetch', '--quiet', '--no-tags', '--no-write-fetch-head',
+            '--filter=tree:0', 'origin'] + missing, stdout=DEVNULL)
+        self.objects.invalidate()
+
     def get_object(self, oid):
-        head, tail = oid[0:2], oid[2:]
-        opath = path.join(self.dir, 'objects', head, tail)
-        return open(opath, 'rb').read()
-
-    def _fetch_tree(self, obj, tpath):
-        res = []
-        ents = parse_object(self.get_object(obj), tpath).unwrap()
-        for is_dir, sha, opath in ents:
-            res.append((opath.decode('utf-8') + ('/' if is_dir else ''), sha))
-            if is_dir:
-                res.extend(self._fetch_tree(sha, opath))
+        """Reads (type, data) of an object (loose, or packed)"""
+        self.fetch_objects([oid])
+        return self.objects.read(oid)
+
+    def get_typed(self, oid, typ):
+        """Reads data of an object of the specified type"""
+        try:
+            otype, data = self.get_object(oid)
+        except (KeyError, PackError, ValueError) as err:
+            return Result.Err('Could not read object {}: {}'.format(oid, err))
+        if otype != typ:
+            return Result.Err('Object {} is a {}, not a {}'.format(oid, otype, typ))
+        return Result.Ok(data)
+
+    def revision(self):
+        return head_rev(self.dir, bare=True)
+
+    def root_tree(self):
+        """Gets the id of the tree of HEAD"""
+        rev = head_rev(self.dir, bare=True)
+        if not rev:
+            return Result.Err('Could not resolve HEAD')
+        commit = self.get_typed(rev, 'commit')
+        if commit.is_err():
+            return commit
+        line = commit.ok().split(b'\n', 1)[0]
+        if not line.startswith(b'tree '):
+            return Result.Err('Invalid commit ' + rev)
+        return Result.Ok(line[5:].decode('ascii'))
+
+    def tree_entries(self, oid):
+        """Lists (is_dir, sha, name) entries of a tree object"""
+        if oid not in self.trees:
+            data = self.get_typed(oid, 'tree').unwrap()
+            self.trees[oid] = [(is_dir, sha, name.lstrip(b'/').decode('utf-8'))
+                    for is_dir, sha, name in parse_tree_entries(data).unwrap()]
+        return self.trees[oid]
+
+    def lookup(self, key):
+        """Resolves a path to (is_dir, sha) of its object, or None"""
+        if self._tree is not None: # the whole tree is indexed
+            for k in (key.rstrip('/'), key.rstrip('/') + '/'):
+                if k in self._tree:
+                    return (k.endswith('/'), self._tree.oid(k))
+            return None
+        cur = (True, self.root_tree().unwrap())
+        for comp in [x for x in key.split('/') if x]:
+            if not cur[0]:
+                return None
+            cur = next(((d, s) for d, s, n in self.tree_entries(cur[1]) if n == comp), None)
+            if not cur:
+                return None
+        return cur
+
+    def walk(self, oid, prefix):
+        """
+        Lists (path, object id) of all the paths under a tree (directories
+        ending with a slash), fetching the missing trees of each level
+        in a single request
+        """
+        res, level = [], [(oid, prefix)]
+        while level:
+            self.fetch_objects([x for x, _ in level if x not in self.trees])
+            nxt = []
+            for tid, tpath in level:
+                for is_dir, sha, name in self.tree_entries(tid):
+                    res.append((tpath + name + ('/' if is_dir else ''), sha))
+                    if is_dir:
+                        nxt.append((sha, tpath + name + '/'))
+            level = nxt
         return res
 
     def fetch_tree(self):
         """Returns repos hierarchy"""
-        if hasattr(self, '_tree'):
-            return [x for x, y in self._tree]
-        tid = self.repo.tree().hexsha
-        res = self._fetch_tree(tid, b'')
-        self._tree = res
-        return [x for x, y in res]
+        if self._tree is None:
+            self._tree = RemoteTree(self.walk(self.root_tree().unwrap(), '/'))
+        return self._tree.paths
 
     def fetch_subtree(self, key):
         """Lists a subtree"""
+        if self._tree is not None:
+            return super().fetch_subtree(key)
         k = normalize_key(key, True)
-        self.fetch_tree()
-        dic = dict(self._tree)
-        if k not in dic:
+        obj = self.lookup(k)
+        if not obj or not obj[0]:
             return Result.Err()
-        l = len(key)
-        return Result.Ok(
-                [tpath[l:] for tpath in self.fetch_tree() if tpath.startswith(k)])
+        return Result.Ok([''] + sorted(x[len(k):] for x, _ in self.walk(obj[1], k)))
 
     def fetch_file(self, key):
         """Fetches a file from the repo"""
-        k = normalize_key(key)
-        self.fetch_tree()
-        dic = dict(self._tree)
-        if k not in dic:
+        obj = self.lookup(normalize_key(key))
+        if not obj or obj[0]:
             return Result.Err()
-        return parse_object(self.get_object(dic[k]))
+        return self.get_typed(obj[1], 'blob')
+
+    def fetch_files(self, keys):
+        """Fetches several files from the repo, with their blobs fetched in a single request"""
+        objs = {}
+        for key in keys:
+            obj = self.lookup(normalize_key(key))
+            if not obj or obj[0]:
+                return Result.Err('Could not fetch ' + key)
+            objs[key] = obj[1]
+        self.fetch_objects(list(objs.values()))
+        res = {}
+        for key, oid in objs.items():
+            blob = self.get_typed(oid, 'blob')
+            if blob.is_err():
+                return blob
+            res[key] = blob.ok()
+        return Result.Ok(res)
+
+    def find_cpvs(self, name, category=None):
+        """
+        Lists cpvs of a package, only looking into the package directories
+        (and, if the category is not known, the category directories)
+        """
+        root = self.root_tree().unwrap()
+        if category:
+            cats = [(category, self.lookup('/' + category))]
+            cats = [(c, x[1]) for c, x in cats if x and x[0]]
+        else:
+            cats = [(n, s) for d, s, n in self.tree_entries(root) if d and n not in misc_dirs]
+        self.fetch_objects([s for _, s in cats])
+        pkgs = [(c, s) for c, cs in cats for d, s, n in self.tree_entries(cs) if d and n == name]
+        self.fetch_objects([s for _, s in pkgs])
+        return filelist_to_cpvs(['/{}/{}/{}'.format(c, name, n)
+            for c, s in pkgs for d, _, n in self.tree_entries(s) if not d])
 
     def cleanup(self):
-        rmtree(self.dir)
+        self.objects.close()
+        if self.mirror:
+            self.mirror.release()
+        else:
+            rmtree(self.dir)
@@ -1,20 +1,45 @@
-"""A class for remote hg repos"""
-from os import chdir
+"""
+A class for remote hg repos.
+Clones are kept in the mirror cache, and pulled when the remote is used again.
+"""
+from os import path
 from shutil import rmtree
-from subprocess import call, run
+from subprocess import call, run, PIPE
 from tempfile import mkdtemp
 
 from pomu.repo.remote.remote import RemoteRepo, normalize_key
+from pomu.util.mirror import mirror_cache
+from pomu.util.remote import RemoteTree
 from pomu.util.result import Result
 
 class RemoteHgRepo(RemoteRepo):
     """A class responsible for hg remotes"""
-    def __init__(self, url):
+    def __init__(self, url, cache=mirror_cache):
+        """
+        Parameters:
+            url - URL of the remote
+            cache - a MirrorCache to keep the clone in (None for a temporary clone)
+        """
         self.uri = url
-        self.dir = mkdtemp()
-        chdir(self.dir)
-        if call('hg', 'clone', '-U', url, '.') > 0: # we've a problem
-            raise RuntimeError()
+        self.mirror = None
+        if cache:
+            res = cache.open('hg', url, self.clone, self.update)
+            if res.is_err(): # we've a problem
+                raise RuntimeError(res.err())
+            self.mirror = res.ok()
+            self.dir = self.mirror.dir
+        else:
+            self.dir = mkdtemp()
+            if not self.clone(self.dir): # we've a problem
+                raise RuntimeError()
+
+    def clone(self, directory):
+        """Clones the remote into a directory"""
+        return call(['hg', 'clone', '-q', '-U', self.uri, directory]) == 0
+
+    def update(self, directory):
+        """Pulls new changesets into an existing clone"""
+        return call(['hg', 'pull', '-q', '-R', directory]) == 0
 
     def __enter__(self):
         pass
@@ -22,38 +47,59 @@ class RemoteHgRepo(RemoteRepo):
     def __exit__(self, *_):
         self.cleanup()
 
+    def revision(self):
+        if getattr(self, '_rev', None) is None:
+            p = run(['hg', 'log', '-rdefault', '-T{node}'], cwd=self.dir,
+                    stdout=PIPE, universal_newlines=True)
+            self._rev = p.stdout.strip() if not p.returncode else None
+        return self._rev
+
     def fetch_tree(self):
         """Returns repos hierarchy"""
-        if hasattr(self, '_tree'):
-            return self._tree
-        p = run('hg', 'files', '-rdefault')
+        if getattr(self, '_tree', None) is not None:
+            return self._tree.paths
+        p = run(['hg', 'files', '-rdefault'], cwd=self.dir,
+                stdout=PIPE, universal_newlines=True)
         if p.returncode:
             return []
-        self._tree = ['/' + x for x in p.stdout.split('\n')]
-        return self._tree
-
-    def fetch_subtree(self, key):
-        """Lists a subtree"""
-        k = normalize_key(key, True)
-        self.fetch_tree()
-        dic = dict(self._tree)
-        if k not in dic:
-            return Result.Err()
-        l = len(key)
-        return Result.Ok(
-                [tpath[l:] for tpath in self.fetch_tree() if tpath.startswith(k)])
+        self._tree = RemoteTree('/' + x for x in p.stdout.split('\n') if x)
+        return self._tree.paths
 
     def fetch_file(self, key):
         """Fetches a file from the repo"""
         k = normalize_key(key)
-        self.fetch_tree()
-        dic = dict(self._tree)
-        if k not in dic:
+        if k not in self.tree():
             return Result.Err()
-        p = run('hg', 'cat', '-rdefault', k)
+        p = run(['hg', 'cat', '-rdefault', k.lstrip('/')], cwd=self.dir, stdout=PIPE)
         if p.returncode:
             return Result.Err()
         return Result.Ok(p.stdout)
 
+    def fetch_files(self, keys):
+        """Fetches several files from the repo, with a single hg cat"""
+        keys = list(keys)
+        ks = [normalize_key(key) for key in keys]
+        tree = self.tree()
+        if any(k not in tree for k in ks):
+            return Result.Err()
+        if not ks:
+            return Result.Ok({})
+        d = mkdtemp()
+        try:
+            p = run(['hg', 'cat', '-rdefault', '-o', path.join(d, '%p')] +
+                    [k.lstrip('/') for k in ks], cwd=self.dir)
+            if p.returncode:
+                return Result.Err()
+            res = {}
+            for key, k in zip(keys, ks):
+                with open(path.join(d, k.lstrip('/')), 'rb') as f:
+                    res[key] = f.read()
+            return Result.Ok(res)
+        finally:
+            rmtree(d)
+
     def cleanup(self):
-        rmtree(self.dir)
+        if self.mirror:
+            self.mirror.release()
+        else:
+            rmtree(self.dir)
@@ -1,9 +1,14 @@
 """A template class for remote repos"""
+from concurrent.futures import ThreadPoolExecutor
 from os import path
 from urllib.parse import urlparse
 
 from pomu.package import Package
-from pomu.util.remote import get_full_cpv, filelist_to_cpvs
+from pomu.util.remote import RemoteTree, get_full_cpv, filelist_to_cpvs
+from pomu.util.result import Result
+
+JOBS = 4
+listings = {} # (uri, revision) -> cpvs of the remote
 
 class RemoteRepo():
     """A class responsible for remotes"""
@@ -44,37 +49,87 @@ class RemoteRepo():
 
     def fetch_package(self, name, category=None, version=None):
         """Fetches a package, determined by the parametres"""
-        cat, n, ver = get_full_cpv(self.list_cpvs(), name, category, version).unwrap()
+        cat, n, ver = get_full_cpv(self.find_cpvs(name, category), name, category, version).unwrap()
         ebuild = '{}/{}/{}-{}.ebuild'.format(cat, n, n, ver)
         subdir = '/{}/{}'.format(cat, name)
-        filemap = {}
-        filemap[ebuild] = self.fetch_file(ebuild).unwrap()
+        keys = [ebuild]
         subtree = self.fetch_subtree('/{}/{}/'.format(cat, name)).unwrap()
         for fpath in subtree:
             if '/' in fpath:
                 parent, _, child = fpath.rpartition('/')
                 if parent != 'files': continue
             if not fpath or fpath.endswith('.ebuild') or fpath.endswith('/'): continue
-            p = path.join(subdir, fpath)
-            filemap[p] = self.fetch_file(p).unwrap()
+            keys.append(path.join(subdir, fpath))
+        filemap = self.fetch_files(keys).unwrap()
         return Package(name, '/', None, category, version, filemap=filemap)
 
+    def revision(self):
+        """Gets an identifier of the revision of the remote (or None, if unknown)"""
+        return None
+
     def list_cpvs(self):
-        """Gets a list of all ebuilds in the repo"""
-        return filelist_to_cpvs(self.fetch_tree())
+        """
+        Gets a list of all ebuilds in the repo
+        (cached per revision, so that remotes of the same revision share it)
+        """
+        rev = self.revision()
+        if rev is not None and (self.uri, rev) in listings:
+            return listings[(self.uri, rev)]
+        if getattr(self, '_cpvs', None) is None:
+            self._cpvs = filelist_to_cpvs(self.fetch_tree())
+        if rev is not None:
+            listings[(self.uri, rev)] = self._cpvs
+        return self._cpvs
+
+    def find_cpvs(self, name, category=None):
+        """
+        Gets a list of ebuilds of a package (it may include other ebuilds),
+        remotes may override it to avoid listing the whole repo
+        """
+        return self.list_cpvs()
 
     def fetch_tree(self):
-        """Returns repos hierarchy"""
+        """
+        Returns repos hierarchy (a sorted list of paths, directories
+        ending with a slash), indexing it into self._tree (a RemoteTree)
+        """
         raise NotImplementedError()
 
+    def tree(self):
+        """Gets the tree index of the remote (built once)"""
+        if getattr(self, '_tree', None) is None:
+            self.fetch_tree()
+        return getattr(self, '_tree', None) or RemoteTree([])
+
     def fetch_subtree(self, key):
         """Lists a subtree"""
-        raise NotImplementedError()
+        k = normalize_key(key, True)
+        tree = self.tree()
+        if k not in tree:
+            return Result.Err()
+        return Result.Ok(tree.subtree(k))
 
     def fetch_file(self, key):
         """Fetches a file from the repo"""
         raise NotImplementedError()
 
+    def fetch_files(self, keys):
+        """
+        Fetches several files from the repo
+        Remotes may override it to fetch them in a single request; by default,
+        the files are fetched concurrently, with a bounded number of workers
+        Returns a dict from keys to contents of the files
+        """
+        keys = list(keys)
+        if not keys:
+            return Result.Ok({})
+        with ThreadPoolExecutor(max_workers=min(JOBS, len(keys))) as pool:
+            res = list(pool.map(self.fetch_file, keys))
+        for key, r in zip(keys, res):
+            if r.is_err():
+                return Result.Err('Could not fetch ' + key)
+        return Result.Ok({key: r.ok() for key, r in zip(keys, res)})
+
 def normalize_key(key, trail=False):
     k = '/' + key.lstrip('/')
     if trail:
@@ -1,59 +1,131 @@
-"""A class for remote rsync repos"""
-from os import rmdir, mkfifo, unlink, path
-from subprocess import run
-from tempfile import mkdtemp
+"""
+A class for remote rsync repos.
+Files of the remotes are rsynced on demand; with the mirror cache,
+they are kept in a sparse mirror (seeded with just the requested files,
+which are rsynced again, transferring just the changes, when the remote
+is used again).
+"""
+import os
+from os import path
+from shutil import rmtree
+from subprocess import call, run, PIPE
+from tempfile import mkdtemp, mkstemp
 
 from pomu.repo.remote.remote import RemoteRepo, normalize_key
+from pomu.util.mirror import mirror_cache
+from pomu.util.remote import RemoteTree
 from pomu.util.result import Result
 
 class RemoteRsyncRepo(RemoteRepo):
     """A class responsible for rsync remotes"""
-    def __init__(self, url):
+    def __init__(self, url, cache=mirror_cache):
+        """
+        Parameters:
+            url - URL of the remote
+            cache - a MirrorCache to mirror the remote into (None to fetch files on demand)
+        """
         self.uri = url
+        self.mirror = None
+        if cache:
+            res = cache.open('rsync', url, self.create, self.sync)
+            if res.is_err():
+                raise RuntimeError(res.err())
+            self.mirror = res.ok()
 
     def __enter__(self):
         pass
 
     def __exit__(self, *_):
-        pass
+        self.cleanup()
+
+    def create(self, directory):
+        """Creates an empty mirror (it gets seeded by fetch_files)"""
+        os.makedirs(directory, exist_ok=True)
+        return True
+
+    def sync(self, directory):
+        """Updates the files, which are in a (sparse) mirror of the remote"""
+        ks = []
+        for root, _, files in os.walk(directory):
+            rel = path.relpath(root, directory)
+            ks.extend(x if rel == '.' else path.join(rel, x) for x in files)
+        # the files, which are gone from the remote, are not in its tree anyway
+        return not ks or self.rsync_files(ks, directory, '--ignore-missing-args')
+
+    def rsync_files(self, ks, directory, *args):
+        """Rsyncs several files of the remote into a directory (with --files-from)"""
+        fd, flist = mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(''.join(k.lstrip('/') + '\n' for k in ks))
+            return call(['rsync', '-lt', '--quiet', '--files-from=' + flist] + list(args)
+                    + [self.uri.rstrip('/') + '/', directory + '/']) == 0
+        finally:
+            os.remove(flist)
 
     def fetch_tree(self):
         """Returns repos hierarchy"""
-        if hasattr(self, '_tree'):
-            return self._tree
+        if getattr(self, '_tree', None) is not None:
+            return self._tree.paths
         d = mkdtemp()
-        p = run('rsync', '-rn', '--out-format="%n"', self.uri, d)
-        rmdir(d)
+        p = run(['rsync', '-rn', '--out-format=%n', self.uri.rstrip('/') + '/', d],
+                stdout=PIPE, universal_newlines=True)
+        rmtree(d)
         if p.returncode:
-            return Result.Err()
-        self._tree = ['/' + x for x in p.stdout.split('\n')]
-        return self._tree
-
-    def fetch_subtree(self, key):
-        """Lists a subtree"""
-        k = normalize_key(key, True)
-        self.fetch_tree()
-        dic = dict(self._tree)
-        if k not in dic:
             return []
-        l = len(key)
-        return Result.Ok(
-                [tpath[l:] for tpath in self.fetch_tree() if tpath.startswith(k)])
+        self._tree = RemoteTree('/' + x for x in p.stdout.split('\n') if x and x != './')
+        return self._tree.paths
 
     def fetch_file(self, key):
         """Fetches a file from the repo"""
         k = normalize_key(key)
-        self.fetch_tree()
-        dic = dict(self._tree)
-        if k not in dic:
+        if k not in self.tree():
             return Result.Err()
+        if self.mirror:
+            return self.fetch_files([key]).map(lambda x: x[key])
         d = mkdtemp()
-        fip = path.join(d, 'fifo')
-        mkfifo(fip)
-        p = run('rsync', self.uri.rstrip('/') + key, fip)
-        fout = fip.read()
-        unlink(fip)
-        rmdir(d)
-        if p.returncode:
+        try:
+            fpath = path.join(d, 'file')
+            p = run(['rsync', self.uri.rstrip('/') + k, fpath])
+            if p.returncode:
+                return Result.Err()
+            with open(fpath, 'rb') as f:
+                return Result.Ok(f.read())
+        finally:
+            rmtree(d)
+
+    def fetch_files(self, keys):
+        """Fetches several files from the repo, with a single rsync (--files-from)"""
+        keys = list(keys)
+        ks = [normalize_key(key) for key in keys]
+        tree = self.tree()
+        if any(k not in tree for k in ks):
             return Result.Err()
-        return Result.Ok(fout)
+        if not ks:
+            return Result.Ok({})
+        if self.mirror:
+            # seeds the mirror with the files, which it lacks yet
+            missing = [k for k in ks if not path.isfile(path.join(self.mirror.dir, k.lstrip('/')))]
+            if missing and not self.rsync_files(missing, self.mirror.dir):
+                return Result.Err()
+            res = {}
+            for key, k in zip(keys, ks):
+                with open(path.join(self.mirror.dir, k.lstrip('/')), 'rb') as f:
+                    res[key] = f.read()
+            return Result.Ok(res)
+        d = mkdtemp()
+        try:
+            out = path.join(d, 'out')
+            if not self.rsync_files(ks, out):
+                return Result.Err()
+            res = {}
+            for key, k in zip(keys, ks):
+                with open(path.join(out, k.lstrip('/')), 'rb') as f:
+                    res[key] = f.read()
+            return Result.Ok(res)
+        finally:
+            rmtree(d)
+
+    def cleanup(self):
+        if self.mirror:
+            self.mirror.release()
@@ -1,7 +1,8 @@
 """A class for remote svn repos"""
-from subprocess import run
+from subprocess import run, PIPE
 
 from pomu.repo.remote.remote import RemoteRepo, normalize_key
+from pomu.util.remote import RemoteTree
 from pomu.util.result import Result
 
 class RemoteSvnRepo(RemoteRepo):
@@ -17,33 +18,20 @@ class RemoteSvnRepo(RemoteRepo):
 
     def fetch_tree(self):
         """Returns repos hierarchy"""
-        if hasattr(self, '_tree'):
-            return self._tree
-        p = run('svn', 'ls', '-R', self.uri)
+        if getattr(self, '_tree', None) is not None:
+            return self._tree.paths
+        p = run(['svn', 'ls', '-R', self.uri], stdout=PIPE, universal_newlines=True)
         if p.returncode:
             return []
-        self._tree = p.stdout.split('\n')
-        return self._tree
-
-    def fetch_subtree(self, key):
-        """Lists a subtree"""
-        k = normalize_key(key, True)
-        self.fetch_tree()
-        dic = dict(self._tree)
-        if k not in dic:
-            return Result.Err()
-        l = len(key)
-        return Result.Ok(
-                [tpath[l:] for tpath in self.fetch_tree() if tpath.startswith(k)])
+        self._tree = RemoteTree('/' + x for x in p.stdout.split('\n') if x)
+        return self._tree.paths
 
     def fetch_file(self, key):
         """Fetches a file from the repo"""
         k = normalize_key(key)
-        self.fetch_tree()
-        dic = dict(self._tree)
-        if k not in dic:
+        if k not in self.tree():
             return Result.Err()
-        p = run('svn', 'cat', k)
+        p = run(['svn', 'cat', self.uri.rstrip('/') + k], stdout=PIPE)
         if p.returncode:
             return Result.Err()
         return Result.Ok(p.stdout)
@@ -1,15 +1,15 @@
 """Subroutines with repositories"""
 
-from os import path, rmdir, makedirs
-from shutil import copy2
-
-from git import Repo
-from patch import PatchSet
-import portage
+from os import path, remove, rmdir, makedirs
+from shutil import copy2, rmtree
 
 from pomu.package import Package, PatchList
+from pomu.repo.config import repo_config
+from pomu.repo.world import WorldIndex, meta_dir
 from pomu.util.cache import cached
-from pomu.util.fs import remove_file, strip_prefix
+from pomu.util.fs import strip_prefix
+from pomu.util.git import IndexUpdate
+from pomu.util.manifest import gen_manifests, layout_conf
 from pomu.util.result import Result
 
 class Repository():
@@ -26,42 +26,122 @@ class Repository():
 
     @property
     def repo(self):
+        from git import Repo
         return Repo(self.root)
 
     @property
     def pomu_dir(self):
         return path.join(self.root, 'metadata/pomu')
 
-    def merge(self, mergeable):
-        """Merges a package or a patchset into the repository"""
+    @property
+    def world(self):
+        """The index of merged packages (see pomu.repo.world)"""
+        if not hasattr(self, '_world'):
+            self._world = WorldIndex(self.pomu_dir,
+                    path.join(self.root, '.git', 'pomu', 'world.idx'), self.root)
+        return self._world
+
+    def merge(self, mergeable, jobs=None):
+        """
+        Merges a package, a list of packages or a patchset into the repository
+        Parameters:
+            mergeable - the object to merge
+            jobs - number of workers for manifest generation
+        """
         if isinstance(mergeable, Package):
-            return self.merge_pkg(mergeable)
+            return self.merge_pkg(mergeable, jobs)
+        elif isinstance(mergeable, list):
+            return self.merge_pkgs(mergeable, jobs)
         elif isinstance(mergeable, PatchList):
             pkg = self.get_package(mergeable.name, mergeable.category,
                     mergeable.slot).unwrap()
             return pkg.patch(mergeable.patches)
         return Result.Err() #unreachable yet
 
-    def merge_pkg(self, package):
+    def merge_pkg(self, package, jobs=None):
         """Merge a package (a pomu.package.Package package) into the repository"""
-        r = self.repo
-        pkgdir = path.join(self.pomu_dir, package.category, package.name)
-        if package.slot != '0':
-            pkgdir = path.join(pkgdir, package.slot)
-        package.merge_into(self.root).expect('Failed to merge package')
-        for wd, f in package.files:
-            r.index.add([path.join(wd, f)])
-        manifests = package.gen_manifests(self.root).expect()
-        for m in manifests:
-            r.index.add([m])
+        return self.merge_pkgs([package], jobs)
+
+    def merge_pkgs(self, packages, jobs=None):
+        """
+        Merge a list of packages into the repository, in a single commit
+        Parameters:
+            packages - a list of pomu.package.Package objects
+            jobs - number of workers for manifest generation
+        """
+        if not packages:
+            return Result.Err('No packages to merge')
+        try:
+            return self._merge_pkgs(packages, jobs)
+        except Exception as e:
+            # leave neither a partial merge, nor a half-updated index behind
+            self._rollback(self._touched_paths(packages))
+            return Result.Err('Failed to merge packages: {}'.format(e))
+
+    def _merge_pkgs(self, packages, jobs):
+        for package in packages:
+            package.merge_into(self.root).expect('Failed to merge package')
+        # generate manifests of all the packages in one go
+        dirs = sorted(set(d for package in packages for d in package.manifest_dirs))
+        hashes, thin = layout_conf(self.root)
+        dist = {path.join(self.root, d): entries
+                for package in packages for d, entries in package.dist.items()}
+        manifests = gen_manifests([path.join(self.root, d) for d in dirs],
+                hashes, thin, jobs, dist).expect()
+        manifests = dict(zip(dirs, manifests))
+        index = IndexUpdate(self.repo)
+        for package in packages:
+            index.add(self._stage_pkg(package,
+                [manifests[d] for d in package.manifest_dirs if manifests[d]]))
+        self.world.save()
+        index.add([path.join(self.pomu_dir, 'world')])
+        if len(packages) == 1:
+            index.commit('Merged package ' + packages[0].name)
+            self.world.save() # bind the index to the new commit
+            return Result.Ok('Merged package ' + packages[0].name + ' successfully')
+        index.commit('Merged {} packages\n\n'.format(len(packages)) +
+                '\n'.join(str(x) for x in packages))
+        self.world.save()
+        return Result.Ok('Merged {} packages successfully'.format(len(packages)))
+
+    def _touched_paths(self, packages):
+        """Lists the paths a merge of packages may write to"""
+        res = [path.join(self.pomu_dir, 'world')]
+        for package in packages:
+            res.extend(path.join(self.root, wd, f) for wd, f in package.files)
+            res.extend(path.join(self.root, d, 'Manifest') for d in package.manifest_dirs)
+            res.append(meta_dir(self.pomu_dir, package.category, package.name, package.slot))
+        return res
+
+    def _rollback(self, paths):
+        """
+        Reverts paths (files or directories) to their state in HEAD,
+        both in the git index and on the disk, and reloads the world index
+        """
+        git = self.repo.git
+        rel = sorted(set(path.relpath(p, self.root) for p in paths))
+        git.reset('-q', 'HEAD', '--', *rel)
+        git.clean('-fdq', '--', *rel)
+        tracked = [x for x in git.ls_tree('-r', '--name-only', 'HEAD', '--', *rel).split('\n') if x]
+        if tracked:
+            git.checkout('HEAD', '--', *tracked)
+        self.world.reset()
+
+    def _stage_pkg(self, package, manifests):
+        """
+        Write metadata for a package, copied into the repository,
+        without touching the git index
+        Parameters:
+            package - the package object
+            manifests - list of its manifest files
+        Returns the list of paths to be added to the index
+        """
+        pkgdir = meta_dir(self.pomu_dir, package.category, package.name, package.slot)
         self.write_meta(pkgdir, package, manifests)
-        with open(path.join(self.pomu_dir, 'world'), 'a+') as f:
-            f.write('{}/{}'.format(package.category, package.name))
-            f.write('\n' if package.slot == '0' else ':{}\n'.format(package.slot))
-        r.index.add([path.join(self.pomu_dir, package.category, package.name)])
-        r.index.add([path.join(self.pomu_dir, 'world')])
-        r.index.commit('Merged package ' + package.name)
-        return Result.Ok('Merged package ' + package.name + ' successfully')
+        self.world.add(package.category, package.name, package.slot, package.version,
+                package.backend.__cname__ if package.backend else None, save=False)
+        return ([path.join(wd, f) for wd, f in package.files] + manifests +
+                [path.join(self.pomu_dir, package.category, package.name)])
 
     def write_meta(self, pkgdir, package, manifests):
         """
@@ -93,17 +173,22 @@ class Repository():
 
     def unmerge(self, package):
         """Remove a package (by contents) from the repository"""
-        r = self.repo
+        index = IndexUpdate(self.repo)
         for wd, f in package.files:
             dst = path.join(self.root, wd)
-            remove_file(r, path.join(dst, f))
+            index.remove([path.join(dst, f)])
+            remove(path.join(dst, f))
             try:
                 rmdir(dst)
             except OSError: pass
-        pf = path.join(self.pomu_dir, package.name)
-        if path.isfile(pf):
-            remove_file(r, pf)
-        r.commit('Removed package ' + package.name + ' successfully')
+        pkgdir = meta_dir(self.pomu_dir, package.category, package.name, package.slot)
+        if path.isdir(pkgdir):
+            index.remove([pkgdir])
+            rmtree(pkgdir)
+        if self.world.remove(package.category, package.name, package.slot):
+            index.add([path.join(self.pomu_dir, 'world')])
+        index.commit('Removed package ' + package.name)
+        self.world.save()
         return Result.Ok('Removed package ' + package.name + ' successfully')
 
     def remove_package(self, name):
@@ -113,27 +198,21 @@ class Repository():
 
     def update_package(self, category, name, new):
         """Updates a package, replacing it by a newer version"""
-        pkg = self.get_package(category, name).expect()
+        pkg = self.get_package(name, category).expect()
         self.unmerge(pkg).expect()
         self.merge(new)
 
-    def _get_package(self, category, name, slot='0'):
-        """Get an existing package (by category, name and slot), reading the manifest"""
+    def _get_package(self, entry):
+        """Get an existing package (by its world index entry), reading the manifest"""
         from pomu.source import dispatcher
-        if slot == '0':
-            pkgdir = path.join(self.pomu_dir, category, name)
-        else:
-            pkgdir = path.join(self.pomu_dir, category, name, slot)
+        category, name, slot = entry.category, entry.name, entry.slot
+        pkgdir, version = entry.pkgdir, entry.version
         backend = None
-        if path.exists(path.join(pkgdir, 'BACKEND')):
-            with open(path.join(pkgdir, 'BACKEND'), 'r') as f:
-                bname = f.readline().strip()
-            backend = dispatcher.backends[bname].from_meta_dir(pkgdir)
+        if entry.backend:
+            backend = dispatcher.backend(entry.backend).from_meta_dir(pkgdir)
             if backend.is_err():
                 return backend
             backend = backend.ok()
-        with open(path.join(pkgdir, 'VERSION'), 'r') as f:
-            version = f.readline().strip()
         with open(path.join(pkgdir, 'FILES'), 'r') as f:
             files = [x.strip() for x in f]
         patches=[]
@@ -146,36 +225,24 @@ class Repository():
 
     def get_package(self, name, category=None, slot=None):
         """Get a package by name, category and slot"""
-        with open(path.join(self.pomu_dir, 'world'), 'r') as f:
-            for spec in f:
-                spec = spec.strip()
-                cat, _, nam = spec.partition('/')
-                nam, _, slo = nam.partition(':')
-                if (not category or category == cat) and nam == name:
-                    if not slot or (slot == '0' and not slo) or slot == slo:
-                        return self._get_package(category, name, slot or '0')
-        return Result.Err('Package not found')
+        entry = self.world.get(name, category, slot)
+        if not entry:
+            return Result.Err('Package not found')
+        return self._get_package(entry)
 
     def get_packages(self):
-        with open(path.join(self.pomu_dir, 'world'), 'r') as f:
-            lines = [x.strip() for x in f.readlines() if x.strip() != '']
-        return lines
+        """List specs (category/name[:slot]) of the merged packages"""
+        return self.world.specs()
 
 
 def portage_repos():
     """Yield the repositories configured for portage"""
-    rsets = portage.db[portage.root]['vartree'].settings.repositories
-
-    for repo in rsets.prepos_order:
+    for repo, _ in repo_config.repositories():
         yield repo
 
 def portage_repo_path(repo):
     """Get the path of a given portage repository (repo)"""
-    rsets = portage.db[portage.root]['vartree'].settings.repositories
-
-    if repo in rsets.prepos:
-        return rsets.prepos[repo].location
-    return None
+    return repo_config.location(repo)
 
 def pomu_status(repo_path):
     """Check if pomu is enabled for a repository at a given path (repo_path)"""
@@ -206,16 +273,14 @@ def pomu_active_repo(no_portage=None, repo_path=None):
 class MergedPackage(Package):
     @property
     def pkgdir(self):
-        ret = path.join(self.root, 'metadata', 'pomu', self.category, self.name)
-        if self.slot != '0':
-            ret = path.join(ret, self.slot)
-        return ret
+        return meta_dir(path.join(self.root, 'metadata', 'pomu'), self.category, self.name, self.slot)
 
     def patch(self, patch):
         if isinstance(patch, list):
             for x in patch:
                 self.patch(x)
             return Result.Ok()
+        from patch import PatchSet
         ps = PatchSet()
         ps.parse(open(patch, 'r'))
         ps.apply(root=self.root)
@@ -0,0 +1,208 @@
+"""
+An index over the world file of a pomu repository.
+
+The world file (metadata/pomu/world) lists the merged packages, one
+category/name[:slot] spec per line. The index maps (category, name, slot)
+to the metadata directory, version and backend of the package, and is
+persisted next to the git data of the repository, so lookups neither
+re-read the world file nor the metadata directories.
+The index stores the stat stamp of the world file it was built from,
+along with the HEAD commit of the repository (git operations may change
+the metadata directories without touching the world file), and gets
+rebuilt if either has changed behind its back.
+"""
+from collections import namedtuple
+from os import path, makedirs, replace, stat
+
+from pomu.util.git import head_rev
+
+class WorldEntry(namedtuple('WorldEntry', 'category name slot pkgdir version backend')):
+    """An entry of the world index"""
+    __slots__ = ()
+
+    @property
+    def spec(self):
+        """The world file spec of the entry (category/name[:slot])"""
+        spec = '{}/{}'.format(self.category, self.name)
+        return spec if self.slot == '0' else spec + ':' + self.slot
+
+def parse_spec(spec):
+    """Splits a world spec into category, name and slot"""
+    category, _, name = spec.strip().partition('/')
+    name, _, slot = name.partition(':')
+    return category, name, slot or '0'
+
+def meta_dir(pomu_dir, category, name, slot='0'):
+    """Path to the metadata directory of a package"""
+    if slot == '0':
+        return path.join(pomu_dir, category, name)
+    return path.join(pomu_dir, category, name, slot)
+
+def _read_line(fpath):
+    try:
+        with open(fpath, 'r') as f:
+            return f.readline().strip()
+    except OSError:
+        return ''
+
+class WorldIndex():
+    """A persistent index of the packages merged into a repository"""
+    def __init__(self, pomu_dir, index_file, repo_dir=None):
+        """
+        Parameters:
+            pomu_dir - the pomu metadata directory (with the world file)
+            index_file - path to the persistent index
+            repo_dir - the git repository, whose HEAD the index is bound to
+        """
+        self.pomu_dir = pomu_dir
+        self.repo_dir = repo_dir
+        self.world_file = path.join(pomu_dir, 'world')
+        self.index_file = index_file
+        self.entries = {}
+        self.names = {}
+        self.stamp = None
+        self.dirty = False
+        self.load()
+
+    def _world_stamp(self):
+        head = (head_rev(self.repo_dir) if self.repo_dir else None) or '-'
+        try:
+            st = stat(self.world_file)
+        except OSError:
+            return '0 0 ' + head
+        return '{} {} {}'.format(st.st_mtime_ns, st.st_size, head)
+
+    def _insert(self, entry):
+        key = (entry.category, entry.name, entry.slot)
+        self.entries[key] = entry
+        self.names.setdefault(entry.name, []).append(key)
+
+    def _clear(self):
+        self.entries = {}
+        self.names = {}
+
+    def load(self):
+        """Loads the persistent index, rebuilding it if it is stale"""
+        if self.dirty or (self.stamp is not None and self.stamp == self._world_stamp()):
+            return
+        self._clear()
+        try:
+            with open(self.index_file, 'r') as f:
+                stamp = f.readline().strip()
+                if stamp == self._world_stamp():
+                    for line in f:
+                        category, name, slot, version, backend = line.rstrip('\n').split('\t')
+                        self._insert(WorldEntry(category, name, slot,
+                            meta_dir(self.pomu_dir, category, name, slot),
+                            version, backend or None))
+                    self.stamp = stamp
+                    return
+        except (OSError, ValueError):
+            self._clear()
+        self.rebuild()
+
+    def reset(self):
+        """Drops the unsaved changes, reloading the index"""
+        self.dirty = False
+        self.stamp = None
+        self.load()
+
+    def rebuild(self):
+        """Rebuilds the index from the world file and the metadata directories"""
+        self._clear()
+        try:
+            with open(self.world_file, 'r') as f:
+                specs = [x.strip() for x in f if x.strip()]
+        except OSError:
+            specs = []
+        for spec in specs:
+            category, name, slot = parse_spec(spec)
+            if (category, name, slot) in self.entries:
+                continue
+            pkgdir = meta_dir(self.pomu_dir, category, name, slot)
+            self._insert(WorldEntry(category, name, slot, pkgdir,
+                _read_line(path.join(pkgdir, 'VERSION')),
+                _read_line(path.join(pkgdir, 'BACKEND')) or None))
+        self.save()
+
+    def save(self):
+        """Writes the index to the disk (atomically)"""
+        self.stamp = self._world_stamp()
+        self.dirty = False
+        try:
+            makedirs(path.dirname(self.index_file), exist_ok=True)
+            tmp = self.index_file + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(self.stamp + '\n')
+                for e in self.entries.values():
+                    f.write('\t'.join([e.category, e.name, e.slot,
+                        e.version or '', e.backend or '']) + '\n')
+            replace(tmp, self.index_file)
+        except OSError: # the index is just a cache
+            pass
+
+    def _write_world(self):
+        with open(self.world_file, 'w') as f:
+            for e in self.entries.values():
+                f.write(e.spec + '\n')
+
+    def get(self, name, category=None, slot=None):
+        """Looks up a package by name, and (optionally) category and slot"""
+        self.load()
+        if category and slot:
+            return self.entries.get((category, name, slot))
+        for key in self.names.get(name, []):
+            if (not category or key[0] == category) and (not slot or key[2] == slot):
+                return self.entries[key]
+        return None
+
+    def add(self, category, name, slot, version, backend=None, save=True):
+        """
+        Records a merged package (updating the world file)
+        Parameters:
+            save - whether to write the index immediately (batch merges
+                   may defer it and call save() once)
+        """
+        self.load()
+        key = (category, name, slot)
+        if key in self.entries:
+            self.entries[key] = self.entries[key]._replace(version=version, backend=backend)
+            self._write_world()
+        else:
+            entry = WorldEntry(category, name, slot,
+                    meta_dir(self.pomu_dir, category, name, slot), version, backend)
+            self._insert(entry)
+            with open(self.world_file, 'a+') as f:
+                f.write(entry.spec + '\n')
+        if save:
+            self.save()
+        else:
+            self.dirty = True
+        return self.entries[key]
+
+    def remove(self, category, name, slot='0'):
+        """Drops a package from the index (updating the world file)"""
+        self.load()
+        key = (category, name, slot)
+        if key not in self.entries:
+            return None
+        entry = self.entries.pop(key)
+        self.names[name].remove(key)
+        if not self.names[name]:
+            del self.names[name]
+        self._write_world()
+        self.save()
+        return entry
+
+    def specs(self):
+        """Lists specs of all the merged packages"""
+        self.load()
+        return [e.spec for e in self.entries.values()]
+
+    def __iter__(self):
+        self.load()
+        return iter(list(self.entries.values()))
+
+    def __len__(self):
+        self.load()
+        return len(self.entries)
@@ -1,3 +1,4 @@
+from bisect import bisect_right
 from enum import Enum
 from pydoc import pager
 
@@ -39,6 +40,14 @@ class PromptState(Enum):
     LIST=2
 
 class PSPrompt(Prompt):
+    """
+    A prompt to browse search results, and select ebuilds.
+    Rows (entries, and children of expanded entries) are mapped to entries
+    through a prefix-sum index of entry lengths (offsets), which is updated
+    when an entry gets toggled. The viewport only scrolls when the cursor
+    leaves it, so that moving the cursor changes just a couple of rows
+    (and the window only redraws the rows which have changed).
+    """
     def __init__(self, source):
         super().__init__([])
         self.data = source
@@ -62,12 +71,24 @@ class PSPrompt(Prompt):
 
     def set_page(self, page):
         self.idx = 0
+        self.top = 0
         self.page = page
         if page in self.pages:
             self.entries = self.pages[page]
         else:
             self.entries = [self.process_entry(x) for x in self.data.get_page(page)]
             self.pages[page] = self.entries
+        self.offsets = []
+        self.reindex(0)
+
+    def reindex(self, start):
+        """Recomputes offsets of the entries, starting from the start-th entry"""
+        del self.offsets[start:]
+        total = self.offsets[-1] + len(self.entries[start - 1]) if start else 0
+        for entry in self.entries[start:]:
+            self.offsets.append(total)
+            total += len(entry)
+        self.total = total
 
     def render(self):
         title = str(self.page) + '//' + str(self.state.value)
@@ -82,7 +103,7 @@ class PSPrompt(Prompt):
         title = self.center(title)
         bottom = '[ ' + (invert('OK') if self.idx == len(self) else 'OK') + ' ]'
         bottom = self.center(bottom)
-        items = [self.render_entry(e, idx) for idx, e in enumerate(self.lens())]
+        items = [self.render_entry(e, self.top + i == self.idx) for i, e in enumerate(self.lens())]
         output = fsarray([title] + items + [bottom])
         self.window.render_to_terminal(output)
 
@@ -91,17 +112,17 @@ class PSPrompt(Prompt):
         output = fsarray([' ' * w] * h)
         self.window.render_to_terminal(output)
 
-    def render_entry(self, entry, idx):
+    def render_entry(self, entry, active):
         winw = self.window.width
         if entry[1]:
             hld, data = entry[1]
             stt = '*' if hld else ' '
-            text = '     [' + (invert(stt) if idx == 0 else stt) + '] '
+            text = '     [' + (invert(stt) if active else stt) + '] '
             text += '{}::{}'.format(data[1], data[2])
         elif entry[0]:
             data = entry[0].item
             exp = 'v' if entry[0].expanded else '>'
-            text = '[' + (invert(exp) if idx == 0 else exp) + '] '
+            text = '[' + (invert(exp) if active else exp) + '] '
             text += data[0] + ' '
             strw = fmtstr(text).width
             insw = fmtstr(data[1]).width
@@ -125,7 +146,7 @@ class PSPrompt(Prompt):
 
 
     def __len__(self):
-        return sum(len(y) for y in self.entries)
+        return self.total
 
     def center(self, stri):
         tw = fmtstr(stri).width
@@ -136,8 +157,12 @@ class PSPrompt(Prompt):
         return clamp(x, 0, len(self))
 
     def toggle(self):
-        item, idx = self.get_idx(self.idx)
-        item[0].toggle(idx)
+        if self.idx >= self.total:
+            return
+        i, idx = self.locate(self.idx)
+        self.entries[i].toggle(idx)
+        if idx == 0: # the entry got expanded or collapsed
+            self.reindex(i + 1)
 
     def preview(self):
         target = self.get_target()
@@ -149,19 +174,30 @@ class PSPrompt(Prompt):
     
     def lens(self):
         h = self.window.height - 2
-        lst = [self.get_idx(i)[0] for i in range(self.idx, self.clamp(self.idx + h))]
+        # rows above the viewport fill it, once an entry gets collapsed
+        self.top = min(self.top, max(0, self.total - h))
+        # scroll only if the cursor has left the viewport
+        if self.idx < self.top:
+            self.top = self.idx
+        elif self.idx >= self.top + h:
+            self.top = self.idx - h + 1
+        lst = [self.get_idx(i)[0] for i in range(self.top, min(self.top + h, self.total))]
         lst += [(None, None)] * clamp(h - len(lst), 0, h)
         return lst
 
     def get_target(self):
         return self.get_idx(self.idx)[0]
 
+    def locate(self, idx):
+        """Maps a row to the index of its entry, and the row within the entry"""
+        i = bisect_right(self.offsets, idx) - 1
+        return i, idx - self.offsets[i]
+
     def get_idx(self, idx):
-        for entry in self.entries:
-            if len(entry) > idx:
-                break
-            idx -= len(entry)
-        return (entry.get_idx(idx), idx)
+        if idx >= self.total:
+            return ((None, None), 0)
+        i, idx = self.locate(idx)
+        return (self.entries[i].get_idx(idx), idx)
 
     def process_entry(self, item):
         return Entry(item, self.data)
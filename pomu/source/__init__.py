@@ -1,8 +1,9 @@
 from pomu.source.manager import PackageDispatcher
 
-dispatcher = PackageDispatcher()
-
-import pomu.source.portage
-import pomu.source.file
-import pomu.source.url
-import pomu.source.bugz
+# backend name -> (module implementing it (imported on demand), spec prefixes)
+dispatcher = PackageDispatcher({
+    'portage': ('pomu.source.portage', ['portage:', 'portage/']),
+    'fs': ('pomu.source.file', ['fs:']),
+    'url': ('pomu.source.url', ['url:']),
+    'bugzilla': ('pomu.source.bugz', ['bug:']),
+})
@@ -33,7 +33,7 @@ class PackageBase():
 
     def fetch(self):
         """
-        A method which is responsible for fetching the package: it should return a Package object (specifying set of files with sufficient metadata), and specify this package object as the backend for the Package object (to store source-specific metadata).
+        A method which is responsible for fetching the package: it should return a Package object (specifying set of files with sufficient metadata), wrapped in Result, and specify this package object as the backend for the Package object (to store source-specific metadata).
         """
         raise NotImplementedError()
 
@@ -54,10 +54,20 @@ class PackageBase():
         category, name, version, slot, *_ = lines
         return Result.Ok(PackageBase(category, name, version, slot))
 
+    def revalidate(self):
+        """
+        Checks whether the package is still available from its source.
+        Unlike from_data_dir (which shall only read the metadata directory),
+        this method may do network I/O, and it is only called on request.
+        It shall return Result.Ok(package) (possibly updated), or an error.
+        """
+        return Result.Ok(self)
+
     def write_meta(self, pkgdir):
         """
         This method shall write source-specific metadata to the provided
-        metadata directory.
+        metadata directory: everything needed to reinstantiate the package
+        by from_data_dir, without accessing the source.
         """
         with open(path.join(pkgdir, 'PACKAGE_BASE_DATA'), 'w') as f:
             f.write(self.category + '\n')
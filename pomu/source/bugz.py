@@ -2,6 +2,7 @@
 A package source module to import ebuilds and patches from bugzilla
 """
 
+import re
 import xmlrpc.client
 from os import path
 from urllib.parse import urlparse
@@ -9,22 +10,44 @@ from urllib.parse import urlparse
 from pomu.package import Package
 from pomu.source import dispatcher
 from pomu.source.base import PackageBase, BaseSource
+from pomu.util.http import grab, http_cache
 from pomu.util.iquery import EditSelectPrompt
 from pomu.util.misc import extract_urls
-from pomu.util.query import query, QueryContext
+from pomu.util.query import query
 from pomu.util.result import Result
 
 class BzEbuild(PackageBase):
     """A class to represent an ebuild from bugzilla"""
     __cname__ = 'bugzilla'
 
-    def __init__(self, bug_id, filemap, category, name, version, slot='0'):
+    def __init__(self, bug_id, filemap, category, name, version, slot='0', sources=None):
+        """
+        Parameters:
+            bug_id - the bug the package was imported from
+            filemap - mapping from file paths to their contents (or None)
+            sources - mapping from file paths to where they came from: ids
+                of the attachments, or URLs of the links from the comments
+                (used to fetch them, if filemap is None)
+        """
         super().__init__(category, name, version, slot)
         self.bug_id = bug_id
         self.filemap = filemap
+        self.sources = sources or {}
 
     def fetch(self):
-        return Package(self.name, '/', self, self.category, self.version, filemap=self.filemap)
+        if self.filemap is None:
+            files = {k: Attachment(v, path.basename(k)) if isinstance(v, int) else Link(v)
+                    for k, v in self.sources.items()}
+            res = fetch_attachments([x for x in files.values() if isinstance(x, Attachment)])
+            if res.is_err():
+                return res
+            for link in (x for x in files.values() if isinstance(x, Link)):
+                res = link.fetch()
+                if res.is_err():
+                    return res
+            self.filemap = {k: v() for k, v in files.items()}
+        return Result.Ok(Package(self.name, '/', self, self.category, self.version,
+            filemap=self.filemap))
 
     @staticmethod
     def from_data_dir(pkgdir):
@@ -33,57 +56,197 @@ class BzEbuild(PackageBase):
             return pkg
         pkg = pkg.unwrap()
 
-        with QueryContext(category=pkg.category, name=pkg.name, version=pkg.version, slot=pkg.slot):
+        try:
             with open(path.join(pkgdir, 'BZ_BUG_ID'), 'r') as f:
-                return BugzillaSource.parse_bug(f.readline()).unwrap()
+                bug_id = f.readline().strip()
+            sources = {}
+            if path.isfile(path.join(pkgdir, 'BZ_ATTACHMENTS')):
+                with open(path.join(pkgdir, 'BZ_ATTACHMENTS'), 'r') as f:
+                    for line in f:
+                        source, _, fpath = line.rstrip('\n').partition(' ')
+                        sources[fpath] = int(source) if source.isdigit() else source
+        except OSError:
+            return Result.Err('Could not read data file')
+        return Result.Ok(BzEbuild(bug_id, None, pkg.category, pkg.name,
+            pkg.version, pkg.slot, sources))
+
+    def revalidate(self):
+        return fetch_bugs([self.bug_id]).map(lambda x: self)
 
     def write_meta(self, pkgdir):
         super().write_meta(pkgdir)
         with open(path.join(pkgdir, 'BZ_BUG_ID'), 'w') as f:
             f.write(self.bug_id + '\n')
+        with open(path.join(pkgdir, 'BZ_ATTACHMENTS'), 'w') as f:
+            for fpath, source in sorted(self.sources.items()):
+                f.write('{} {}\n'.format(source, fpath))
 
     def __str__(self):
         return super().__str__() + ' (from bug {})'.format(self.bug_id)
 
 CLIENT_BASE = 'https://bugs.gentoo.org/xmlrpc.cgi'
+prefetched = {} # bug id -> items of the bug, fetched ahead (used once)
+BUG_LINK = re.compile(r'https?://bugs\.gentoo\.org/')
+
+class Attachment():
+    """
+    A bugzilla attachment, whose contents are fetched on demand
+    (and memoized): calling it returns the contents
+    """
+    def __init__(self, att_id, file_name, base=None):
+        self.id = att_id
+        self.file_name = file_name
+        self.base = base
+        self.data = None
+
+    def __call__(self):
+        if self.data is None:
+            fetch_attachments([self], self.base).expect()
+        return self.data
+
+class Link():
+    """
+    A file linked from a bug comment, which is grabbed on demand
+    (and memoized): calling it returns the contents
+    """
+    def __init__(self, url):
+        self.url = url
+        self.file_name = path.basename(urlparse(url).path) or url
+        self.data = None
+
+    def fetch(self):
+        """Grabs the file (the first one, if the page has several)"""
+        if self.data is None:
+            files = grab(self.url)
+            if not files:
+                return Result.Err('Could not fetch ' + self.url)
+            self.data = files[0][1]
+        return Result.Ok(self.data)
+
+    def __call__(self):
+        return self.fetch().expect()
+
+def fetch_bugs(bug_ids, base=None):
+    """
+    Fetches attachment metadata (without the contents) and comment links
+    of several bugs, in a single multicall round-trip.
+    Parameters:
+        bug_ids - list of bug ids
+        base - URL of the bugzilla XML-RPC endpoint (CLIENT_BASE by default)
+    Returns a mapping from bug ids to lists of their items: Attachment
+    objects and links from the comments
+    """
+    base = base or CLIENT_BASE
+    ids = [int(x) for x in bug_ids]
+    proxy = xmlrpc.client.ServerProxy(base)
+    call = xmlrpc.client.MultiCall(proxy)
+    call.Bug.get({'ids': ids, 'include_fields': ['id']})
+    call.Bug.attachments({'ids': ids, 'exclude_fields': ['data']})
+    call.Bug.comments({'ids': ids, 'include_fields': ['text']})
+    try:
+        _, attachments, comments = tuple(call())
+    except (xmlrpc.client.Error, OverflowError, OSError) as err:
+        return Result.Err(str(err))
+    res = {}
+    for bug_id in ids:
+        items = [Attachment(x['id'], x['file_name'], base)
+                for x in attachments['bugs'].get(str(bug_id), [])]
+        for comment in comments['bugs'].get(str(bug_id), {}).get('comments', []):
+            items.extend(extract_urls(comment['text']))
+        res[bug_id] = items
+    return Result.Ok(res)
+
+def fetch_attachments(attachments, base=None):
+    """
+    Fetches contents of several attachments (which were not fetched yet)
+    in a single round-trip, storing them into the Attachment objects.
+    Attachments are immutable, so their contents are kept in the shared
+    HTTP cache, and fetched only once
+    """
+    pending = {}
+    for att in attachments:
+        if att.data is None:
+            hit = http_cache.lookup('bugzilla {} {}'.format(att.base or CLIENT_BASE, att.id))
+            if hit:
+                att.data = hit[1].decode('utf-8')
+            else:
+                pending[att.id] = att
+    if not pending:
+        return Result.Ok()
+    base = base or next(iter(pending.values())).base or CLIENT_BASE
+    proxy = xmlrpc.client.ServerProxy(base)
+    try:
+        res = proxy.Bug.attachments({'attachment_ids': list(pending),
+            'include_fields': ['id', 'data']})['attachments']
+    except (xmlrpc.client.Error, OverflowError, OSError) as err:
+        return Result.Err(str(err))
+    for att_id, att in pending.items():
+        if str(att_id) not in res:
+            return Result.Err('Could not fetch attachment {}'.format(att_id))
+        data = res[str(att_id)]['data'].data
+        http_cache.store('bugzilla {} {}'.format(base, att_id), data)
+        att.data = data.decode('utf-8')
+    return Result.Ok()
 
 @dispatcher.source
 class BugzillaSource(BaseSource):
     """The source module responsible for importing ebuilds and patches from bugzilla tickets"""
     __cname__ = 'bugzilla'
 
-    @dispatcher.handler(priority=1)
+    @dispatcher.handler(priority=1, recognize=str.isdigit)
     @staticmethod
     def parse_bug(uri):
         if not uri.isdigit():
             return Result.Err()
-        uri = int(uri)
-        proxy = xmlrpc.client.ServerProxy(CLIENT_BASE).Bug
-        payload = {'ids': [uri]}
-        try:
-            proxy.get(payload)
-        except (xmlrpc.client.Fault, OverflowError) as err:
-            return Result.Err(str(err))
-        attachments = proxy.attachments(payload)['bugs'][str(uri)]
-        comments = proxy.comments(payload)['bugs'][str(uri)]['comments']
-        comment_links = []
-        for comment in comments:
-            comment_links.extend(extract_urls(comment['text']))
-        items = [(x['file_name'], x['data'].data.decode('utf-8')) for x in attachments] + comment_links
-        if not items:
-            return Result.Err()
-        p = EditSelectPrompt(items)
-        files = p.run()
-        if not files:
-            return Result.Err()
-        category = query('category', 'Please enter package category').expect()
-        name = query('name', 'Please enter package name').expect()
-        ver = query('version', 'Please specify package version for {}'.format(name)).expect()
-        slot = query('slot', 'Please specify package slot', '0').expect()
-        fmap = {path.join(category, name, x[2]): x[1] for x in files}
-        return Result.Ok(BzEbuild(uri, fmap, category, name, ver, slot))
-
-    @dispatcher.handler(priority=2)
+        return BugzillaSource.parse_bugs([uri]).map(lambda x: x[0])
+
+    @staticmethod
+    def parse_bugs(bug_ids):
+        """
+        Imports packages from several bugs: metadata of all the bugs is
+        fetched in one round-trip (unless it has been prefetched by
+        expand_spec), and contents of the selected attachments in another
+        one (the selected links get grabbed).
+        Returns a list of BzEbuild (one per bug)
+        """
+        bugs = {int(x): prefetched.pop(int(x)) for x in bug_ids if int(x) in prefetched}
+        missing = [x for x in bug_ids if int(x) not in bugs]
+        if missing:
+            res = fetch_bugs(missing)
+            if res.is_err():
+                return res
+            bugs.update(res.ok())
+        selected = []
+        for bug_id, items in ((int(x), bugs[int(x)]) for x in bug_ids):
+            if not items:
+                return Result.Err('No attachments or links in bug {}'.format(bug_id))
+            items = [x if isinstance(x, Attachment) else Link(x) for x in items]
+            p = EditSelectPrompt([(x.file_name, x) for x in items])
+            files = p.run()
+            if not files:
+                return Result.Err()
+            category = query('category', 'Please enter package category').expect()
+            name = query('name', 'Please enter package name').expect()
+            ver = query('version', 'Please specify package version for {}'.format(name)).expect()
+            slot = query('slot', 'Please specify package slot', '0').expect()
+            selected.append((bug_id, files, category, name, ver, slot))
+        res = fetch_attachments([x[1] for s in selected for x in s[1]
+            if isinstance(x[1], Attachment)])
+        if res.is_err():
+            return res
+        for link in (x[1] for s in selected for x in s[1] if isinstance(x[1], Link)):
+            res = link.fetch()
+            if res.is_err():
+                return res
+        pkgs = []
+        for bug_id, files, category, name, ver, slot in selected:
+            fmap = {path.join(category, name, x[2]): x[1]() for x in files}
+            sources = {path.join(category, name, x[2]):
+                    x[1].id if isinstance(x[1], Attachment) else x[1].url for x in files}
+            pkgs.append(BzEbuild(str(bug_id), fmap, category, name, ver, slot, sources))
+        return Result.Ok(pkgs)
+
+    @dispatcher.handler(priority=2, recognize=BUG_LINK.match)
     @staticmethod
     def parse_link(uri):
         res = urlparse(uri)
@@ -97,7 +260,7 @@ class BugzillaSource(BaseSource):
         return Result.Err()
 
 
-    @dispatcher.handler()
+    @dispatcher.handler(prefix='bug:')
     @staticmethod
     def parse_full(uri):
         if not uri.startswith('bug:'):
@@ -107,6 +270,22 @@ class BugzillaSource(BaseSource):
             return BugzillaSource.parse_bug(rem)
         return BugzillaSource.parse_link(rem)
 
+    @staticmethod
+    def expand_spec(uri):
+        """
+        Splits a spec of several bugs (bug:1,2,3) into specs of single bugs,
+        prefetching metadata of all of them in one round-trip
+        """
+        if not uri.startswith('bug:'):
+            return None
+        ids = [x.strip() for x in uri[4:].split(',')]
+        if len(ids) < 2 or not all(x.isdigit() for x in ids):
+            return None
+        bugs = fetch_bugs(ids)
+        if bugs.is_ok():
+            prefetched.update(bugs.ok())
+        return ['bug:' + x for x in ids]
+
     @classmethod
     def fetch_package(self, pkg):
         return pkg.fetch()
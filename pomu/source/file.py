@@ -8,7 +8,7 @@ from pomu.package import Package
 from pomu.source import dispatcher
 from pomu.source.base import PackageBase, BaseSource
 from pomu.util.pkg import cpv_split, ver_str
-from pomu.util.query import query, QueryContext
+from pomu.util.query import query
 from pomu.util.result import Result
 
 class LocalEbuild(PackageBase):
@@ -20,13 +20,13 @@ class LocalEbuild(PackageBase):
         self.path = path
 
     def fetch(self):
-        return Package(self.name, '/', self, self.category, self.version,
+        return Result.Ok(Package(self.name, '/', self, self.category, self.version,
                 filemap = {
                     path.join(
                         self.category,
                         self.name,
-                        '{}/{}-{}.ebuild'.format(self.category, self.name, self.version)
-                    ) : self.path})
+                        '{}-{}.ebuild'.format(self.name, self.version)
+                    ) : self.path}))
     
     @staticmethod
     def from_data_dir(pkgdir):
@@ -35,9 +35,17 @@ class LocalEbuild(PackageBase):
             return pkg
         pkg = pkg.unwrap()
 
-        with QueryContext(category=pkg.category, name=pkg.name, version=pkg.version, slot=pkg.slot):
+        try:
             with open(path.join(pkgdir, 'FS_ORIG_PATH'), 'r') as f:
-                return LocalEbuildSource.parse_ebuild_path(f.readline()).unwrap()
+                epath = f.readline().strip()
+        except OSError:
+            return Result.Err('Could not read data file')
+        return Result.Ok(LocalEbuild(epath, pkg.category, pkg.name, pkg.version, pkg.slot))
+
+    def revalidate(self):
+        if not path.isfile(self.path):
+            return Result.Err('{} does not exist'.format(self.path))
+        return Result.Ok(self)
 
     def write_meta(self, pkgdir):
         super().write_meta(pkgdir)
@@ -52,7 +60,7 @@ class LocalEbuildSource(BaseSource):
     """The source module responsible for importing local ebuilds"""
     __cname__ = 'fs'
 
-    @dispatcher.handler(priority=5)
+    @dispatcher.handler(priority=5, recognize=lambda uri: uri.endswith('.ebuild'))
     @staticmethod
     def parse_ebuild_path(uri):
         if not path.isfile(uri) or not uri.endswith('.ebuild'):
@@ -70,7 +78,7 @@ class LocalEbuildSource(BaseSource):
         slot = query('slot', 'Please specify package slot', '0').expect()
         return Result.Ok(LocalEbuild(uri, category, name, ver, slot))
 
-    @dispatcher.handler()
+    @dispatcher.handler(prefix='fs:')
     @staticmethod
     def parse_full(uri):
         if not uri.startswith('fs:'):
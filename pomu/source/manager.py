@@ -6,35 +6,108 @@ Package sources can provide several handlers with different priorities.
 A handler is a String -> Result function, which tries to parse the passed
 value and return Ok(value).
 
+Since handlers may do I/O (network requests, interactive queries), each
+handler may be accompanied by a cheap side-effect free recognizer:
+either a prefix (e.g. 'bug:'), or a String -> bool predicate.
+Specs starting with a registered prefix are routed (through a prefix trie)
+to the handlers of that prefix only; other specs are passed to the
+handlers, whose recognizers accept them.
+
 The package would be handled by the handler with the lowest priority, which
 was added the first.
 
+Successful resolutions are memoized (keyed by the stripped spec) for
+a while, so resolving the same spec twice does not re-run the handlers
+(which may do network requests, or query the user).
+
+A spec may denote several packages (e.g. bug:1,2): sources may provide
+an expand_spec(uri) class method, splitting such specs into ones denoting
+a single package (and get_packages fetches all of them).
+
+Source modules are listed in a declarative table (backend name -> module,
+prefixes), and get imported (thus registering their handlers) only when needed.
+
 Example:
     @dispatcher.source
     class BgoSource():
-        @dispatcher.handler(priority=5)
+        @dispatcher.handler(priority=5, recognize=lambda uri: uri.isdecimal())
         def parse_int(uri):
-            if uri.is_decimal():
-                return Result.Ok(int(uri))
-            elif uri[0] == '#' and uri[1:].is_decimal():
-                return Result.Ok(int(uri[1:]))
-            return Result.Err('NaN')
-
-        @dispatcher.handler(priority=1)
-        def parse_url(uri):
-            if uri.startswith('http://bugs.gentoo.org/'):
+            return Result.Ok(int(uri))
+
+        @dispatcher.handler(priority=1, prefix='bug:')
+        def parse_full(uri):
             ...
 """
 #TODO: efficient sorted insertion
 #import bisect
 import inspect
+from importlib import import_module
+from time import monotonic
 
 from pomu.util.result import Result
 
-class PackageDispatcher():
+class PrefixTrie():
+    """A trie, mapping string prefixes to lists of values"""
     def __init__(self):
+        self.root = {}
+
+    def insert(self, prefix, value):
+        node = self.root
+        for c in prefix:
+            node = node.setdefault(c, {})
+        node.setdefault(None, []).append(value)
+
+    def match(self, string):
+        """Returns values of the longest prefix of string (or an empty list)"""
+        node, res = self.root, []
+        for c in string:
+            node = node.get(c)
+            if node is None:
+                break
+            res = node.get(None, res)
+        return res
+
+def normalize_spec(uri):
+    """
+    Normalizes a package spec, for it to be used as a cache key
+    (only the surrounding whitespace: paths and URLs may contain spaces)
+    """
+    return uri.strip()
+
+class PackageDispatcher():
+    def __init__(self, modules=None, ttl=600):
+        """
+        Parameters:
+            modules - a mapping from backend names to (module, prefixes) tuples:
+                the module providing the backend, and spec prefixes it handles
+            ttl - time (in seconds) for resolved specs to be memoized for
+        """
         self.handlers = []
+        self.ttl = ttl
+        self.resolved = {} # spec -> (expiry time, source, value)
         self.backends = {}
+        self.modules = {}
+        self.prefixes = PrefixTrie() # registered handlers
+        self.routes = PrefixTrie() # backends not loaded yet
+        for name, (module, prefixes) in (modules or {}).items():
+            self.modules[name] = module
+            for prefix in prefixes:
+                self.routes.insert(prefix, name)
+
+    def load_backend(self, name):
+        """Imports the module providing a backend (if it is not loaded yet)"""
+        if name not in self.backends and name in self.modules:
+            import_module(self.modules.pop(name))
+
+    def load_all(self):
+        """Imports all the source modules"""
+        for name in list(self.modules):
+            self.load_backend(name)
+
+    def backend(self, name):
+        """Gets a backend (source class) by name"""
+        self.load_backend(name)
+        return self.backends[name]
 
     def source(self, cls):
         """
@@ -48,10 +121,11 @@ class PackageDispatcher():
             return cls
         if cls == BaseSource:
             return cls
-        self.backends[cls.__cname__] = cls
+        self.backends[getattr(cls, '__cname__', None) or cls.__name__] = cls
         for m, obj in inspect.getmembers(cls):
             if isinstance(obj, self.handler._handler):
-                self.register_package_handler(cls, obj.handler, obj.priority)
+                self.register_package_handler(cls, obj.handler, obj.priority,
+                        obj.prefix, obj.recognize)
         return cls
 
     class handler():
@@ -59,6 +133,11 @@ class PackageDispatcher():
         A decorator to denote package source module handler, which
         should attempt to parse a package descriptor. If it succeeds,
         the result would be passed to the module for further processing.
+        Parameters:
+            priority - handlers with lower priority get called first
+            prefix - spec prefix (or a tuple of them), routed to this handler
+            recognize - a cheap predicate, telling whether the handler
+                may accept the spec (shall not do any I/O)
         """
         class _handler():
             def __init__(self, handler):
@@ -66,15 +145,19 @@ class PackageDispatcher():
             def __call__(self, *args, **kwargs):
                 return self.handler(*args, **kwargs)
 
-        def __init__(self, priority=1000, *args, **kwargs):
+        def __init__(self, priority=1000, prefix=None, recognize=None):
             self.priority = priority
+            self.prefix = prefix
+            self.recognize = recognize
 
         def __call__(self, func, *args, **kwargs):
             x = self._handler(func)
             x.priority = self.priority
+            x.prefix = self.prefix
+            x.recognize = self.recognize
             return staticmethod(x)
 
-    def register_package_handler(self, source, handler, priority):
+    def register_package_handler(self, source, handler, priority, prefix=None, recognize=None):
         """
         Register a package handler for a specified source.
         Handlers with lower priority get called first.
@@ -83,22 +166,85 @@ class PackageDispatcher():
         for i in range(len(self.handlers)):
             if self.handlers[i][0] > priority:
                 break
-        self.handlers.insert(i, (priority, source, handler))
+        else:
+            i = len(self.handlers)
+        entry = (priority, source, handler, prefix, recognize)
+        self.handlers.insert(i, entry)
+        for p in ((prefix,) if isinstance(prefix, str) else prefix or ()):
+            self.prefixes.insert(p, entry)
+
+    def candidates(self, uri):
+        """
+        Lists (priority, source, handler) of handlers, which may accept the spec,
+        without calling any of them
+        """
+        routed = self.routes.match(uri)
+        if routed:
+            for name in routed:
+                self.load_backend(name)
+        else:
+            self.load_all()
+        routed = self.prefixes.match(uri)
+        if routed:
+            return [x[:3] for x in sorted(routed, key=lambda x: x[0])]
+        return [x[:3] for x in self.handlers
+                if not x[3] and (not x[4] or x[4](uri))]
+
+    def resolve(self, uri):
+        """
+        Parses the spec, returning the accepting source and the parsed value
+        (memoized, failures are not)
+        """
+        key = normalize_spec(uri)
+        if key in self.resolved:
+            expires, source, value = self.resolved[key]
+            if expires > monotonic():
+                return Result.Ok((source, value))
+            del self.resolved[key]
+        for priority, source, handler in self.candidates(key):
+            res = handler(uri)
+            if res.is_ok():
+                self.resolved[key] = (monotonic() + self.ttl, source, res.ok())
+                return Result.Ok((source, res.ok()))
+        return Result.Err('No handler found for package ' + uri)
+
+    def invalidate(self, uri=None):
+        """Forgets the resolution of a spec (or of all the specs)"""
+        if uri is None:
+            self.resolved.clear()
+        else:
+            self.resolved.pop(normalize_spec(uri), None)
 
     def get_package_source(self, uri):
         """Get a source which accepts the package"""
-        for priority, source, handler in self.handlers:
-            if handler(uri).is_ok():
-                return Result.Ok(source)
-        return Result.Err('No handler found for package ' + uri)
+        return self.resolve(uri).map(lambda x: x[0])
 
     def get_package(self, uri):
         """Fetch a package specified by the descriptor"""
-        for priority, source, handler in self.handlers:
-            res = handler(uri)
-            if res.is_ok():
-                return Result.Ok(source.fetch_package(res.ok()))
-        return Result.Err('No handler found for package ' + uri)
+        res = self.resolve(uri)
+        if res.is_err():
+            return res
+        source, pkg = res.ok()
+        return source.fetch_package(pkg)
+
+    def expand(self, uri):
+        """Splits a spec into the specs of the packages it denotes"""
+        key = normalize_spec(uri)
+        for source in {x[1] for x in self.candidates(key)}:
+            specs = getattr(source, 'expand_spec', lambda x: None)(key)
+            if specs:
+                return specs
+        return [key]
+
+    def get_packages(self, uri):
+        """Fetch the packages specified by the descriptor (which may denote several)"""
+        res = []
+        for spec in self.expand(uri):
+            pkg = self.get_package(spec)
+            if pkg.is_err():
+                return pkg
+            res.append(pkg.ok())
+        return Result.Ok(res)
 
     def install_package(self, repo, uri):
         """Install a package specified by the descriptor into the repository"""
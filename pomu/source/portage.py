@@ -1,6 +1,7 @@
 """
 A package source module to import packages from configured portage repositories
 """
+import re
 from functools import cmp_to_key
 from os import path
 
@@ -11,7 +12,8 @@ from pomu.repo.repo import portage_repos, portage_repo_path
 from pomu.source import dispatcher
 from pomu.source.base import PackageBase, BaseSource
 from pomu.util.pkg import cpv_split, ver_str
-from pomu.util.portage import repo_pkgs
+from pomu.util.manifest import dist_entries
+from pomu.util.portage import ebuild_distfiles, repo_pkgs
 from pomu.util.result import Result
 
 class PortagePackage(PackageBase):
@@ -23,10 +25,16 @@ class PortagePackage(PackageBase):
         self.repo = repo
 
     def fetch(self):
-        return Package(self.name, portage_repo_path(self.repo), self,
+        root = portage_repo_path(self.repo)
+        pkgdir = path.join(self.category, self.name)
+        # DIST entries of the distfiles of the ebuild (of all, if they are unknown)
+        dist = dist_entries(path.join(root, pkgdir, 'Manifest'),
+                ebuild_distfiles(self.repo, self.category, self.name, self.version))
+        return Result.Ok(Package(self.name, root, self,
                 category=self.category, version=self.version, slot=self.slot,
-                files=[path.join(self.category, self.name, 'metadata.xml'),
-                    path.join(self.category, self.name, self.name + '-' + self.version + '.ebuild')])
+                files=[path.join(pkgdir, 'metadata.xml'),
+                    path.join(pkgdir, self.name + '-' + self.version + '.ebuild')],
+                dist={pkgdir: dist}))
 
     def write_meta(self, pkgdir):
         super().write_meta(pkgdir)
@@ -40,22 +48,35 @@ class PortagePackage(PackageBase):
             return pkg
         pkg = pkg.unwrap()
 
-        with open(path.join(pkgdir, 'PORTAGE_DATA'), 'r') as f:
-            repo = f.readline().strip()
-        if sanity_check(repo, pkg.category, pkg.name, pkg.version, pkg.slot):
-            return Result.Ok(PortagePackage(repo, pkg.category, pkg.name, pkg.slot, pkg.version))
-        return Result.Err('Package {} not found'.format(pkg))
+        try:
+            with open(path.join(pkgdir, 'PORTAGE_DATA'), 'r') as f:
+                repo = f.readline().strip()
+        except OSError:
+            return Result.Err('Could not read data file')
+        return Result.Ok(PortagePackage(repo, pkg.category, pkg.name, pkg.version, pkg.slot))
+
+    def revalidate(self):
+        res = sanity_check(self.repo, self.category, self.name, self.version, self.slot)
+        if not res:
+            return Result.Err('Package {} not found'.format(self))
+        return Result.Ok(res)
 
     def __str__(self):
         return super().__str__() + '::' + self.repo
 
 
+# category/name-version:slot::repo, every part but the name being optional
+ATOM = re.compile(r'^[\w+][\w+.-]*(/[\w+][\w+.-]*)?(:[\w+][\w+./-]*)?(::[\w-]+)?$')
+
+def looks_like_path(uri):
+    return uri.startswith(('/', '.', '~')) or uri.endswith('.ebuild')
+
 @dispatcher.source
 class PortageSource(BaseSource):
     """The source module responsible for fetching portage packages"""
     __cname__ = 'portage'
 
-    @dispatcher.handler(priority=5)
+    @dispatcher.handler(priority=5, recognize=ATOM.match)
     @staticmethod
     def parse_spec(uri, repo=None):
         # dev-libs/openssl-0.9.8z_p8-r100:0.9.8::gentoo
@@ -63,7 +84,7 @@ class PortageSource(BaseSource):
         if repo_:
             repo = repo_
         # dev-libs/openssl-0.9.8z_p8-r100:0.9.8
-        pkg, _, slot = uri.partition(':') # slot may be omitted
+        pkg, _, slot = pkg.partition(':') # slot may be omitted
         if not slot:
             slot = None
         category, name, ver = cpv_split(pkg)
@@ -72,7 +93,7 @@ class PortageSource(BaseSource):
             return Result.Err()
         return Result.Ok(res)
 
-    @dispatcher.handler()
+    @dispatcher.handler(prefix=('portage:', 'portage/'))
     @staticmethod
     def parse_full(uri):
         # portage/gentoo:dev-libs/openssl-0.9.8z_p8-r100:0.9.8::gentoo
@@ -90,7 +111,7 @@ class PortageSource(BaseSource):
             uri = uri[1:]
         return PortageSource.parse_spec(uri, repo)
 
-    @dispatcher.handler(priority=4)
+    @dispatcher.handler(priority=4, recognize=looks_like_path)
     @staticmethod
     def parse_repo_ebuild(uri):
         if not path.exists(uri):
@@ -99,21 +120,21 @@ class PortageSource(BaseSource):
         prefixes = [(x, portage_repo_path(x)) for x in portage_repos()]
         for repo, repo_path in prefixes:
             repo_path = repo_path.rstrip('/') + '/'
-            if uri.startswith(repo):
+            if uri.startswith(repo_path):
                 if path.isfile(uri):
                     if not uri.endswith('.ebuild'):
                         return Result.Err()
-                    _, name, ver = cpv_split(path.basename(uri))
+                    _, name, ver = cpv_split(path.basename(uri)[:-7])
                     dircomps = path.dirname(uri)[len(repo_path):].split('/')
                     if len(dircomps) != 2:
                         return Result.Err()
                     return PortageSource.parse_spec('{}/{}-{}::{}'.format(dircomps[0], name, ver, repo))
                 elif path.isdir(uri):
-                    dircomps = path.dirname(uri)[len(repo_path):].split('/')
+                    dircomps = uri.rstrip('/')[len(repo_path):].split('/')
                     if len(dircomps) != 2:
                         return Result.Err()
-                    return PortageSource.parse_spec('{}/{}'.format(*dircomps))
-            return Result.Err()
+                    return PortageSource.parse_spec('{}/{}::{}'.format(*dircomps, repo))
+        return Result.Err()
 
 
     @classmethod
@@ -4,12 +4,11 @@ A package source module to import packages from URLs
 
 from os import path
 
-from pbraw import grab
-
 from pomu.package import Package
 from pomu.source import dispatcher
 from pomu.source.base import PackageBase, BaseSource
-from pomu.util.query import query, QueryContext
+from pomu.util.http import grab
+from pomu.util.query import query
 from pomu.util.result import Result
 
 class URLEbuild(PackageBase):
@@ -25,19 +24,22 @@ class URLEbuild(PackageBase):
         self.slot = slot
 
     def fetch(self):
-        if self.contents:
-            if isinstance(self.contents, str):
-                self.content = self.contents.encode('utf-8')
-        else:
+        if not self.contents:
             fs = grab(self.url)
-            self.content = fs[0][1].encode('utf-8')
-        return Package(self.name, '/', self, self.category, self.version,
+            if not fs:
+                return Result.Err('Could not fetch ' + self.url)
+            self.contents = fs[0][1]
+        if isinstance(self.contents, str):
+            self.content = self.contents.encode('utf-8')
+        else:
+            self.content = self.contents
+        return Result.Ok(Package(self.name, '/', self, self.category, self.version,
                 filemap = {
                     path.join(
                         self.category,
                         self.name,
                         '{}-{}.ebuild'.format(self.name, self.version)
-                    ) : self.content})
+                    ) : self.content}))
     
     @staticmethod
     def from_data_dir(pkgdir):
@@ -46,9 +48,20 @@ class URLEbuild(PackageBase):
             return pkg
         pkg = pkg.unwrap()
 
-        with QueryContext(category=pkg.category, name=pkg.name, version=pkg.version, slot=pkg.slot):
+        try:
             with open(path.join(pkgdir, 'ORIG_URL'), 'r') as f:
-                return URLGrabberSource.parse_link(f.readline()).unwrap()
+                url = f.readline().strip()
+        except OSError:
+            return Result.Err('Could not read data file')
+        # the contents get grabbed on fetch
+        return Result.Ok(URLEbuild(url, None, pkg.category, pkg.name, pkg.version, pkg.slot))
+
+    def revalidate(self):
+        files = grab(self.url)
+        if not files:
+            return Result.Err('Could not fetch ' + self.url)
+        return Result.Ok(URLEbuild(self.url, files[0][1], self.category,
+            self.name, self.version, self.slot))
 
     def write_meta(self, pkgdir):
         super().write_meta(pkgdir)
@@ -66,7 +79,8 @@ class URLGrabberSource(BaseSource):
     """
     __cname__ = 'url'
 
-    @dispatcher.handler(priority=5)
+    @dispatcher.handler(priority=5,
+            recognize=lambda uri: uri.startswith(('http://', 'https://')))
     @staticmethod
     def parse_link(uri):
         if not (uri.startswith('http://') or uri.startswith('https://')):
@@ -83,7 +97,7 @@ class URLGrabberSource(BaseSource):
         slot = query('slot', 'Please specify package slot', '0').expect()
         return Result.Ok(URLEbuild(uri, files[0][1], category, name, ver, slot))
 
-    @dispatcher.handler()
+    @dispatcher.handler(prefix='url:')
     @staticmethod
     def parse_full(url):
         if not url.startswith('url:'):
@@ -1,6 +1,22 @@
 """
 Caches the return value of a function -> Result, regardless of input params
+Locates the on-disk cache directory of pomu
 """
+from os import environ, makedirs, path
+
+def cache_dir(*subdirs):
+    """
+    Returns (creating it, if necessary) a subdirectory of the pomu cache
+    directory ($POMU_CACHE_DIR, or $XDG_CACHE_HOME/pomu)
+    """
+    base = environ.get('POMU_CACHE_DIR')
+    if not base:
+        base = path.join(environ.get('XDG_CACHE_HOME') or
+                path.join(path.expanduser('~'), '.cache'), 'pomu')
+    res = path.join(base, *subdirs)
+    makedirs(res, exist_ok=True)
+    return res
+
 class cached():
     """
     A decorator to make the function cache its return value, regardless of input
@@ -1,18 +1,24 @@
 """Miscellaneous utility functions for git structures"""
 
 from base64 import b16encode
+from os import path
+from time import time
 import zlib
 
 from pomu.util.result import Result
 
 def parse_tree(blob, path=b''):
     """Parses a git tree"""
-    res = []
     leng, _, tree = blob.partition(b'\0')
-    if path is str:
-        path = path.encode('utf-8')
     if not tree:
         return Result.Err('Invalid tree')
+    return parse_tree_entries(tree, path)
+
+def parse_tree_entries(tree, path=b''):
+    """Parses entries of a git tree (the object data, without the header)"""
+    res = []
+    if isinstance(path, str):
+        path = path.encode('utf-8')
     while len(tree) > 0:
         mode, _, tree = tree.partition(b' ')
         name, _, tree = tree.partition(b'\0')
@@ -40,6 +46,27 @@ def commit_head(blob):
         return Result.Err()
     return tid[5:]
 
+def head_rev(repo_dir, bare=False):
+    """Reads the commit id of HEAD in a git repository, or None"""
+    gdir = repo_dir if bare else path.join(repo_dir, '.git')
+    try:
+        with open(path.join(gdir, 'HEAD'), 'r') as f:
+            head = f.readline().strip()
+        if not head.startswith('ref: '):
+            return head
+        ref = head[5:]
+        if path.isfile(path.join(gdir, ref)):
+            with open(path.join(gdir, ref), 'r') as f:
+                return f.readline().strip()
+        with open(path.join(gdir, 'packed-refs'), 'r') as f:
+            for line in f:
+                sha, _, name = line.strip().partition(' ')
+                if name == ref:
+                    return sha
+    except OSError:
+        pass
+    return None
+
 def parse_object(obj, tpath=b''):
     """Parses a git object"""
     if tpath is str:
@@ -50,3 +77,68 @@ def parse_object(obj, tpath=b''):
     elif data[0:5] == b'tree ':
         return parse_tree(data[5:], tpath)
     return Result.Err('Unsupported object type')
+
+class IndexStats():
+    """Counts git index writes (and the time spent on them)"""
+    def __init__(self):
+        self.writes = 0
+        self.seconds = 0.0
+
+    def record(self, seconds):
+        self.writes += 1
+        self.seconds += seconds
+
+    def __str__(self):
+        return 'git index: {} write(s), {:.3f}s'.format(self.writes, self.seconds)
+
+index_stats = IndexStats()
+
+class IndexUpdate():
+    """
+    Collects changes to the git index of a repository, to apply them
+    with a single index write per operation (instead of one per path)
+    """
+    def __init__(self, repo):
+        """
+        Parameters:
+            repo - a git.Repo object
+        """
+        self.repo = repo
+        self.index = repo.index
+        self.added = []
+        self.removed = []
+
+    def _relpath(self, p):
+        if path.isabs(p):
+            p = path.relpath(p, self.repo.working_tree_dir)
+        return p.rstrip('/')
+
+    def add(self, paths):
+        """Schedules paths (files or directories) to be added"""
+        self.added.extend(self._relpath(p) for p in paths)
+
+    def remove(self, paths):
+        """Schedules paths (files or directories, recursively) to be removed"""
+        self.removed.extend(self._relpath(p) for p in paths)
+
+    def write(self):
+        """Applies the collected changes, writing the index once"""
+        if not self.added and not self.removed:
+            return
+        start = time()
+        if self.removed:
+            files = set(self.removed)
+            dirs = tuple(x + '/' for x in self.removed)
+            for key in [k for k in self.index.entries
+                    if k[0] in files or k[0].startswith(dirs)]:
+                del self.index.entries[key]
+        if self.added:
+            self.index.add(self.added, write=False)
+        self.index.write()
+        index_stats.record(time() - start)
+        self.added, self.removed = [], []
+
+    def commit(self, message):
+        """Writes the collected changes and commits the index"""
+        self.write()
+        return self.index.commit(message)
@@ -0,0 +1,212 @@
+"""
+An on-disk cache of HTTP resources, shared by the network-bound sources.
+Cached entries are revalidated with conditional requests (If-None-Match,
+If-Modified-Since), so unchanged resources are not downloaded again;
+the least recently used entries get evicted, once the cache grows
+over its size limit.
+"""
+import hashlib
+import json
+import os
+from os import path
+
+from pomu.util.cache import cache_dir
+from pomu.util.result import Result
+
+MAX_SIZE = 64 * 1024 * 1024
+TIMEOUT = 30
+# response headers, which are kept along with the body
+KEPT_HEADERS = ('content-type', 'content-disposition', 'etag', 'last-modified')
+
+class CachedResponse():
+    """A response served from the cache (mimics requests.Response)"""
+    status_code = 200
+    ok = True
+    from_cache = True
+
+    def __init__(self, url, content, headers):
+        from requests.structures import CaseInsensitiveDict
+        self.url = url
+        self.content = content
+        self.headers = CaseInsensitiveDict(headers)
+
+    @property
+    def text(self):
+        ctype = self.headers.get('content-type', '')
+        encoding = 'utf-8'
+        for param in ctype.split(';')[1:]:
+            key, _, val = param.strip().partition('=')
+            if key.lower() == 'charset' and val:
+                encoding = val.strip('"\'')
+        try:
+            return self.content.decode(encoding, errors='replace')
+        except LookupError:
+            return self.content.decode('utf-8', errors='replace')
+
+class HTTPCache():
+    """
+    A size-bounded LRU cache of HTTP responses (or of arbitrary data),
+    keyed by URL (or by an arbitrary string key)
+    """
+    def __init__(self, directory=None, max_size=MAX_SIZE, subdir='http'):
+        """
+        Parameters:
+            directory - cache directory (a subdirectory of the pomu cache by default)
+            max_size - maximum total size of the cached bodies (in bytes)
+            subdir - name of the subdirectory of the pomu cache
+        """
+        self._directory = directory
+        self.max_size = max_size
+        self.subdir = subdir
+
+    @property
+    def directory(self):
+        if not self._directory:
+            self._directory = cache_dir(self.subdir)
+        return self._directory
+
+    def _paths(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return (path.join(self.directory, digest + '.json'),
+                path.join(self.directory, digest + '.body'))
+
+    def lookup(self, key):
+        """Returns (metadata, body) of a cached entry (or None)"""
+        mpath, bpath = self._paths(key)
+        try:
+            with open(mpath, 'r') as f:
+                meta = json.load(f)
+            with open(bpath, 'rb') as f:
+                body = f.read()
+            os.utime(mpath) # the entry was used recently
+        except (OSError, ValueError):
+            return None
+        if meta.get('key') != key:
+            return None
+        return meta, body
+
+    def store(self, key, body, **meta):
+        """Stores an entry (body being bytes), evicting old entries if needed"""
+        mpath, bpath = self._paths(key)
+        meta['key'] = key
+        try:
+            with open(bpath + '.tmp', 'wb') as f:
+                f.write(body)
+            os.replace(bpath + '.tmp', bpath)
+            with open(mpath + '.tmp', 'w') as f:
+                json.dump(meta, f)
+            os.replace(mpath + '.tmp', mpath)
+        except OSError: # it is just a cache
+            return
+        self.evict()
+
+    def drop(self, key):
+        """Removes an entry"""
+        for p in self._paths(key):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def evict(self):
+        """Evicts the least recently used entries, until the cache fits its limit"""
+        entries, total = [], 0
+        for f in os.listdir(self.directory):
+            if not f.endswith('.json'):
+                continue
+            mpath = path.join(self.directory, f)
+            bpath = mpath[:-5] + '.body'
+            try:
+                used, size = os.stat(mpath).st_mtime_ns, os.stat(bpath).st_size
+            except OSError:
+                continue
+            entries.append((used, size, mpath, bpath))
+            total += size
+        entries.sort()
+        while total > self.max_size and entries:
+            _, size, mpath, bpath = entries.pop(0)
+            for p in (mpath, bpath):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            total -= size
+
+    def get(self, url, session=None):
+        """
+        Fetches a URL, revalidating the cached copy (if there is one)
+        Parameters:
+            url - the URL to fetch
+            session - requests session to issue the request with
+        Returns a response (a CachedResponse, if the cached copy is up-to-date,
+        or if the resource is unreachable)
+        """
+        import requests
+        cached = self.lookup(url)
+        headers = {}
+        if cached:
+            meta = cached[0].get('headers', {})
+            if 'etag' in meta:
+                headers['If-None-Match'] = meta['etag']
+            if 'last-modified' in meta:
+                headers['If-Modified-Since'] = meta['last-modified']
+        try:
+            res = (session or requests).get(url, headers=headers, timeout=TIMEOUT)
+        except requests.RequestException as err:
+            if cached:
+                return Result.Ok(CachedResponse(url, cached[1], cached[0].get('headers', {})))
+            return Result.Err(str(err))
+        if res.status_code == 304 and cached:
+            return Result.Ok(CachedResponse(url, cached[1], cached[0].get('headers', {})))
+        if not res.ok:
+            return Result.Err('Could not fetch {}: {} {}'.format(url, res.status_code, res.reason))
+        self.store(url, res.content, headers={k: res.headers[k]
+            for k in KEPT_HEADERS if k in res.headers})
+        return Result.Ok(res)
+
+http_cache = HTTPCache()
+
+def fetch_text(url, session=None, cached=True):
+    """
+    Fetches a text resource
+    Parameters:
+        url - the URL to fetch
+        session - requests session to issue the request with
+        cached - whether to fetch it through the cache (the resources,
+            which are kept elsewhere in a processed form, need not be)
+    """
+    if cached:
+        return http_cache.get(url, session).map(lambda x: x.text)
+    import requests
+    try:
+        res = (session or requests).get(url, timeout=TIMEOUT)
+    except requests.RequestException as err:
+        return Result.Err(str(err))
+    if not res.ok:
+        return Result.Err('Could not fetch {}: {} {}'.format(url, res.status_code, res.reason))
+    return Result.Ok(res.text)
+
+def grab(url):
+    """
+    Grabs files from a URL (a paste, a raw file etc.) with pbraw,
+    through the cache: if the page has not changed, its files are not
+    grabbed (nor downloaded) again
+    Returns a list of (file name, contents) tuples
+    """
+    res = http_cache.get(url)
+    if res.is_err():
+        return []
+    res = res.unwrap()
+    key = 'grab ' + url
+    if getattr(res, 'from_cache', False):
+        hit = http_cache.lookup(key)
+        if hit:
+            return [tuple(x) for x in json.loads(hit[1].decode('utf-8'))]
+    from pbraw import dispatcher
+    for _, handler in dispatcher.handlers:
+        files = handler(url, res)
+        if files:
+            http_cache.store(key, json.dumps(files).encode('utf-8'))
+            return files
+    http_cache.drop(key)
+    return []
@@ -3,7 +3,8 @@ from pydoc import pager
 
 from curtsies import CursorAwareWindow, Input, fsarray, fmtstr
 from curtsies.fmtfuncs import invert
-from pbraw import grab
+
+from pomu.util.http import grab
 
 
 class Position:
@@ -180,7 +181,7 @@ class EditSelectPrompt(Prompt):
     def preview(self):
         entry = self.entries[self.idx]
         if entry[0] is not None:
-            pager(entry[1])
+            pager(entry[1]() if callable(entry[1]) else entry[1])
         else:
             gr = grab(entry)
             if not gr:
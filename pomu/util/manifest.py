@@ -0,0 +1,197 @@
+"""
+In-process Manifest generation (in place of `repoman manifest`).
+Generates EBUILD, AUX and MISC entries by hashing the files of an ebuild
+directory; DIST entries are carried over from the existing Manifest, or
+from the Manifest of the repository the package comes from (hashing
+distfiles would require fetching them).
+"""
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from os import path, walk, stat, replace, remove, cpu_count
+from threading import Event
+
+from pomu.util.result import Result
+
+HASH_FUNCS = {
+    'BLAKE2B': hashlib.blake2b,
+    'BLAKE2S': hashlib.blake2s,
+    'SHA256': hashlib.sha256,
+    'SHA512': hashlib.sha512,
+    'SHA3_256': hashlib.sha3_256,
+    'SHA3_512': hashlib.sha3_512,
+}
+DEFAULT_HASHES = ('BLAKE2B', 'SHA512')
+
+CHUNK_SIZE = 1 << 20
+
+# (path, size, mtime, ctime) -> {hash name: digest}, shared by all the manifests
+_hash_cache = {}
+
+def hash_file(fpath, hashes=DEFAULT_HASHES, st=None):
+    """
+    Hashes a file with several hash functions in one pass
+    Parameters:
+        fpath - path to the file
+        hashes - names of the hash functions (Manifest notation)
+        st - stat result of the file (if already known)
+    Returns a dictionary (hash name -> hex digest)
+    """
+    st = st or stat(fpath)
+    key = (fpath, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+    cached = _hash_cache.get(key, {})
+    missing = [x for x in hashes if x not in cached]
+    if missing:
+        funcs = [HASH_FUNCS[x]() for x in missing]
+        buf = bytearray(CHUNK_SIZE)
+        view = memoryview(buf)
+        with open(fpath, 'rb', buffering=0) as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                for h in funcs:
+                    h.update(view[:n])
+        cached = dict(cached)
+        cached.update((x, h.hexdigest()) for x, h in zip(missing, funcs))
+        _hash_cache[key] = cached
+    return {x: cached[x] for x in hashes}
+
+def read_manifest(mpath):
+    """Parses a Manifest into a dictionary ((type, name) -> (size, hashes))"""
+    res = {}
+    try:
+        with open(mpath, 'r') as f:
+            for line in f:
+                toks = line.split()
+                if len(toks) < 3 or len(toks) % 2 == 0:
+                    continue
+                res[(toks[0], toks[1])] = (int(toks[2]),
+                        dict(zip(toks[3::2], toks[4::2])))
+    except (OSError, ValueError):
+        return {}
+    return res
+
+def layout_conf(repo_root):
+    """Reads the manifest settings (hashes, thinness) of a repository"""
+    hashes, thin = DEFAULT_HASHES, False
+    try:
+        with open(path.join(repo_root, 'metadata', 'layout.conf'), 'r') as f:
+            for line in f:
+                key, _, val = line.partition('=')
+                key, val = key.strip(), val.strip()
+                if key == 'manifest-hashes':
+                    hs = tuple(x for x in val.split() if x in HASH_FUNCS)
+                    hashes = hs or hashes
+                elif key == 'thin-manifests':
+                    thin = val.lower() == 'true'
+    except OSError:
+        pass
+    return hashes, thin
+
+def _list_files(d):
+    """Yields (type, Manifest name, path) for files of an ebuild directory"""
+    for wd, dirs, files in walk(d):
+        dirs[:] = sorted(x for x in dirs if not x.startswith('.') and x != 'CVS')
+        rel = path.relpath(wd, d)
+        for f in sorted(files):
+            if f.startswith('.') or (rel == '.' and f == 'Manifest'):
+                continue
+            if rel == '.':
+                yield ('EBUILD' if f.endswith('.ebuild') else 'MISC'), f, path.join(wd, f)
+            elif rel == 'files' or rel.startswith('files/'):
+                yield 'AUX', path.join(rel[len('files/'):], f) if rel != 'files' else f, path.join(wd, f)
+
+def dist_entries(mpath, distfiles=None):
+    """
+    Reads DIST entries of a Manifest
+    Parameters:
+        mpath - path to the Manifest
+        distfiles - names of the distfiles to keep (all of them, if None)
+    """
+    return {k: v for k, v in read_manifest(mpath).items()
+            if k[0] == 'DIST' and (distfiles is None or k[1] in distfiles)}
+
+def gen_manifest(d, hashes=DEFAULT_HASHES, thin=False, cancel=None, dist=None):
+    """
+    Generates the Manifest of an ebuild directory
+    Hashes of files unchanged (by size and mtime/ctime) since the previous
+    Manifest was written are reused instead of being recomputed.
+    Parameters:
+        d - the ebuild directory
+        hashes - hash functions to use (Manifest notation)
+        thin - whether to generate a thin Manifest (only DIST entries)
+        cancel - an Event, which aborts the generation once set
+        dist - DIST entries to add (as returned by dist_entries)
+    Returns the path to the Manifest, or None if none is required
+    """
+    mpath = path.join(d, 'Manifest')
+    old = read_manifest(mpath)
+    try:
+        mtime = stat(mpath).st_mtime_ns
+    except OSError:
+        mtime = -1
+    entries = {k: v for k, v in old.items() if k[0] == 'DIST'}
+    entries.update(dist or {})
+    if not thin:
+        try:
+            for tp, name, fpath in _list_files(d):
+                if cancel and cancel.is_set():
+                    return Result.Err('Cancelled manifest generation at ' + d)
+                st = stat(fpath)
+                prev = old.get((tp, name))
+                if (prev and prev[0] == st.st_size
+                        and max(st.st_mtime_ns, st.st_ctime_ns) < mtime
+                        and all(x in prev[1] for x in hashes)):
+                    entries[(tp, name)] = (st.st_size, {x: prev[1][x] for x in hashes})
+                else:
+                    entries[(tp, name)] = (st.st_size, hash_file(fpath, hashes, st))
+        except OSError as e:
+            return Result.Err('Failed to generate manifest at {}: {}'.format(d, e))
+    if not entries:
+        if path.exists(mpath):
+            remove(mpath)
+        return Result.Ok(None)
+    tmp = mpath + '.tmp'
+    with open(tmp, 'w') as f:
+        for (tp, name), (size, hs) in sorted(entries.items()):
+            f.write(' '.join([tp, name, str(size)] +
+                ['{} {}'.format(x, hs[x]) for x in sorted(hs)]) + '\n')
+    replace(tmp, mpath)
+    return Result.Ok(mpath)
+
+def gen_manifests(dirs, hashes=DEFAULT_HASHES, thin=False, jobs=None, dist=None):
+    """
+    Generates Manifests for several ebuild directories, using a pool
+    of worker threads (hashing releases the GIL).
+    Once a directory fails, the pending ones are cancelled.
+    Parameters:
+        dirs - a list of ebuild directories
+        hashes, thin - see gen_manifest
+        jobs - number of workers (defaults to the number of CPUs)
+        dist - a mapping from directories to DIST entries to add to their Manifests
+    Returns a list of Manifest paths (or None), in the order of dirs
+    """
+    jobs = jobs or cpu_count() or 1
+    dist = dist or {}
+    if jobs == 1 or len(dirs) < 2:
+        res = []
+        for d in dirs:
+            ret = gen_manifest(d, hashes, thin, dist=dist.get(d))
+            if ret.is_err():
+                return ret
+            res.append(ret.ok())
+        return Result.Ok(res)
+    cancel = Event()
+    res = [None] * len(dirs)
+    with ThreadPoolExecutor(max_workers=min(jobs, len(dirs))) as pool:
+        futures = {pool.submit(gen_manifest, d, hashes, thin, cancel, dist.get(d)): i
+                for i, d in enumerate(dirs)}
+        for future in as_completed(futures):
+            ret = future.result()
+            if ret.is_err():
+                cancel.set()
+                for f in futures:
+                    f.cancel()
+                return ret
+            res[futures[future]] = ret.ok()
+    return Result.Ok(res)
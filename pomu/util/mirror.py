@@ -0,0 +1,195 @@
+"""
+A persistent cache of mirrors of remote repositories (bare git and hg
+clones, rsync trees), keyed by the remote URL.
+A mirror gets created once, and updated incrementally (fetched, pulled,
+rsynced) on later uses; the least recently used mirrors get evicted,
+once the cache grows over its size limit.
+Mirrors are locked with flock, so concurrent pomu processes may share
+the cache: a mirror is created or updated under an exclusive lock, and
+used under a shared one, so that it is not evicted while in use.
+Eviction unlinks the lock file as well, so the lock is only held once
+the locked file is verified to still be the one at the lock path.
+"""
+import fcntl
+import hashlib
+import json
+import os
+from os import path
+from shutil import rmtree
+from time import time
+
+from pomu.util.cache import cache_dir
+from pomu.util.result import Result
+
+MAX_SIZE = 1024 * 1024 * 1024
+
+def dir_size(dpath):
+    """Computes the total size of files in a directory tree"""
+    total = 0
+    for root, _, files in os.walk(dpath):
+        for f in files:
+            try:
+                total += os.lstat(path.join(root, f)).st_size
+            except OSError:
+                pass
+    return total
+
+def holds(fd, lpath):
+    """Checks whether a lock file descriptor refers to the file at a path"""
+    try:
+        return os.fstat(fd).st_ino == os.stat(lpath).st_ino
+    except OSError:
+        return False
+
+class Mirror():
+    """A mirror in use (holding a shared lock on it)"""
+    def __init__(self, url, directory, lock, kind=None, cache=None):
+        self.url = url
+        self.dir = directory
+        self.lock = lock
+        self.kind = kind
+        self.cache = cache
+
+    def release(self):
+        """
+        Releases the mirror (it may get evicted afterwards), recording its size
+        (content gets fetched into mirrors lazily, while they are in use)
+        """
+        if self.lock is not None:
+            if self.cache:
+                try:
+                    self.cache.record(self.kind, self.url)
+                except OSError: # it is just a cache
+                    pass
+            os.close(self.lock) # drops the lock
+            self.lock = None
+            if self.cache:
+                self.cache.evict()
+
+class MirrorCache():
+    """A size-bounded LRU cache of mirrors of remotes, keyed by URL"""
+    def __init__(self, directory=None, max_size=MAX_SIZE, subdir='remotes'):
+        """
+        Parameters:
+            directory - cache directory (a subdirectory of the pomu cache by default)
+            max_size - maximum total size of the mirrors (in bytes)
+            subdir - name of the subdirectory of the pomu cache
+        """
+        self._directory = directory
+        self.max_size = max_size
+        self.subdir = subdir
+
+    @property
+    def directory(self):
+        if not self._directory:
+            self._directory = cache_dir(self.subdir)
+        else:
+            os.makedirs(self._directory, exist_ok=True)
+        return self._directory
+
+    def _paths(self, kind, url):
+        digest = hashlib.sha256((kind + ' ' + url).encode('utf-8')).hexdigest()
+        base = path.join(self.directory, digest)
+        return base, base + '.json', base + '.lock'
+
+    def _meta(self, mpath):
+        try:
+            with open(mpath, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def open(self, kind, url, create, update):
+        """
+        Gets a mirror of a remote, creating it, or updating it
+        Parameters:
+            kind - kind of the mirror (e.g. 'git'), a part of its key
+            url - URL of the remote
+            create - a function, populating the passed directory
+                with a new mirror, and returning whether it has succeeded
+            update - a function, updating the mirror in the passed directory
+                (if it fails, the stale mirror gets used)
+        Returns a Mirror, which shall be released once it is not used anymore
+        """
+        mdir, mpath, lpath = self._paths(kind, url)
+        while True:
+            fd = os.open(lpath, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if not holds(fd, lpath): # it has been evicted meanwhile
+                    os.close(fd)
+                    continue
+                meta = self._meta(mpath)
+                if meta and meta.get('url') == url and path.isdir(mdir):
+                    update(mdir)
+                else:
+                    rmtree(mdir, ignore_errors=True)
+                    if not create(mdir):
+                        rmtree(mdir, ignore_errors=True)
+                        os.close(fd)
+                        return Result.Err('Could not mirror ' + url)
+                self.record(kind, url)
+                fcntl.flock(fd, fcntl.LOCK_SH)
+            except BaseException:
+                os.close(fd)
+                raise
+            # flock conversions are not atomic: the mirror might have been
+            # evicted in between
+            if path.isfile(mpath) and holds(fd, lpath):
+                break
+            os.close(fd)
+        self.evict()
+        return Result.Ok(Mirror(url, mdir, fd, kind, self))
+
+    def record(self, kind, url):
+        """Records the metadata of a mirror (held locked), its size in particular"""
+        mdir, mpath, _ = self._paths(kind, url)
+        # several holders of shared locks may record at once
+        tmp = '{}.{}.tmp'.format(mpath, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({'kind': kind, 'url': url, 'size': dir_size(mdir), 'time': time()}, f)
+        os.replace(tmp, mpath) # its mtime marks the last use
+
+    def evict(self):
+        """
+        Evicts the least recently used mirrors (skipping the ones in use),
+        until the cache fits its limit
+        """
+        entries, total = [], 0
+        for f in os.listdir(self.directory):
+            if not f.endswith('.json'):
+                continue
+            mpath = path.join(self.directory, f)
+            meta = self._meta(mpath)
+            try:
+                used = os.stat(mpath).st_mtime_ns
+            except OSError:
+                continue
+            size = meta.get('size', 0) if meta else 0
+            entries.append((used, size, mpath[:-5]))
+            total += size
+        entries.sort()
+        for _, size, base in entries:
+            if total <= self.max_size:
+                break
+            try: # a mirror without a lock file is being evicted already
+                fd = os.open(base + '.lock', os.O_RDWR)
+            except OSError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError: # in use
+                os.close(fd)
+                continue
+            try:
+                if holds(fd, base + '.lock'):
+                    os.remove(base + '.json')
+                    rmtree(base, ignore_errors=True)
+                    os.remove(base + '.lock')
+                    total -= size
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+mirror_cache = MirrorCache()
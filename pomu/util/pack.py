@@ -0,0 +1,262 @@
+"""
+A reader of git object stores: loose objects, and packfiles with their
+(version 2) .idx indices.
+Packs and indices are mmap-ed: objects are located by a binary search over
+the sorted object names (narrowed down by the fanout table), and inflated
+straight from the mapping; deltified objects are resolved against their
+bases, and recently read objects are cached, since a base is usually
+shared by a chain of deltas.
+"""
+import mmap
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from os import path
+
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+TYPE_NAMES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+
+IDX_MAGIC = b'\377tOc'
+CHUNK = 64 * 1024
+
+class PackError(Exception):
+    pass
+
+def _map(fpath):
+    with open(fpath, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class PackIndex():
+    """A version 2 pack index: maps object names to offsets in the pack"""
+    def __init__(self, ipath):
+        self.map = _map(ipath)
+        if self.map[0:4] != IDX_MAGIC or struct.unpack_from('>I', self.map, 4)[0] != 2:
+            raise PackError('Unsupported pack index: ' + ipath)
+        self.fanout = struct.unpack_from('>256I', self.map, 8)
+        self.count = self.fanout[255]
+        self.names = 8 + 256 * 4
+        self.offsets = self.names + self.count * (20 + 4) # after the names and crc32s
+        self.large_offsets = self.offsets + self.count * 4
+
+    def name(self, i):
+        return self.map[self.names + 20 * i:self.names + 20 * (i + 1)]
+
+    def offset(self, i):
+        off = struct.unpack_from('>I', self.map, self.offsets + 4 * i)[0]
+        if off & 0x80000000:
+            off = struct.unpack_from('>Q', self.map,
+                    self.large_offsets + 8 * (off & 0x7fffffff))[0]
+        return off
+
+    def find(self, sha):
+        """Gets the offset of an object (by its binary name), or None"""
+        lo = self.fanout[sha[0] - 1] if sha[0] else 0
+        hi = self.fanout[sha[0]]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            name = self.name(mid)
+            if name < sha:
+                lo = mid + 1
+            elif name > sha:
+                hi = mid
+            else:
+                return self.offset(mid)
+        return None
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.name(i)
+
+    def close(self):
+        self.map.close()
+
+def apply_delta(base, delta):
+    """Applies a git delta to the base object"""
+    def varint(pos):
+        res = shift = 0
+        while True:
+            c = delta[pos]
+            pos += 1
+            res |= (c & 0x7f) << shift
+            shift += 7
+            if not c & 0x80:
+                return res, pos
+    src_size, pos = varint(0)
+    tgt_size, pos = varint(pos)
+    if src_size != len(base):
+        raise PackError('Delta base size mismatch')
+    res = bytearray()
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op & 0x80: # copy from the base
+            off = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    off |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            res += base[off:off + (size or 0x10000)]
+        elif op: # insert literal data
+            res += delta[pos:pos + op]
+            pos += op
+        else:
+            raise PackError('Invalid delta opcode')
+    if len(res) != tgt_size:
+        raise PackError('Delta result size mismatch')
+    return bytes(res)
+
+class Pack():
+    """A packfile, along with its index"""
+    def __init__(self, ppath, resolve=None, cache_size=64):
+        """
+        Parameters:
+            ppath - path to the .pack file (the .idx shall be next to it)
+            resolve - a function to read (type, data) of a ref-delta base,
+                which is missing from the pack (thin packs), by its hex name
+            cache_size - number of objects to keep in the cache
+        """
+        self.map = _map(ppath)
+        self.index = PackIndex(ppath[:-5] + '.idx')
+        self.resolve = resolve
+        self.cache = OrderedDict() # offset -> (type, data)
+        self.cache_size = cache_size
+        if self.map[0:4] != b'PACK':
+            raise PackError('Not a packfile: ' + ppath)
+
+    def _inflate(self, pos, size):
+        """Inflates size bytes of zlib data at pos (without copying the input)"""
+        d = zlib.decompressobj()
+        view = memoryview(self.map)
+        out = []
+        try:
+            while not d.eof and pos < len(self.map):
+                out.append(d.decompress(view[pos:pos + CHUNK]))
+                pos += CHUNK
+        finally:
+            view.release()
+        data = b''.join(out)
+        if len(data) != size:
+            raise PackError('Object size mismatch')
+        return data
+
+    def read_at(self, offset):
+        """Reads (type, data) of the object at an offset"""
+        if offset in self.cache:
+            self.cache.move_to_end(offset)
+            return self.cache[offset]
+        pos = offset
+        c = self.map[pos]
+        pos += 1
+        typ, size, shift = (c >> 4) & 7, c & 0x0f, 4
+        while c & 0x80:
+            c = self.map[pos]
+            pos += 1
+            size |= (c & 0x7f) << shift
+            shift += 7
+        if typ == OBJ_OFS_DELTA:
+            c = self.map[pos]
+            pos += 1
+            rel = c & 0x7f
+            while c & 0x80:
+                c = self.map[pos]
+                pos += 1
+                rel = ((rel + 1) << 7) | (c & 0x7f)
+            btype, base = self.read_at(offset - rel)
+            res = (btype, apply_delta(base, self._inflate(pos, size)))
+        elif typ == OBJ_REF_DELTA:
+            bname = self.map[pos:pos + 20]
+            pos += 20
+            boff = self.index.find(bname)
+            if boff is not None:
+                btype, base = self.read_at(boff)
+            elif self.resolve:
+                btype, base = self.resolve(bname.hex())
+            else:
+                raise PackError('Missing delta base ' + bname.hex())
+            res = (btype, apply_delta(base, self._inflate(pos, size)))
+        elif typ in TYPE_NAMES:
+            res = (TYPE_NAMES[typ], self._inflate(pos, size))
+        else:
+            raise PackError('Invalid object type {}'.format(typ))
+        self.cache[offset] = res
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return res
+
+    def read(self, sha):
+        """Reads (type, data) of an object by its binary name, or returns None"""
+        off = self.index.find(sha)
+        if off is None:
+            return None
+        return self.read_at(off)
+
+    def close(self):
+        self.cache.clear()
+        self.index.close()
+        self.map.close()
+
+class ObjectStore():
+    """Reads objects of a git repository (its objects directory)"""
+    def __init__(self, objects_dir):
+        self.dir = objects_dir
+        self.packs = None
+
+    def _packs(self):
+        if self.packs is None:
+            pdir = path.join(self.dir, 'pack')
+            try:
+                names = sorted(x for x in os.listdir(pdir) if x.endswith('.pack'))
+            except OSError:
+                names = []
+            self.packs = [Pack(path.join(pdir, x), self.read) for x in names
+                    if path.isfile(path.join(pdir, x[:-5] + '.idx'))]
+        return self.packs
+
+    def read_loose(self, oid):
+        """Reads (type, data) of a loose object, or returns None"""
+        try:
+            with open(path.join(self.dir, oid[:2], oid[2:]), 'rb') as f:
+                raw = zlib.decompress(f.read())
+        except OSError:
+            return None
+        except zlib.error:
+            raise PackError('Corrupt object ' + oid)
+        header, _, data = raw.partition(b'\0')
+        typ, _, _ = header.partition(b' ')
+        return typ.decode('ascii'), data
+
+    def __contains__(self, oid):
+        if path.isfile(path.join(self.dir, oid[:2], oid[2:])):
+            return True
+        sha = bytes.fromhex(oid)
+        return any(pack.index.find(sha) is not None for pack in self._packs())
+
+    def read(self, oid):
+        """Reads (type, data) of an object by its hex name"""
+        res = self.read_loose(oid)
+        if res:
+            return res
+        sha = bytes.fromhex(oid)
+        for pack in self._packs():
+            res = pack.read(sha)
+            if res:
+                return res
+        raise KeyError(oid)
+
+    def invalidate(self):
+        """Rescans the packs (after they have changed)"""
+        self.close()
+
+    def close(self):
+        for pack in self.packs or []:
+            pack.close()
+        self.packs = None
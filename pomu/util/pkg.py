@@ -3,6 +3,9 @@ A set of utility function to manipulate package descriptions
 """
 
 import re
+from collections import namedtuple
+from functools import lru_cache
+from sys import intern
 
 from portage.versions import suffix_value
 
@@ -12,36 +15,62 @@ suffixes = [x[0] for x in sorted(suffix_value.items(), key=lambda x:x[1])]
 
 def ver_str(vernum, suff, rev):
     """Gets the string representation of the version (specified by number, suffix and rev)"""
-    return vernum + (suff if suff else '') + ('-' + rev if rev else '')
+    if not vernum:
+        return None
+    return vernum + ('_' + suff if suff else '') + ('-' + rev if rev else '')
 
-def cpv_split(pkg, unified_ver=True):
-    """
-    Extracts category, name, version number, suffix, revision from a package descriptor
-    e.g. dev-libs/openssl-0.9.8z_p8-r100 -> dev-libs, openssl, 0.9.8z, p8, r100
-    """
+REVISION = re.compile(r'-r\d+$')
+SUFFIX = re.compile(r'_({})(\d*)$'.format('|'.join(suffixes)))
+VERSION = re.compile(r'-(\d+(\.\d+)*)([a-z])?$')
+
+CpvColumns = namedtuple('CpvColumns', 'categories names versions')
+
+@lru_cache(maxsize=8192)
+def _cpv_split(pkg):
     # dev-libs/openssl-0.9.8z_p8-r100
     category, _, pkg = pkg.rpartition('/') # category may be omitted
     # openssl-0.9.8z_p8-r100
-    m = re.search(r'-r\d+$', pkg) # revision is optional
+    m = REVISION.search(pkg) # revision is optional
     if m:
         pkg, rev = pivot(pkg, m.start(0))
     else:
         rev = None
     # openssl-0.9.8z_p8
-    m = re.search(r'_({})(\d*)$'.format('|'.join(suffixes)), pkg)
+    m = SUFFIX.search(pkg)
     if m:
         pkg, suff = pivot(pkg, m.start(0))
     else:
         suff = None
     # openssl-0.9.8z
-    m = re.search(r'-(\d+(\.\d+)*)([a-z])?$', pkg)
+    m = VERSION.search(pkg)
     if m:
         pkg, vernum = pivot(pkg, m.start(0))
     else:
         vernum = None
     # openssl
-    name = pkg
+    return category, pkg, vernum, suff, rev
+
+def cpv_split(pkg, unified_ver=True):
+    """
+    Extracts category, name, version number, suffix, revision from a package descriptor
+    e.g. dev-libs/openssl-0.9.8z_p8-r100 -> dev-libs, openssl, 0.9.8z, p8, r100
+    """
+    category, name, vernum, suff, rev = _cpv_split(pkg)
     if unified_ver:
         return category, name, ver_str(vernum, suff, rev)
     else:
         return category, name, vernum, suff, rev
+
+def cpv_split_many(pkgs):
+    """
+    Splits package descriptors into columns of categories, names and versions
+    (categories and names are interned, as they repeat a lot)
+    """
+    split = _cpv_split.__wrapped__ # not to flush the memo with one-off atoms
+    res = CpvColumns([], [], [])
+    for pkg in pkgs:
+        category, name, vernum, suff, rev = split(pkg)
+        res.categories.append(intern(category))
+        res.names.append(intern(name))
+        res.versions.append(ver_str(vernum, suff, rev))
+    return res
@@ -3,46 +3,275 @@ A set of utility functions to query portage repos
 """
 
 import os
+import re
 
+from functools import lru_cache
 from os import path
 
 from portage.versions import best
 
 from pomu.repo.repo import portage_repos, portage_repo_path
+from pomu.util.cache import cache_dir
+from pomu.util.git import head_rev
 from pomu.util.pkg import cpv_split, ver_str
 
+METADATA_KEYS = ('EAPI', 'KEYWORDS', 'SLOT')
+
+# a static SLOT assignment of an ebuild
+SLOT_LINE = re.compile(r'^SLOT=(["\']?)([\w+./-]*)\1\s*(?:#.*)?$', re.M)
+
 misc_dirs = ['profiles', 'licenses', 'eclass', 'metadata', 'distfiles', 'packages', 'scripts', '.git']
 
-def best_ver(repo, category, name, ver=None):
-    """Gets the best (newest) version of a package in the repo"""
+def _mtime(p):
+    try:
+        return os.stat(p).st_mtime_ns
+    except OSError:
+        return 0
+
+def _list_versions(pkgdir, name):
+    """Lists versions of the ebuilds in a package directory"""
+    pref = name + '-'
+    try:
+        return sorted(x[len(pref):-7] for x in os.listdir(pkgdir)
+                if x.endswith('.ebuild') and x.startswith(pref))
+    except OSError:
+        return []
+
+class RepoIndex():
+    """
+    A persistent (category, name) -> versions index of a portage repository.
+    The index is invalidated by the git HEAD of the repository (if it is
+    a git checkout) or by the mtimes of its root and category directories,
+    while every entry is validated by the mtime of its package directory.
+    """
+    def __init__(self, repo, location):
+        """
+        Parameters:
+            repo - name of the repository
+            location - path to the repository
+        """
+        self.repo = repo
+        self.location = location
+        self.file = path.join(cache_dir('portage'), repo + '.idx')
+        self.names = {} # name -> {category: (mtime, [versions])}
+        self.dirty = False
+        if not self.load():
+            self.rebuild()
+
+    def stamp(self, categories):
+        rev = head_rev(self.location)
+        if rev:
+            return 'git ' + rev
+        return 'mtime {} {}'.format(_mtime(self.location),
+                sum(_mtime(path.join(self.location, c)) for c in categories))
+
+    def categories(self):
+        return set(c for cats in self.names.values() for c in cats)
+
+    def load(self):
+        """Loads the persistent index, returns False if it is stale"""
+        try:
+            with open(self.file, 'r') as f:
+                stamp = f.readline().rstrip('\n')
+                for line in f:
+                    category, name, mtime, vers = line.rstrip('\n').split('\t')
+                    self.names.setdefault(name, {})[category] = (int(mtime), vers.split())
+        except (OSError, ValueError):
+            self.names = {}
+            return False
+        if stamp != self.location + ' ' + self.stamp(self.categories()):
+            self.names = {}
+            return False
+        return True
+
+    def rebuild(self):
+        """Indexes the repository tree"""
+        self.names = {}
+        try:
+            cats = set(os.listdir(self.location)) - set(misc_dirs)
+        except OSError:
+            cats = set()
+        for category in cats:
+            cpath = path.join(self.location, category)
+            if not path.isdir(cpath):
+                continue
+            for name in os.listdir(cpath):
+                pkgdir = path.join(cpath, name)
+                vers = _list_versions(pkgdir, name)
+                if vers:
+                    self.names.setdefault(name, {})[category] = (_mtime(pkgdir), vers)
+        self.dirty = True
+        self.save()
+
+    def save(self):
+        """Writes the index to the disk, if it has been modified"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        try:
+            tmp = self.file + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(self.location + ' ' + self.stamp(self.categories()) + '\n')
+                for name, cats in self.names.items():
+                    for category, (mtime, vers) in cats.items():
+                        f.write('{}\t{}\t{}\t{}\n'.format(category, name, mtime, ' '.join(vers)))
+            os.replace(tmp, self.file)
+        except OSError: # the index is just a cache
+            pass
+
+    def _refresh(self, category, name):
+        """Revalidates an entry against the mtime of the package directory"""
+        pkgdir = path.join(self.location, category, name)
+        cats = self.names.get(name, {})
+        mtime = _mtime(pkgdir)
+        if category in cats and cats[category][0] == mtime:
+            return cats[category][1]
+        vers = _list_versions(pkgdir, name) if mtime else []
+        if vers:
+            self.names.setdefault(name, {})[category] = (mtime, vers)
+        elif category in cats:
+            del cats[category]
+        else:
+            return []
+        self.dirty = True
+        return vers
+
+    def versions(self, category, name):
+        """Lists versions of a package"""
+        res = self._refresh(category, name)
+        self.save()
+        return res
+
+    def lookup(self, name, category=None):
+        """Lists (category, versions) pairs for a package name"""
+        if category:
+            vers = self.versions(category, name)
+            return [(category, vers)] if vers else []
+        res = []
+        for cat in list(self.names.get(name, {})):
+            vers = self._refresh(cat, name)
+            if vers:
+                res.append((cat, vers))
+        self.save()
+        return res
+
+_indices = {}
+
+def repo_index(repo):
+    """Gets the (memoized) index of a portage repository"""
+    location = portage_repo_path(repo)
+    if repo not in _indices or _indices[repo].location != location:
+        _indices[repo] = RepoIndex(repo, location)
+    return _indices[repo]
+
+@lru_cache(maxsize=4096)
+def _read_cache_entry(epath, keys=METADATA_KEYS):
+    """
+    Reads the requested keys of an md5-cache entry (KEY=value lines),
+    stopping as soon as all of them are found
+    """
+    res = {}
+    try:
+        with open(epath, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                key, _, val = line.partition('=')
+                if key in keys:
+                    res[key] = val.rstrip('\n')
+                    if len(res) == len(keys):
+                        break
+    except OSError:
+        return None
+    return res
+
+def ebuild_metadata(repo, category, name, ver):
+    """
+    Gets metadata (EAPI, KEYWORDS, SLOT) of an ebuild from the md5-cache
+    of the repo (the returned dictionary shall not be modified)
+    Returns None if the ebuild is not in the cache
+    """
+    return _read_cache_entry(path.join(portage_repo_path(repo), 'metadata',
+        'md5-cache', category, '{}-{}'.format(name, ver)))
+
+@lru_cache(maxsize=4096)
+def _parse_slot(epath):
+    """Reads a static SLOT assignment of an ebuild (or None)"""
+    try:
+        with open(epath, 'r', encoding='utf-8', errors='replace') as f:
+            m = SLOT_LINE.search(f.read())
+    except OSError:
+        return None
+    return m.group(2) if m else None
+
+def ebuild_slot(repo, category, name, ver):
+    """
+    Gets the slot (without the subslot) of an ebuild, from the md5-cache,
+    or (if the ebuild is not in the cache) from the ebuild itself;
+    None if unknown (e.g. it is computed)
+    """
+    meta = ebuild_metadata(repo, category, name, ver)
+    if meta is not None:
+        slot = meta.get('SLOT', '0')
+    else:
+        slot = _parse_slot(path.join(portage_repo_path(repo), category, name,
+            '{}-{}.ebuild'.format(name, ver)))
+        if slot is None:
+            return None
+    return slot.partition('/')[0] or '0'
+
+def ebuild_distfiles(repo, category, name, ver):
+    """
+    Lists names of the distfiles of an ebuild (under any USE conditionals),
+    by its SRC_URI in the md5-cache
+    Returns None if the ebuild is not in the cache
+    """
+    meta = _read_cache_entry(path.join(portage_repo_path(repo), 'metadata',
+        'md5-cache', category, '{}-{}'.format(name, ver)), ('SRC_URI',))
+    if meta is None:
+        return None
+    res, toks = set(), meta.get('SRC_URI', '').split()
+    for i, tok in enumerate(toks):
+        if tok in ('(', ')', '||', '->') or tok.endswith('?'):
+            continue
+        if i + 1 < len(toks) and toks[i + 1] == '->': # renamed
+            continue
+        res.add(tok.rpartition('/')[2])
+    return res
+
+def _best(category, name, vers):
+    b = best(['{}/{}-{}'.format(category, name, v) for v in vers])
+    return cpv_split(b)[2] if b else None
+
+def _candidates(repo, category, name, vers, ver=None, slot=None):
+    """Filters versions of a package by version and slot"""
     if ver:
-        return ver if path.exists(path.join(portage_repo_path(repo),
-            category, name, '{}-{}.ebuild'.format(name, ver))) else None
-    ebuilds = [category + '/' + name + x[len(name):-7] for x in
-            os.listdir(path.join(portage_repo_path(repo), category, name))
-            if x.endswith('.ebuild')]
-    if not ebuilds:
+        vers = [ver] if ver in vers else []
+    if slot:
+        slot = slot.partition('/')[0]
+        vers = [v for v in vers if ebuild_slot(repo, category, name, v) == slot]
+    return vers
+
+def best_ver(repo, category, name, ver=None, slot=None):
+    """Gets the best (newest) version of a package (in a slot) in the repo"""
+    vers = _candidates(repo, category, name,
+            repo_index(repo).versions(category, name), ver, slot)
+    if not vers:
         return None
-    cat, name, ver = cpv_split(best(ebuilds))
-    return ver
+    return vers[0] if ver else _best(category, name, vers)
 
 def repo_pkgs(repo, category, name, ver=None, slot=None):
-    """List of package occurences in the repo"""
+    """
+    List of package occurences in the repo
+    (as (repo, category, name, best version, slot) tuples)
+    """
     if not repo:
         res = []
         for r in portage_repos():
             res.extend(repo_pkgs(r, category, name, ver, slot))
         return res
-    if category:
-        if path.exists(path.join(portage_repo_path(repo), category, name)):
-            res = best_ver(repo, category, name, ver)
-            return [(repo, category, name, res)] if res else []
-        return []
-    rpath = portage_repo_path(repo)
-    dirs = set(os.listdir(rpath)) - set(misc_dirs)
     res = []
-    for d in dirs:
-        if path.isdir(path.join(rpath, d, name)):
-            res.append((repo, d, name, best_ver(repo, d, name, ver)))
+    for cat, vers in repo_index(repo).lookup(name, category):
+        vers = _candidates(repo, cat, name, vers, ver, slot)
+        bv = (vers[0] if ver else _best(cat, name, vers)) if vers else None
+        if bv:
+            res.append((repo, cat, name, bv, ebuild_slot(repo, cat, name, bv) or '0'))
     return res
-
@@ -2,37 +2,126 @@
 Utilities for remotes
 """
 
+import re
+from bisect import bisect_left
+
 from portage.versions import best
 
-from pomu.util.pkg import ver_str, cpv_split
+from pomu.util.pkg import cpv_split, suffixes
 from pomu.util.portage import misc_dirs
 
 from pomu.util.result import Result
 
+# /category/name/name-version.ebuild, outside of the special directories
+EBUILD_PATH = re.compile(
+        r'^/(?!(?:{})/)([^/\n]+)/([^/\n]+)/\2-(\d+(?:\.\d+)*[a-z]?(?:_(?:{})\d*)?(?:-r\d+)?)\.ebuild$'
+        .format('|'.join(re.escape(x) for x in misc_dirs), '|'.join(suffixes)), re.M)
+
+class CpvList(list):
+    """
+    A list of (category, name, version) tuples, indexed by package name
+    (it is not meant to be modified)
+    """
+    def __init__(self, cpvs=()):
+        super().__init__(cpvs)
+        self.names = {}
+        for cpv in self:
+            self.names.setdefault(cpv[1], []).append(cpv)
+
+    def find(self, name, category=None):
+        """Lists cpvs of a package"""
+        return [x for x in self.names.get(name, ()) if not category or x[0] == category]
+
 def filelist_to_cpvs(tree):
     """Converts a list of files to list of cpvs"""
-    res = []
-    for opath in tree:
-        comps = opath.split('/')[1:]
-        if (opath.endswith('/') or
-            any(opath.startswith('/' + x + '/') for x in misc_dirs) or
-            len(comps) != 3 or
-            not comps[2].endswith('.ebuild')):
-            continue
-        category, name, ebuild = comps[0], comps[1], comps[2][:-7]
-        c, n, ver = cpv_split(ebuild)
-        if not category or n != name:
-            continue
-        res.append((category, name, ver))
-    return res
+    return CpvList(EBUILD_PATH.findall('\n'.join(tree)))
 
 def get_full_cpv(cpvs, name, category=None, version=None):
-    cpvl = filter(lambda x: x[1] == name and (not category or x[0] == category), cpvs)
+    if isinstance(cpvs, CpvList):
+        cpvl = cpvs.find(name, category)
+    else:
+        cpvl = [x for x in cpvs if x[1] == name and (not category or x[0] == category)]
     if not cpvl: return Result.Err()
     if version:
-        cpvl = list(filter(lambda x: x[2] == version, cpvl))[:1]
+        cpvl = [x for x in cpvl if x[2] == version][:1]
     b = best(list('{}/{}-{}'.format(c, n, v) for c, n, v in cpvl))
     if b:
         cat, name, ver = cpv_split(b)
         return Result.Ok((cat, name, ver))
     return Result.Err()
+
+class RemoteTree():
+    """
+    An index of the tree of a remote: maps paths (directories ending with
+    a slash) to object ids, and directories to their contents.
+    Paths are kept in a sorted list, so that looking up a path is a binary
+    search, and a directory subtree is a contiguous range of it; object ids
+    are packed into a single byte array (20 bytes per path), to keep the
+    index compact for large overlays.
+    """
+    NO_OID = bytes(20)
+
+    def __init__(self, entries):
+        """
+        Parameters:
+            entries - iterable of paths, or of (path, hex object id) pairs,
+                parent directories get added implicitly
+        """
+        oids = {}
+        for entry in entries:
+            tpath, oid = entry if isinstance(entry, tuple) else (entry, None)
+            if not tpath.strip('/'):
+                continue
+            tpath = '/' + tpath.lstrip('/')
+            oids[tpath] = oid or oids.get(tpath)
+            parent = tpath.rstrip('/').rpartition('/')[0]
+            while parent and parent + '/' not in oids:
+                oids[parent + '/'] = None
+                parent = parent.rpartition('/')[0]
+        self.paths = sorted(oids)
+        self.oids = bytearray(20 * len(self.paths))
+        for i, tpath in enumerate(self.paths):
+            if oids[tpath]:
+                self.oids[20 * i:20 * (i + 1)] = bytes.fromhex(oids[tpath])
+
+    def _find(self, tpath):
+        i = bisect_left(self.paths, tpath)
+        return i if i < len(self.paths) and self.paths[i] == tpath else None
+
+    def __contains__(self, tpath):
+        return self._find(tpath) is not None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def oid(self, tpath):
+        """Gets the object id of a path (or None)"""
+        i = self._find(tpath)
+        if i is None:
+            return None
+        oid = bytes(self.oids[20 * i:20 * (i + 1)])
+        return oid.hex() if oid != self.NO_OID else None
+
+    def _range(self, tdir):
+        # all the paths starting with tdir (ending with '/') sort before tdir[:-1] + '0'
+        return (bisect_left(self.paths, tdir),
+                bisect_left(self.paths, tdir[:-1] + chr(ord('/') + 1)))
+
+    def subtree(self, tdir):
+        """Lists paths under a directory (relative to it, the directory itself being '')"""
+        lo, hi = self._range(tdir)
+        return [x[len(tdir):] for x in self.paths[lo:hi]]
+
+    def children(self, tdir):
+        """Lists immediate children of a directory"""
+        lo, hi = self._range(tdir)
+        res = []
+        i = lo + 1 if lo < hi and self.paths[lo] == tdir else lo
+        while i < hi:
+            res.append(self.paths[i][len(tdir):])
+            # skip the contents of subdirectories
+            i = self._range(self.paths[i])[1] if self.paths[i].endswith('/') else i + 1
+        return res
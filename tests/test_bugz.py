@@ -0,0 +1,179 @@
+import shutil
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from tempfile import mkdtemp
+from unittest import mock
+
+from xmlrpc.client import Binary, Fault
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+import pomu.source.bugz as bugz
+from pomu.source import dispatcher
+from pomu.source.bugz import Attachment, BzEbuild, fetch_attachments, fetch_bugs
+from pomu.util.http import http_cache
+from pomu.util.query import QueryContext
+
+ATTACHMENTS = {
+    1: [(10, 'foo-1.ebuild', 'EAPI=6\n'), (11, 'foo.patch', '--- a\n+++ b\n')],
+    2: [(20, 'bar-2.ebuild', 'EAPI=7\n')],
+}
+COMMENTS = {
+    1: ['See https://example.org/foo-1.ebuild.', 'Thanks'],
+    2: [],
+}
+
+def att_data(att_id):
+    return next(x[2] for atts in ATTACHMENTS.values() for x in atts if x[0] == att_id)
+
+class Bugzilla():
+    """A bugzilla XML-RPC stub"""
+    def get(self, params):
+        for bug_id in params['ids']:
+            if bug_id not in ATTACHMENTS:
+                raise Fault(101, 'Bug #{} does not exist.'.format(bug_id))
+        return {'bugs': [{'id': x} for x in params['ids']]}
+
+    def attachments(self, params):
+        if 'attachment_ids' in params:
+            return {'bugs': {}, 'attachments': {
+                str(x): {'id': x, 'data': Binary(att_data(x).encode('utf-8'))}
+                for x in params['attachment_ids']}}
+        return {'attachments': {}, 'bugs': {
+            str(x): [{'id': a, 'file_name': f} for a, f, _ in ATTACHMENTS[x]]
+            for x in params['ids']}}
+
+    def comments(self, params):
+        return {'comments': {}, 'bugs': {
+            str(x): {'comments': [{'text': t} for t in COMMENTS[x]]}
+            for x in params['ids']}}
+
+class CountingHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/xmlrpc.cgi',)
+    requests = 0
+
+    def do_POST(self):
+        CountingHandler.requests += 1
+        super().do_POST()
+
+class FileHandler(BaseHTTPRequestHandler):
+    """Serves the files linked from the comments"""
+    requests = 0
+
+    def do_GET(self):
+        FileHandler.requests += 1
+        body = b'EAPI=6\n# linked\n'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class SelectAll():
+    """Selects all the offered files (with their default paths)"""
+    def __init__(self, items):
+        self.items = items
+
+    def run(self):
+        return [(name, x, name if name.endswith('.ebuild') else 'files/' + name)
+                for name, x in self.items]
+
+class BugzillaTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SimpleXMLRPCServer(('127.0.0.1', 0), CountingHandler,
+                logRequests=False, allow_none=True)
+        cls.server.register_multicall_functions()
+        bz = Bugzilla()
+        for f in ['get', 'attachments', 'comments']:
+            cls.server.register_function(getattr(bz, f), 'Bug.' + f)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = 'http://127.0.0.1:{}/xmlrpc.cgi'.format(cls.server.server_address[1])
+        cls.files = HTTPServer(('127.0.0.1', 0), FileHandler)
+        threading.Thread(target=cls.files.serve_forever, daemon=True).start()
+        cls.link = 'http://127.0.0.1:{}/foo-fix.patch'.format(cls.files.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.files.shutdown()
+        cls.files.server_close()
+
+    def setUp(self):
+        CountingHandler.requests = FileHandler.requests = 0
+        self.cache_dir = http_cache._directory = mkdtemp()
+
+    def tearDown(self):
+        http_cache._directory = None
+        shutil.rmtree(self.cache_dir)
+
+    def testFetchBugs(self):
+        bugs = fetch_bugs(['1', '2'], self.base).expect()
+        self.assertEqual(CountingHandler.requests, 1)
+        self.assertEqual([x.file_name for x in bugs[1][:2]], ['foo-1.ebuild', 'foo.patch'])
+        self.assertEqual(bugs[1][2:], ['https://example.org/foo-1.ebuild'])
+        self.assertEqual([x.id for x in bugs[2]], [20])
+        self.assertTrue(all(x.data is None for x in bugs[1][:2] + bugs[2]))
+
+    def testMissingBug(self):
+        self.assertTrue(fetch_bugs(['1', '3'], self.base).is_err())
+
+    def testFetchAttachments(self):
+        bugs = fetch_bugs(['1', '2'], self.base).expect()
+        selected = [bugs[1][0], bugs[2][0]]
+        fetch_attachments(selected).expect()
+        self.assertEqual(CountingHandler.requests, 2)
+        fresh = Attachment(10, 'foo-1.ebuild', self.base)
+        self.assertEqual(fresh(), 'EAPI=6\n')
+        self.assertEqual(CountingHandler.requests, 2)
+        self.assertEqual([x() for x in selected], ['EAPI=6\n', 'EAPI=7\n'])
+        self.assertIsNone(bugs[1][1].data)
+        fetch_attachments(selected).expect()
+        self.assertEqual(CountingHandler.requests, 2)
+        fresh = Attachment(10, 'foo-1.ebuild', self.base)
+        self.assertEqual(fresh(), 'EAPI=6\n')
+        self.assertEqual(CountingHandler.requests, 2)
+
+    def testParseBugs(self):
+        with mock.patch.object(bugz, 'CLIENT_BASE', self.base), \
+                mock.patch.object(bugz, 'EditSelectPrompt', SelectAll), \
+                mock.patch.dict(COMMENTS, {1: ['See ' + self.link + '.']}), \
+                QueryContext(category='app-misc', name='foo', version='1', slot='0'):
+            dispatcher.invalidate()
+            self.assertTrue(dispatcher.get_package('bug:1,2').is_err())
+            pkgs = dispatcher.get_packages('bug:1,2').expect()
+        # one multicall for the metadata, and the attachments of each bug
+        self.assertEqual(CountingHandler.requests, 3)
+        self.assertEqual(bugz.prefetched, {})
+        self.assertEqual(FileHandler.requests, 1)
+        self.assertEqual([x.backend.bug_id for x in pkgs], ['1', '2'])
+        self.assertEqual(pkgs[0].backend.sources, {
+            'app-misc/foo/foo-1.ebuild': 10,
+            'app-misc/foo/files/foo.patch': 11,
+            'app-misc/foo/files/foo-fix.patch': self.link})
+        self.assertEqual(pkgs[0].filemap['app-misc/foo/files/foo-fix.patch'],
+                'EAPI=6\n# linked\n')
+        self.assertEqual(pkgs[1].filemap, {'app-misc/foo/bar-2.ebuild': 'EAPI=7\n'})
+
+    def testMetadata(self):
+        sources = {'app-misc/foo/foo-1.ebuild': 10, 'app-misc/foo/files/foo-fix.patch': self.link}
+        pkgdir = mkdtemp()
+        try:
+            BzEbuild('1', None, 'app-misc', 'foo', '1', '0', sources).write_meta(pkgdir)
+            pkg = BzEbuild.from_data_dir(pkgdir).expect()
+        finally:
+            shutil.rmtree(pkgdir)
+        self.assertEqual(pkg.sources, sources)
+        # the files linked from the comments are fetched along with the attachments
+        with mock.patch.object(bugz, 'CLIENT_BASE', self.base):
+            fetched = pkg.fetch().expect()
+        self.assertEqual(fetched.filemap, {'app-misc/foo/foo-1.ebuild': 'EAPI=6\n',
+            'app-misc/foo/files/foo-fix.patch': 'EAPI=6\n# linked\n'})
+        missing = BzEbuild('1', None, 'app-misc', 'foo', '1', '0',
+                {'app-misc/foo/files/a.patch': 'http://127.0.0.1:1/a.patch'})
+        self.assertEqual(missing.fetch().err(), 'Could not fetch http://127.0.0.1:1/a.patch')
@@ -0,0 +1,122 @@
+import os
+import shutil
+import unittest
+
+from os import path, makedirs
+from tempfile import mkdtemp
+from unittest import mock
+
+import pomu.repo.config as config
+from pomu.repo.config import repo_config
+
+class RepoConfigTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.conf = path.join(self.dir, 'etc', 'portage', 'repos.conf')
+        self.environ = dict(os.environ)
+        os.environ['PORTAGE_CONFIGROOT'] = self.dir
+        # the system-wide defaults are not read from the host
+        self.patches = [mock.patch.object(config, 'GLOBAL_REPOS_CONF',
+                path.join(self.dir, 'global.conf')),
+            mock.patch.object(config, '_from_portage', return_value=[('portage', '/')])]
+        for p in self.patches:
+            p.start()
+        repo_config.invalidate()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        repo_config.invalidate()
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.dir)
+
+    def location(self, name):
+        res = path.join(self.dir, 'repos', name)
+        makedirs(res, exist_ok=True)
+        return res
+
+    def write_conf(self, fname, text):
+        makedirs(self.conf, exist_ok=True)
+        with open(path.join(self.conf, fname), 'w') as f:
+            f.write(text)
+
+    def repo(self, name, priority=None):
+        res = '[{}]\nlocation = {}\n'.format(name, self.location(name))
+        if priority is not None:
+            res += 'priority = {}\n'.format(priority)
+        return res
+
+    def names(self):
+        return [name for name, _ in repo_config.repositories()]
+
+    def testPriority(self):
+        self.write_conf('gentoo.conf', '[DEFAULT]\nmain-repo = gentoo\n\n' + self.repo('gentoo'))
+        self.write_conf('overlays.conf', self.repo('zzz') + self.repo('bbb', 10)
+                + self.repo('aaa', 10) + self.repo('ccc', -5) + self.repo('bad', 'high'))
+        # the main repository goes first, ties are broken by the name
+        self.assertEqual(self.names(), ['gentoo', 'ccc', 'bad', 'zzz', 'aaa', 'bbb'])
+        self.assertEqual(repo_config.location('aaa'), self.location('aaa'))
+        self.assertIsNone(repo_config.location('missing'))
+
+    def testMainRepo(self):
+        self.write_conf('a.conf', '[DEFAULT]\nmain-repo = gentoo\n\n' + self.repo('gentoo', 100)
+                + self.repo('other'))
+        # an explicit priority overrides the main repository default
+        self.assertEqual(self.names(), ['other', 'gentoo'])
+        with open(config.GLOBAL_REPOS_CONF, 'w') as f:
+            f.write('[DEFAULT]\nmain-repo = gentoo\n\n' + self.repo('gentoo'))
+        self.write_conf('a.conf', self.repo('other'))
+        repo_config.invalidate()
+        self.assertEqual(self.names(), ['gentoo', 'other'])
+
+    def testDirectory(self):
+        self.write_conf('a.conf', self.repo('foo') + '[nowhere]\nlocation = /nonexistent\n')
+        self.write_conf('b.conf', '[foo]\nlocation = {}/\n'.format(self.location('bar')))
+        self.write_conf('.hidden', self.repo('hidden'))
+        self.write_conf('c.conf~', self.repo('backup'))
+        makedirs(path.join(self.conf, 'sub'))
+        self.write_conf(path.join('sub', 'd.conf'), self.repo('sub'))
+        # later files override the earlier ones
+        self.assertEqual(repo_config.repositories(),
+                [('foo', self.location('bar')), ('sub', self.location('sub'))])
+
+    def testReload(self):
+        self.write_conf('a.conf', self.repo('foo'))
+        self.assertEqual(self.names(), ['foo'])
+        self.write_conf('b.conf', self.repo('bar'))
+        # the files are not checked again for a while
+        self.assertEqual(self.names(), ['foo'])
+        repo_config.invalidate()
+        self.assertEqual(self.names(), ['bar', 'foo'])
+        os.remove(path.join(self.conf, 'a.conf'))
+        with mock.patch.object(repo_config, 'ttl', 0):
+            self.assertEqual(self.names(), ['bar'])
+
+    def testChecks(self):
+        self.write_conf('a.conf', self.repo('foo'))
+        with mock.patch.object(config, 'stat', wraps=os.stat) as stat:
+            for _ in range(100):
+                repo_config.location('foo')
+            self.assertEqual(stat.call_count, 2) # repos.conf/a.conf, repos.conf
+            # another configuration root is checked right away
+            os.environ['PORTAGE_CONFIGROOT'] = path.join(self.dir, 'other')
+            self.assertIsNone(repo_config.location('foo'))
+
+    def testPortageFallback(self):
+        # no user repos.conf at all
+        self.assertEqual(repo_config.repositories(), [('portage', '/')])
+        self.assertEqual(config._from_portage.call_count, 1)
+        repo_config.repositories()
+        self.assertEqual(config._from_portage.call_count, 1)
+        # an empty repos.conf directory
+        makedirs(self.conf)
+        repo_config.invalidate()
+        self.assertEqual(self.names(), ['portage'])
+        # an unparsable one
+        self.write_conf('a.conf', 'location = nowhere\n')
+        repo_config.invalidate()
+        self.assertEqual(self.names(), ['portage'])
+        self.write_conf('a.conf', self.repo('foo'))
+        repo_config.invalidate()
+        self.assertEqual(self.names(), ['foo'])
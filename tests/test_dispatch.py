@@ -8,6 +8,7 @@ from pomu.package import Package
 from pomu.repo.init import init_plain_repo
 from pomu.repo.repo import Repository, pomu_active_repo
 from pomu.source import dispatcher
+from pomu.source.manager import PackageDispatcher
 from pomu.util.result import Result
 
 @dispatcher.source
@@ -20,7 +21,16 @@ class DummySource():
 
     @classmethod
     def fetch_package(cls, uri):
-        return Package('test', cls.path, backend=cls, category='test')
+        return Result.Ok(Package('test', cls.path, backend=cls, category='test'))
+
+@dispatcher.source
+class CountingSource():
+    calls = 0
+
+    @dispatcher.handler(prefix='count:')
+    def parse(uri):
+        CountingSource.calls += 1
+        return Result.Ok(uri[6:])
 
 
 class DispatcherTests(unittest.TestCase):
@@ -37,14 +47,131 @@ class DispatcherTests(unittest.TestCase):
         self.assertTrue(dispatcher.get_package_source('test').is_err())
         self.assertTrue(dispatcher.get_package('sys-apps/portage').is_ok())
 
+    def testResolutionCache(self):
+        CountingSource.calls = 0
+        self.assertEqual(dispatcher.resolve('count:x').unwrap(), (CountingSource, 'x'))
+        self.assertEqual(dispatcher.resolve(' count:x\n').unwrap(), (CountingSource, 'x'))
+        self.assertEqual(CountingSource.calls, 1)
+        dispatcher.invalidate('count:x')
+        dispatcher.resolve('count:x').unwrap()
+        self.assertEqual(CountingSource.calls, 2)
+        # inner whitespace is significant
+        self.assertEqual(dispatcher.resolve('count:a  b').unwrap(), (CountingSource, 'a  b'))
+        self.assertEqual(dispatcher.resolve('count:a b').unwrap(), (CountingSource, 'a b'))
+        self.assertEqual(CountingSource.calls, 4)
+
     def testFetch(self):
         pkg = dispatcher.get_package('/test').unwrap()
         self.assertEqual(pkg.files, [('test', 'test.ebuild')])
 
+    def testFetchError(self):
+        from pomu.source.url import URLEbuild, URLGrabberSource
+        # nothing listens on the port
+        pkg = URLEbuild('http://127.0.0.1:1/foo-1.ebuild', None, 'app-misc', 'foo', '1', '0')
+        res = URLGrabberSource.fetch_package(pkg)
+        self.assertEqual(res.err(), 'Could not fetch http://127.0.0.1:1/foo-1.ebuild')
+        self.assertIsNone(pkg.contents)
+
     def tearDown(self):
         shutil.rmtree(self.source_path)
 
 
+class RoutingTests(unittest.TestCase):
+    """
+    Routes specs through a dispatcher, whose handlers mimic the ones of the
+    sources (with their prefixes and recognizers), but do no I/O
+    """
+    SPECS = ['dev-libs/openssl', 'openssl::gentoo', 'dev-libs/openssl-1.0:0::gentoo',
+        '/var/db/repos/gentoo/dev-libs/foo/foo-1.ebuild', './foo-1.ebuild',
+        '/tmp/foo-1.ebuild', 'https://bugs.gentoo.org/123', 'http://paste.example.org/x',
+        '123', 'bug:123', 'bug:https://bugs.gentoo.org/1', 'portage:dev-libs/foo',
+        'portage/gentoo:foo', 'fs:/tmp/foo-1.ebuild', 'url:https://example.org/x']
+
+    def setUp(self):
+        from pomu.source.bugz import BUG_LINK
+        from pomu.source.portage import ATOM, looks_like_path
+        from pomu.util.pkg import cpv_split
+        # packages, which are in the (mocked) portage repositories
+        in_repo = lambda uri: cpv_split(uri.partition(':')[0])[1] in ('openssl', 'foo')
+        self.calls = {}
+        self.dispatcher = PackageDispatcher()
+        is_link = lambda uri: uri.startswith(('http://', 'https://'))
+        self.add('portage.spec', 5, lambda uri: ATOM.match(uri) and in_repo(uri),
+                recognize=ATOM.match)
+        self.add('portage.full', 1000, lambda uri: uri.startswith('portage'),
+                prefix=('portage:', 'portage/'))
+        self.add('portage.path', 4, lambda uri: uri.startswith('/var/db/repos/'),
+                recognize=looks_like_path)
+        self.add('fs.path', 5, lambda uri: uri.startswith(('/', '.')) and uri.endswith('.ebuild'),
+                recognize=lambda uri: uri.endswith('.ebuild'))
+        self.add('fs.full', 1000, lambda uri: uri.startswith('fs:'), prefix='fs:')
+        self.add('url.link', 5, is_link, recognize=is_link)
+        self.add('url.full', 1000, lambda uri: uri.startswith('url:'), prefix='url:')
+        self.add('bug.id', 1, str.isdigit, recognize=str.isdigit)
+        self.add('bug.link', 2, lambda uri: uri.startswith('https://bugs.gentoo.org/'),
+                recognize=BUG_LINK.match)
+        self.add('bug.full', 1000, lambda uri: uri.startswith('bug:'), prefix='bug:')
+        # a handler accepting nothing, which no spec shall be routed to
+        self.add('never', 0, lambda uri: False, recognize=lambda uri: False)
+
+    def add(self, name, priority, accept, prefix=None, recognize=None):
+        def handler(uri):
+            self.calls[name] = self.calls.get(name, 0) + 1
+            return Result.Ok(uri) if accept(uri) else Result.Err()
+        self.dispatcher.register_package_handler(name, handler, priority, prefix, recognize)
+
+    def linear_scan(self, uri):
+        """Resolves a spec by calling all the handlers in the priority order"""
+        for priority, source, handler, prefix, recognize in self.dispatcher.handlers:
+            if handler(uri).is_ok():
+                return source
+        return None
+
+    def testSameAsLinearScan(self):
+        for spec in self.SPECS:
+            expected = self.linear_scan(spec)
+            self.calls.clear()
+            self.assertEqual(self.dispatcher.resolve(spec).ok()[0], expected, spec)
+
+    def testRouting(self):
+        routes = {'dev-libs/openssl': 'portage.spec', './foo-1.ebuild': 'fs.path',
+            '/var/db/repos/gentoo/dev-libs/foo/foo-1.ebuild': 'portage.path',
+            'https://bugs.gentoo.org/123': 'bug.link', 'http://paste.example.org/x': 'url.link',
+            'bug:123': 'bug.full', '123': 'bug.id', 'fs:/tmp/foo-1.ebuild': 'fs.full'}
+        for spec, source in routes.items():
+            self.calls.clear()
+            self.assertEqual(self.dispatcher.resolve(spec).ok()[0], source)
+            # handlers are tried in the priority order, the non-matching ones are skipped
+            self.assertEqual(list(self.calls), [x[1] for x in self.dispatcher.candidates(spec)
+                ][:len(self.calls)])
+            self.assertNotIn('never', self.calls)
+
+    def testSkipped(self):
+        self.dispatcher.resolve('bug:123')
+        self.assertEqual(self.calls, {'bug.full': 1})
+        self.calls.clear()
+        self.dispatcher.resolve('http://paste.example.org/x')
+        self.assertEqual(self.calls, {'url.link': 1})
+        self.calls.clear()
+        self.assertTrue(self.dispatcher.resolve('no such thing!').is_err())
+        self.assertEqual(self.calls, {})
+
+    def testPriority(self):
+        self.assertEqual([x[1] for x in self.dispatcher.candidates('https://bugs.gentoo.org/1')],
+                ['bug.link', 'url.link'])
+        self.assertEqual([x[1] for x in self.dispatcher.candidates('/tmp/foo-1.ebuild')],
+                ['portage.path', 'fs.path'])
+
+    def testSourceRoutes(self):
+        from pomu.source.bugz import BugzillaSource
+        from pomu.source.url import URLGrabberSource
+        self.assertEqual([x[1] for x in dispatcher.candidates('bug:123')], [BugzillaSource])
+        self.assertEqual([x[1] for x in dispatcher.candidates('url:http://example.org/')],
+                [URLGrabberSource])
+        sources = [x[1] for x in dispatcher.candidates('https://bugs.gentoo.org/1')]
+        self.assertLess(sources.index(BugzillaSource), sources.index(URLGrabberSource))
+
+
 class InstallTests(unittest.TestCase):
     def setUp(self):
         pomu_active_repo._drop()
@@ -70,6 +197,18 @@ class InstallTests(unittest.TestCase):
         pkg = dispatcher.get_package('sys-apps/portage').expect()
         self.repo.merge(pkg).expect()
 
+    def testLocalMetadata(self):
+        from pomu.source.file import LocalEbuild
+        epath = path.join(self.source_path, 'test', 'test-1.ebuild')
+        shutil.copy(path.join(self.source_path, 'test', 'test.ebuild'), epath)
+        self.repo.merge(LocalEbuild(epath, 'test', 'test', '1').fetch().expect()).expect()
+        shutil.rmtree(self.source_path) # metadata shall be read without the source
+        pkg = self.repo.get_package('test', 'test').expect()
+        self.assertEqual(pkg.backend.path, epath)
+        self.assertIn(('test/test', 'test-1.ebuild'), pkg.files)
+        self.assertTrue(pkg.backend.revalidate().is_err())
+        makedirs(self.source_path)
+
 # TODO: convert to LocalEbuildFile backend
 #    def testPkgMerge(self):
 #        pkg = Package('test', self.source_path, category='test')
@@ -0,0 +1,76 @@
+import shutil
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from tempfile import mkdtemp
+
+from pomu.util.http import HTTPCache
+
+class Handler(BaseHTTPRequestHandler):
+    body = b'EAPI=6\n'
+    etag = '"1"'
+    requests = []
+
+    def do_GET(self):
+        cond = self.headers.get('If-None-Match')
+        Handler.requests.append(cond)
+        if cond == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+class HTTPCacheTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = 'http://127.0.0.1:{}/foo-1.ebuild'.format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Handler.requests = []
+        Handler.body, Handler.etag = b'EAPI=6\n', '"1"'
+        self.dir = mkdtemp()
+        self.cache = HTTPCache(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testRevalidation(self):
+        res = self.cache.get(self.url).expect()
+        self.assertFalse(getattr(res, 'from_cache', False))
+        res = self.cache.get(self.url).expect()
+        self.assertTrue(res.from_cache)
+        self.assertEqual(res.text, 'EAPI=6\n')
+        self.assertEqual(Handler.requests, [None, '"1"'])
+
+    def testChanged(self):
+        self.cache.get(self.url).expect()
+        Handler.body, Handler.etag = b'EAPI=7\n', '"2"'
+        self.assertEqual(self.cache.get(self.url).expect().text, 'EAPI=7\n')
+        self.assertEqual(self.cache.get(self.url).expect().text, 'EAPI=7\n')
+        self.assertEqual(Handler.requests, [None, '"1"', '"2"'])
+
+    def testEviction(self):
+        cache = HTTPCache(self.dir, max_size=10)
+        cache.store('a', b'12345')
+        cache.store('b', b'12345')
+        cache.lookup('a')
+        cache.store('c', b'12345')
+        self.assertIsNotNone(cache.lookup('a'))
+        self.assertIsNone(cache.lookup('b'))
+        self.assertIsNotNone(cache.lookup('c'))
@@ -0,0 +1,81 @@
+import hashlib
+import shutil
+import unittest
+
+from os import path, makedirs, symlink
+from tempfile import mkdtemp
+
+from pomu.util.manifest import dist_entries, gen_manifest, gen_manifests, read_manifest
+
+class ManifestTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        makedirs(path.join(self.dir, 'files', 'sub'))
+        self.write('foo-1.ebuild', 'EAPI=6\n')
+        self.write('metadata.xml', '<pkgmetadata/>\n')
+        self.write('files/foo.patch', '--- a\n+++ b\n')
+        self.write('files/sub/foo.conf', 'x=1\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        with open(path.join(self.dir, name), 'w') as f:
+            f.write(data)
+
+    def testEntries(self):
+        mpath = gen_manifest(self.dir).expect()
+        entries = read_manifest(mpath)
+        self.assertEqual(sorted(entries), [('AUX', 'foo.patch'), ('AUX', 'sub/foo.conf'),
+            ('EBUILD', 'foo-1.ebuild'), ('MISC', 'metadata.xml')])
+        size, hashes = entries[('EBUILD', 'foo-1.ebuild')]
+        self.assertEqual(size, 7)
+        self.assertEqual(hashes['SHA512'], hashlib.sha512(b'EAPI=6\n').hexdigest())
+        self.assertEqual(hashes['BLAKE2B'], hashlib.blake2b(b'EAPI=6\n').hexdigest())
+
+    def testKeepsDist(self):
+        self.write('Manifest', 'DIST foo-1.tar.gz 10 BLAKE2B aa SHA512 bb\n'
+                'EBUILD foo-0.ebuild 1 BLAKE2B cc SHA512 dd\n')
+        entries = read_manifest(gen_manifest(self.dir).expect())
+        self.assertEqual(entries[('DIST', 'foo-1.tar.gz')], (10, {'BLAKE2B': 'aa', 'SHA512': 'bb'}))
+        self.assertNotIn(('EBUILD', 'foo-0.ebuild'), entries)
+
+    def testSourceDist(self):
+        src = path.join(self.dir, 'src-Manifest')
+        self.write('src-Manifest', 'DIST foo-1.tar.gz 10 BLAKE2B aa SHA512 bb\n'
+                'DIST foo-2.tar.gz 20 BLAKE2B cc SHA512 dd\n'
+                'EBUILD foo-1.ebuild 1 BLAKE2B ee SHA512 ff\n')
+        dist = dist_entries(src, {'foo-1.tar.gz'})
+        self.assertEqual(list(dist), [('DIST', 'foo-1.tar.gz')])
+        self.assertEqual(len(dist_entries(src)), 2)
+        entries = read_manifest(gen_manifests([self.dir], thin=True,
+            dist={self.dir: dist}).expect()[0])
+        self.assertEqual(entries, {('DIST', 'foo-1.tar.gz'): (10, {'BLAKE2B': 'aa', 'SHA512': 'bb'})})
+
+    def testThin(self):
+        self.assertIsNone(gen_manifest(self.dir, thin=True).expect())
+        self.assertFalse(path.exists(path.join(self.dir, 'Manifest')))
+
+    def testUpdate(self):
+        gen_manifest(self.dir).expect()
+        self.write('foo-1.ebuild', 'EAPI=7\n')
+        entries = read_manifest(gen_manifest(self.dir).expect())
+        self.assertEqual(entries[('EBUILD', 'foo-1.ebuild')][1]['SHA512'],
+                hashlib.sha512(b'EAPI=7\n').hexdigest())
+
+    def testParallel(self):
+        dirs = []
+        for i in range(6):
+            d = path.join(self.dir, 'pkg{}'.format(i))
+            makedirs(d)
+            with open(path.join(d, 'pkg{}-1.ebuild'.format(i)), 'w') as f:
+                f.write('EAPI=6\n' * i)
+            dirs.append(d)
+        res = gen_manifests(dirs, jobs=3).expect()
+        self.assertEqual(res, [path.join(d, 'Manifest') for d in dirs])
+
+    def testParallelFailure(self):
+        bad = path.join(self.dir, 'bad')
+        makedirs(bad)
+        symlink(path.join(bad, 'missing'), path.join(bad, 'bad-1.ebuild'))
+        self.assertTrue(gen_manifests([self.dir, bad], jobs=2).is_err())
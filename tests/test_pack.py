@@ -0,0 +1,59 @@
+import shutil
+import subprocess
+import unittest
+
+from os import path, makedirs
+from tempfile import mkdtemp
+
+from pomu.repo.remote.git import RemoteGitRepo
+from pomu.util.pack import ObjectStore
+
+def git(cwd, *args):
+    return subprocess.run(['git'] + list(args), cwd=cwd, check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+
+class PackTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = mkdtemp()
+        git(cls.dir, 'init', '-q')
+        git(cls.dir, 'config', 'user.email', 'test@example.org')
+        git(cls.dir, 'config', 'user.name', 'test')
+        makedirs(path.join(cls.dir, 'dev-libs', 'foo', 'files'))
+        lines = ['line {}\n'.format(i) for i in range(2000)]
+        for rev in range(5): # similar revisions get deltified
+            lines[rev * 100] = 'changed in {}\n'.format(rev)
+            with open(path.join(cls.dir, 'dev-libs', 'foo', 'foo-1.ebuild'), 'w') as f:
+                f.write('EAPI=6\n' + ''.join(lines))
+            with open(path.join(cls.dir, 'dev-libs', 'foo', 'files', 'foo.patch'), 'w') as f:
+                f.write('--- a\n+++ b\n' * (rev + 1))
+            git(cls.dir, 'add', '-A')
+            git(cls.dir, 'commit', '-q', '-m', 'rev {}'.format(rev))
+        git(cls.dir, 'repack', '-q', '-a', '-d', '-f', '--depth=10')
+        cls.objects = git(cls.dir, 'rev-list', '--objects', '--all').decode('utf-8').split()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def testObjects(self):
+        store = ObjectStore(path.join(self.dir, '.git', 'objects'))
+        self.assertTrue(store._packs())
+        for oid in [x for x in self.objects if len(x) == 40]:
+            typ, data = store.read(oid)
+            self.assertEqual(typ, git(self.dir, 'cat-file', '-t', oid).decode('utf-8').strip())
+            self.assertEqual(data, git(self.dir, 'cat-file', typ, oid))
+        with self.assertRaises(KeyError):
+            store.read('0' * 40)
+        store.close()
+
+    def testShallowClone(self):
+        repo = RemoteGitRepo('file://' + self.dir, cache=None)
+        try:
+            self.assertEqual(repo.fetch_tree(), ['/dev-libs/', '/dev-libs/foo/',
+                '/dev-libs/foo/files/', '/dev-libs/foo/files/foo.patch',
+                '/dev-libs/foo/foo-1.ebuild'])
+            with open(path.join(self.dir, 'dev-libs', 'foo', 'foo-1.ebuild'), 'rb') as f:
+                self.assertEqual(repo.fetch_file('dev-libs/foo/foo-1.ebuild').expect(), f.read())
+        finally:
+            repo.cleanup()
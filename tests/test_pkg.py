@@ -0,0 +1,45 @@
+import unittest
+
+from pomu.util.pkg import _cpv_split, cpv_split, cpv_split_many
+
+ATOMS = [
+    'dev-libs/openssl-0.9.8z_p8-r100',
+    'dev-libs/openssl-1.1.0f',
+    'app-misc/foo-1.0-r1',
+    'app-misc/foo-1.0_rc1',
+    'app-misc/foo-1.0_rc12-r3',
+    'app-misc/foo-1.0_p',
+    'app-misc/foo-2_alpha20170101',
+    'sys-apps/portage',
+    'foo-bar-2.4.1',
+    'foo-bar',
+    'x11-libs/gtk+-3.22.16-r1',
+    'dev-python/py-1.4.34',
+]
+
+class CpvSplitTests(unittest.TestCase):
+    def testSplit(self):
+        self.assertEqual(cpv_split('dev-libs/openssl-0.9.8z_p8-r100', unified_ver=False),
+                ('dev-libs', 'openssl', '0.9.8z', 'p8', 'r100'))
+        self.assertEqual(cpv_split('app-misc/foo-1.0_rc12-r3'),
+                ('app-misc', 'foo', '1.0_rc12-r3'))
+        self.assertEqual(cpv_split('sys-apps/portage'), ('sys-apps', 'portage', None))
+        self.assertEqual(cpv_split('foo-bar-2.4.1'), ('', 'foo-bar', '2.4.1'))
+        self.assertEqual(cpv_split('foo-bar'), ('', 'foo-bar', None))
+
+    def testMany(self):
+        res = cpv_split_many(ATOMS)
+        self.assertEqual(list(zip(*res)), [cpv_split(x) for x in ATOMS])
+        self.assertEqual(cpv_split_many([]), ([], [], []))
+
+    def testInterned(self):
+        res = cpv_split_many(['app-misc/foo-1', 'app-misc/foo-2'])
+        self.assertIs(res.categories[0], res.categories[1])
+        self.assertIs(res.names[0], res.names[1])
+
+    def testMemo(self):
+        _cpv_split.cache_clear()
+        cpv_split('app-misc/foo-1')
+        # one-off atoms of the batch do not flush the memo
+        cpv_split_many(['app-misc/bar-{}'.format(i) for i in range(100)])
+        self.assertEqual(_cpv_split.cache_info().currsize, 1)
@@ -0,0 +1,155 @@
+import os
+import shutil
+import subprocess
+import unittest
+
+from os import path, makedirs
+from tempfile import mkdtemp
+
+from pomu.util.pkg import ver_str
+from pomu.util.portage import RepoIndex, best_ver, ebuild_slot, repo_pkgs
+
+def git(cwd, *args):
+    subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.org']
+            + list(args), cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+
+class RepoIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.location = path.join(self.dir, 'repo')
+        self.cache = path.join(self.dir, 'cache')
+        self.environ = dict(os.environ)
+        os.environ['POMU_CACHE_DIR'] = self.cache
+        for cpv in ['app-misc/foo-1', 'app-misc/foo-2', 'dev-libs/bar-1.0']:
+            self.write_ebuild(cpv)
+        makedirs(path.join(self.location, 'profiles'))
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.dir)
+
+    def write_ebuild(self, cpv):
+        category, pv = cpv.split('/')
+        name = pv.rpartition('-')[0]
+        makedirs(path.join(self.location, category, name), exist_ok=True)
+        with open(path.join(self.location, category, name, pv + '.ebuild'), 'w') as f:
+            f.write('EAPI=6\n')
+
+    def remove_ebuild(self, cpv):
+        category, pv = cpv.split('/')
+        os.remove(path.join(self.location, category, pv.rpartition('-')[0], pv + '.ebuild'))
+
+    def index(self):
+        return RepoIndex('test', self.location)
+
+    def fresh(self, idx):
+        """An index, which has not been loaded (nor rebuilt) yet"""
+        res = RepoIndex.__new__(RepoIndex)
+        res.__dict__.update(repo='test', location=self.location, file=idx.file,
+                names={}, dirty=False)
+        return res
+
+    def testBuild(self):
+        idx = self.index()
+        self.assertEqual(idx.versions('app-misc', 'foo'), ['1', '2'])
+        self.assertEqual(idx.lookup('bar'), [('dev-libs', ['1.0'])])
+        self.assertEqual(idx.lookup('baz'), [])
+        self.assertTrue(path.isfile(path.join(self.cache, 'portage', 'test.idx')))
+        # a fresh index is loaded from the disk
+        fresh = self.fresh(idx)
+        self.assertTrue(fresh.load())
+        self.assertEqual(fresh.names, idx.names)
+
+    def testRefresh(self):
+        idx = self.index()
+        self.write_ebuild('app-misc/foo-3')
+        self.remove_ebuild('app-misc/foo-1')
+        self.assertEqual(idx.versions('app-misc', 'foo'), ['2', '3'])
+        self.remove_ebuild('dev-libs/bar-1.0')
+        self.assertEqual(idx.lookup('bar'), [])
+        # the refreshed entries are persisted
+        fresh = self.fresh(idx)
+        self.assertTrue(fresh.load())
+        self.assertEqual(fresh.names['foo']['app-misc'][1], ['2', '3'])
+        self.assertNotIn('dev-libs', fresh.names.get('bar', {}))
+
+    def testMtimeStamp(self):
+        idx = self.index()
+        self.assertTrue(self.fresh(idx).load())
+        # a new category changes the mtime of the repository root
+        self.write_ebuild('sys-apps/baz-1')
+        self.assertFalse(self.fresh(idx).load())
+        self.assertEqual(self.index().lookup('baz'), [('sys-apps', ['1'])])
+
+    def testGitStamp(self):
+        git(self.location, 'init', '-q')
+        git(self.location, 'add', '-A')
+        git(self.location, 'commit', '-q', '-m', 'init')
+        idx = self.index()
+        self.assertTrue(idx.stamp(idx.categories()).startswith('git '))
+        self.assertTrue(self.fresh(idx).load())
+        self.write_ebuild('sys-apps/baz-1')
+        git(self.location, 'add', '-A')
+        git(self.location, 'commit', '-q', '-m', 'baz')
+        self.assertFalse(self.fresh(idx).load())
+        self.assertEqual(self.index().lookup('baz'), [('sys-apps', ['1'])])
+
+class SlotTests(unittest.TestCase):
+    EBUILDS = {'foo-1': 'SLOT="0"', 'foo-2': "SLOT='2'", 'foo-2.1': 'SLOT="2/2.1" # subslot',
+        'foo-3_rc1-r1': 'SLOT="3"', 'foo-4': 'SLOT="${PV}"'}
+
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.location = path.join(self.dir, 'repo')
+        conf = path.join(self.dir, 'etc', 'portage', 'repos.conf')
+        makedirs(conf)
+        with open(path.join(conf, 'test.conf'), 'w') as f:
+            f.write('[test]\nlocation = {}\n'.format(self.location))
+        self.environ = dict(os.environ)
+        os.environ['PORTAGE_CONFIGROOT'] = self.dir
+        os.environ['POMU_CACHE_DIR'] = path.join(self.dir, 'cache')
+        pkgdir = path.join(self.location, 'app-misc', 'foo')
+        makedirs(pkgdir)
+        for pv, slot in self.EBUILDS.items():
+            with open(path.join(pkgdir, pv + '.ebuild'), 'w') as f:
+                f.write('EAPI=6\n\nDESCRIPTION="foo"\n{}\nKEYWORDS="~amd64"\n'.format(slot))
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.dir)
+
+    def write_cache(self, pv, slot):
+        cdir = path.join(self.location, 'metadata', 'md5-cache', 'app-misc')
+        makedirs(cdir, exist_ok=True)
+        with open(path.join(cdir, pv), 'w') as f:
+            f.write('EAPI=6\nKEYWORDS=~amd64\nSLOT={}\n'.format(slot))
+
+    def testEbuildFallback(self):
+        self.assertEqual(ebuild_slot('test', 'app-misc', 'foo', '2.1'), '2')
+        self.assertEqual(ebuild_slot('test', 'app-misc', 'foo', '1'), '0')
+        self.assertIsNone(ebuild_slot('test', 'app-misc', 'foo', '4'))
+        self.assertEqual(best_ver('test', 'app-misc', 'foo'), '4')
+        self.assertEqual(best_ver('test', 'app-misc', 'foo', slot='2'), '2.1')
+        self.assertEqual(best_ver('test', 'app-misc', 'foo', slot='2/2.1'), '2.1')
+        self.assertEqual(best_ver('test', 'app-misc', 'foo', slot='3'), '3_rc1-r1')
+        self.assertEqual(best_ver('test', 'app-misc', 'foo', '2', slot='0'), None)
+
+    def testMd5Cache(self):
+        for pv, slot in [('foo-1', '1'), ('foo-2', '2'), ('foo-2.1', '2/2.1'),
+                ('foo-3_rc1-r1', '3'), ('foo-4', '4')]:
+            self.write_cache(pv, slot)
+        # the cache takes precedence over the ebuilds
+        self.assertEqual(ebuild_slot('test', 'app-misc', 'foo', '1'), '1')
+        self.assertEqual(best_ver('test', 'app-misc', 'foo', slot='4'), '4')
+        self.assertEqual(repo_pkgs('test', 'app-misc', 'foo', slot='2'),
+                [('test', 'app-misc', 'foo', '2.1', '2')])
+        self.assertEqual(repo_pkgs('test', None, 'foo', '1'),
+                [('test', 'app-misc', 'foo', '1', '1')])
+
+    def testVersionString(self):
+        self.assertEqual(ver_str('1.0', 'rc1', 'r2'), '1.0_rc1-r2')
+        self.assertEqual(ver_str('1.0', 'p', None), '1.0_p')
+        self.assertEqual(ver_str('1.0', None, 'r1'), '1.0-r1')
+        self.assertIsNone(ver_str(None, 'rc1', None))
@@ -0,0 +1,354 @@
+import json
+import os
+import shutil
+import subprocess
+import unittest
+
+from os import path, makedirs
+from tempfile import mkdtemp
+from unittest import mock
+
+from pomu.repo.remote.git import RemoteGitRepo
+from pomu.repo.remote.rsync import RemoteRsyncRepo
+from pomu.util.mirror import MirrorCache
+from pomu.util.remote import RemoteTree, filelist_to_cpvs, get_full_cpv
+
+def git(cwd, *args):
+    return subprocess.run(['git'] + list(args), cwd=cwd, check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+
+class PartialCloneTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = mkdtemp()
+        src = path.join(cls.dir, 'src')
+        for cat in ['app-misc', 'dev-libs', 'sys-apps']:
+            for name in ['foo', 'bar', 'baz']:
+                pdir = path.join(src, cat, name)
+                makedirs(path.join(pdir, 'files'))
+                for ver in ['1', '2']:
+                    with open(path.join(pdir, '{}-{}.ebuild'.format(name, ver)), 'w') as f:
+                        f.write('EAPI=6 # {}/{}-{}\n'.format(cat, name, ver))
+                with open(path.join(pdir, 'files', name + '.patch'), 'w') as f:
+                    f.write('--- {0}\n+++ {0}\n'.format(cat))
+        git(src, 'init', '-q')
+        git(src, 'add', '-A')
+        git(src, '-c', 'user.name=test', '-c', 'user.email=test@example.org',
+                'commit', '-q', '-m', 'overlay')
+        cls.remote = path.join(cls.dir, 'remote.git')
+        git(cls.dir, 'clone', '-q', '--bare', src, cls.remote)
+        git(cls.remote, 'config', 'uploadpack.allowFilter', 'true')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def setUp(self):
+        self.repo = RemoteGitRepo('file://' + self.remote, cache=None)
+
+    def tearDown(self):
+        self.repo.cleanup()
+
+    def object_count(self):
+        return sum(len(x.index) for x in self.repo.objects._packs())
+
+    def testFetchPackage(self):
+        self.assertEqual(self.object_count(), 1) # just the commit
+        pkg = self.repo.fetch_package('bar', 'dev-libs')
+        self.assertEqual(pkg.filemap['dev-libs/bar/bar-2.ebuild'], b'EAPI=6 # dev-libs/bar-2\n')
+        self.assertEqual(pkg.filemap['/dev-libs/bar/files/bar.patch'], b'--- dev-libs\n+++ dev-libs\n')
+        # commit, root, category, package and files trees, ebuild and patch
+        self.assertEqual(self.object_count(), 7)
+
+    def testFetchFiles(self):
+        keys = ['/{}/foo/files/foo.patch'.format(c) for c in ['app-misc', 'sys-apps']]
+        for key in keys:
+            self.repo.fetch_subtree(key.rpartition('/')[0])
+        calls = []
+        fetch = self.repo.fetch_objects
+        def fetch_objects(oids):
+            if any(x not in self.repo.objects for x in oids):
+                calls.append(oids)
+            fetch(oids)
+        self.repo.fetch_objects = fetch_objects
+        files = self.repo.fetch_files(keys).expect()
+        self.assertEqual(files[keys[1]], b'--- sys-apps\n+++ sys-apps\n')
+        self.assertEqual(len(calls), 1) # both blobs in a single request
+        self.assertTrue(self.repo.fetch_files(['/app-misc/nonexistent']).is_err())
+
+    def testListCpvs(self):
+        cpvs = self.repo.list_cpvs()
+        self.assertEqual(len(cpvs), 18)
+        other = RemoteGitRepo('file://' + self.remote, cache=None)
+        try:
+            other.fetch_tree = None # the listing of the revision is shared
+            self.assertIs(other.list_cpvs(), cpvs)
+        finally:
+            other.cleanup()
+
+    def testFindCpvs(self):
+        self.assertEqual(sorted(self.repo.find_cpvs('baz')),
+                [(c, 'baz', v) for c in ['app-misc', 'dev-libs', 'sys-apps'] for v in '12'])
+        self.assertEqual(self.repo.find_cpvs('baz', 'nonexistent'), [])
+
+    def testTree(self):
+        tree = self.repo.fetch_tree()
+        self.assertIn('/sys-apps/foo/files/foo.patch', tree)
+        self.assertIn('/sys-apps/foo/', tree)
+        self.assertEqual(len(tree), 3 + 9 * 5)
+        self.assertEqual(self.repo.fetch_subtree('/sys-apps/foo/').expect(),
+                ['', 'files/', 'files/foo.patch', 'foo-1.ebuild', 'foo-2.ebuild'])
+
+def commit(src, fname):
+    with open(path.join(src, fname), 'w') as f:
+        f.write(fname)
+    git(src, 'add', '-A')
+    git(src, '-c', 'user.name=test', '-c', 'user.email=test@example.org',
+            'commit', '-q', '-m', fname)
+
+class MirrorCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.remotes = []
+        for name in ['a', 'b']:
+            src = path.join(self.dir, name)
+            makedirs(src)
+            git(src, 'init', '-q')
+            commit(src, 'metadata.xml')
+            self.remotes.append('file://' + src)
+        self.cache = MirrorCache(path.join(self.dir, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testUpdate(self):
+        repo = RemoteGitRepo(self.remotes[0], cache=self.cache)
+        mdir = repo.dir
+        repo.cleanup()
+        self.assertTrue(path.isdir(mdir))
+        commit(path.join(self.dir, 'a'), 'README')
+        repo = RemoteGitRepo(self.remotes[0], cache=self.cache)
+        self.assertEqual(repo.dir, mdir)
+        self.assertEqual(repo.fetch_tree(), ['/README', '/metadata.xml'])
+        repo.cleanup()
+
+    def testEviction(self):
+        self.cache.max_size = 0
+        first = RemoteGitRepo(self.remotes[0], cache=self.cache)
+        second = RemoteGitRepo(self.remotes[1], cache=self.cache)
+        self.assertTrue(path.isdir(first.dir)) # in use
+        first.cleanup()
+        second.cleanup()
+        third = RemoteGitRepo(self.remotes[1], cache=self.cache)
+        self.assertFalse(path.isdir(first.dir))
+        self.assertFalse(path.exists(first.dir + '.lock'))
+        self.assertTrue(path.isdir(third.dir))
+        self.assertTrue(path.exists(third.dir + '.lock'))
+        third.cleanup()
+        # an evicted mirror gets recreated
+        first = RemoteGitRepo(self.remotes[0], cache=self.cache)
+        self.assertEqual(first.fetch_tree(), ['/metadata.xml'])
+        first.cleanup()
+
+@unittest.skipUnless(shutil.which('rsync'), 'rsync is not available')
+class RsyncMirrorTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.src = path.join(self.dir, 'src')
+        for fname in ['app-misc/foo/foo-1.ebuild', 'app-misc/foo/files/foo.patch',
+                'dev-libs/bar/bar-1.ebuild']:
+            self.write(fname, fname + '\n')
+        self.cache = MirrorCache(path.join(self.dir, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, fname, text):
+        makedirs(path.dirname(path.join(self.src, fname)), exist_ok=True)
+        with open(path.join(self.src, fname), 'w') as f:
+            f.write(text)
+
+    def mirrored(self, repo):
+        res = []
+        for root, _, files in os.walk(repo.mirror.dir):
+            res.extend(path.relpath(path.join(root, x), repo.mirror.dir) for x in files)
+        return sorted(res)
+
+    def testLazySeeding(self):
+        repo = RemoteRsyncRepo(self.src, cache=self.cache)
+        self.assertEqual(self.mirrored(repo), [])
+        self.assertIn('/dev-libs/bar/bar-1.ebuild', repo.fetch_tree())
+        self.assertEqual(repo.fetch_files(['app-misc/foo/foo-1.ebuild']).expect(),
+                {'app-misc/foo/foo-1.ebuild': b'app-misc/foo/foo-1.ebuild\n'})
+        self.assertEqual(self.mirrored(repo), ['app-misc/foo/foo-1.ebuild'])
+        repo.cleanup()
+        # only the mirrored files are updated, when the remote is used again
+        self.write('app-misc/foo/foo-1.ebuild', 'EAPI=7\n')
+        repo = RemoteRsyncRepo(self.src, cache=self.cache)
+        self.assertEqual(self.mirrored(repo), ['app-misc/foo/foo-1.ebuild'])
+        self.assertEqual(repo.fetch_file('app-misc/foo/foo-1.ebuild').expect(), b'EAPI=7\n')
+        repo.cleanup()
+
+class FakeRsync():
+    """Stands in for rsync (local copies), recording the --files-from lists"""
+    def __init__(self):
+        self.lists = []
+
+    def call(self, args):
+        flist = next(x for x in args if x.startswith('--files-from='))
+        with open(flist.partition('=')[2]) as f:
+            files = f.read().split()
+        self.lists.append(files)
+        src, dst = args[-2], args[-1]
+        for fname in files:
+            if not path.isfile(path.join(src, fname)):
+                if '--ignore-missing-args' in args:
+                    continue
+                return 23
+            makedirs(path.dirname(path.join(dst, fname)), exist_ok=True)
+            shutil.copy2(path.join(src, fname), path.join(dst, fname))
+        return 0
+
+    def run(self, args, **kwargs):
+        # the listing of the tree (rsync -rn --out-format=%n)
+        src = args[-2]
+        out = []
+        for root, dirs, files in os.walk(src):
+            rel = path.relpath(root, src)
+            prefix = '' if rel == '.' else rel + '/'
+            out.extend(prefix + x + '/' for x in dirs)
+            out.extend(prefix + x for x in files)
+        return subprocess.CompletedProcess(args, 0, stdout='./\n' + '\n'.join(out) + '\n')
+
+class RsyncSeedingTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.src = path.join(self.dir, 'src')
+        for fname in ['app-misc/foo/foo-1.ebuild', 'app-misc/foo/files/foo.patch',
+                'dev-libs/bar/bar-1.ebuild']:
+            makedirs(path.dirname(path.join(self.src, fname)), exist_ok=True)
+            with open(path.join(self.src, fname), 'w') as f:
+                f.write(fname + '\n')
+        self.cache = MirrorCache(path.join(self.dir, 'cache'))
+        self.rsync = FakeRsync()
+        self.patches = [mock.patch('pomu.repo.remote.rsync.call', self.rsync.call),
+                mock.patch('pomu.repo.remote.rsync.run', self.rsync.run)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.dir)
+
+    def mirrored(self, repo):
+        res = []
+        for root, _, files in os.walk(repo.mirror.dir):
+            res.extend(path.relpath(path.join(root, x), repo.mirror.dir) for x in files)
+        return sorted(res)
+
+    def testSeeding(self):
+        repo = RemoteRsyncRepo(self.src, cache=self.cache)
+        self.assertEqual(self.rsync.lists, []) # nothing is pulled upfront
+        self.assertIn('/app-misc/foo/files/foo.patch', repo.fetch_tree())
+        self.assertEqual(repo.fetch_files(['app-misc/foo/foo-1.ebuild',
+            '/app-misc/foo/files/foo.patch']).expect(), {
+                'app-misc/foo/foo-1.ebuild': b'app-misc/foo/foo-1.ebuild\n',
+                '/app-misc/foo/files/foo.patch': b'app-misc/foo/files/foo.patch\n'})
+        self.assertEqual(self.rsync.lists,
+                [['app-misc/foo/foo-1.ebuild', 'app-misc/foo/files/foo.patch']])
+        self.assertEqual(self.mirrored(repo),
+                ['app-misc/foo/files/foo.patch', 'app-misc/foo/foo-1.ebuild'])
+        # the mirrored files are not rsynced again
+        self.assertEqual(repo.fetch_file('app-misc/foo/foo-1.ebuild').expect(),
+                b'app-misc/foo/foo-1.ebuild\n')
+        repo.fetch_file('dev-libs/bar/bar-1.ebuild').expect()
+        self.assertEqual(self.rsync.lists[1:], [['dev-libs/bar/bar-1.ebuild']])
+        self.assertTrue(repo.fetch_file('dev-libs/baz/baz-1.ebuild').is_err())
+        repo.cleanup()
+
+    def testSync(self):
+        repo = RemoteRsyncRepo(self.src, cache=self.cache)
+        repo.fetch_files(['app-misc/foo/foo-1.ebuild', 'dev-libs/bar/bar-1.ebuild']).expect()
+        repo.cleanup()
+        os.remove(path.join(self.src, 'dev-libs', 'bar', 'bar-1.ebuild'))
+        with open(path.join(self.src, 'app-misc', 'foo', 'foo-1.ebuild'), 'w') as f:
+            f.write('EAPI=7\n')
+        self.rsync.lists = []
+        repo = RemoteRsyncRepo(self.src, cache=self.cache)
+        # just the mirrored files are updated (the removed ones are skipped)
+        self.assertEqual([sorted(x) for x in self.rsync.lists],
+                [['app-misc/foo/foo-1.ebuild', 'dev-libs/bar/bar-1.ebuild']])
+        self.assertEqual(repo.fetch_file('app-misc/foo/foo-1.ebuild').expect(), b'EAPI=7\n')
+        self.assertTrue(repo.fetch_file('dev-libs/bar/bar-1.ebuild').is_err())
+        repo.cleanup()
+
+    def testWithoutCache(self):
+        repo = RemoteRsyncRepo(self.src, cache=None)
+        self.assertEqual(repo.fetch_files(['dev-libs/bar/bar-1.ebuild']).expect(),
+                {'dev-libs/bar/bar-1.ebuild': b'dev-libs/bar/bar-1.ebuild\n'})
+        self.assertEqual(self.rsync.lists, [['dev-libs/bar/bar-1.ebuild']])
+
+class MirrorSizeTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.cache = MirrorCache(path.join(self.dir, 'cache'), max_size=1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, mirror, fname, size):
+        with open(path.join(mirror.dir, fname), 'w') as f:
+            f.write('x' * size)
+
+    def create(self, directory):
+        os.makedirs(directory)
+        return True
+
+    def size(self, url):
+        with open(self.cache._paths('test', url)[1]) as f:
+            return json.load(f)['size']
+
+    def testLazyContent(self):
+        mirror = self.cache.open('test', 'a', self.create, lambda d: None).expect()
+        self.assertEqual(self.size('a'), 0)
+        # the content fetched while the mirror is in use
+        self.write(mirror, 'blob', 600)
+        mirror.release()
+        self.assertEqual(self.size('a'), 600)
+        mirror = self.cache.open('test', 'b', self.create, lambda d: None).expect()
+        self.write(mirror, 'blob', 600)
+        mirror.release()
+        # the cache has grown over its limit: the least recently used mirror is evicted
+        self.assertFalse(path.isdir(self.cache._paths('test', 'a')[0]))
+        self.assertEqual(self.size('b'), 600)
+
+class RemoteTreeTests(unittest.TestCase):
+    def setUp(self):
+        self.tree = RemoteTree([('/a/b/c.ebuild', '11' * 20), '/a/b/files/x.patch',
+            '/a/b-c/d.ebuild', '/a/bz', 'metadata/layout.conf'])
+
+    def testLookup(self):
+        self.assertIn('/a/b/', self.tree)
+        self.assertIn('/metadata/layout.conf', self.tree)
+        self.assertNotIn('/a/b', self.tree)
+        self.assertEqual(self.tree.oid('/a/b/c.ebuild'), '11' * 20)
+        self.assertIsNone(self.tree.oid('/a/bz'))
+
+    def testSubtree(self):
+        self.assertEqual(self.tree.subtree('/a/b/'),
+                ['', 'c.ebuild', 'files/', 'files/x.patch'])
+        self.assertEqual(self.tree.children('/a/'), ['b-c/', 'b/', 'bz'])
+
+class CpvListTests(unittest.TestCase):
+    def testFilelist(self):
+        cpvs = filelist_to_cpvs(['/app-misc/', '/app-misc/foo/foo-1.0_rc1-r2.ebuild',
+            '/app-misc/foo/bar-1.ebuild', '/app-misc/foo/files/foo-2.ebuild',
+            '/eclass/foo/foo-3.ebuild', '/app-misc/foo-bar/foo-bar-2a.ebuild',
+            '/dev-libs/foo/foo-1.1.ebuild', '/dev-libs/foo/foo.ebuild'])
+        self.assertEqual(cpvs, [('app-misc', 'foo', '1.0_rc1-r2'),
+            ('app-misc', 'foo-bar', '2a'), ('dev-libs', 'foo', '1.1')])
+        self.assertEqual(get_full_cpv(cpvs, 'foo').expect(), ('dev-libs', 'foo', '1.1'))
+        self.assertEqual(get_full_cpv(cpvs, 'foo', 'app-misc').expect(),
+                ('app-misc', 'foo', '1.0_rc1-r2'))
+        self.assertTrue(get_full_cpv(cpvs, 'bar').is_err())
@@ -0,0 +1,92 @@
+import shutil
+import unittest
+
+from os import path, makedirs
+from tempfile import mkdtemp
+
+from pomu.package import Package, PatchList
+from pomu.repo.init import init_plain_repo
+from pomu.repo.repo import Repository
+from pomu.util.git import index_stats
+
+class MergeTests(unittest.TestCase):
+    def setUp(self):
+        self.source_path = mkdtemp()
+        self.repo_dir = mkdtemp()
+        shutil.rmtree(self.repo_dir)
+        init_plain_repo(True, self.repo_dir).expect()
+        self.repo = Repository(self.repo_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.source_path)
+        shutil.rmtree(self.repo_dir)
+
+    def package(self, name, version='1', data='EAPI=6\n'):
+        pdir = path.join(self.source_path, 'app-misc', name)
+        makedirs(pdir, exist_ok=True)
+        ebuild = path.join('app-misc', name, '{}-{}.ebuild'.format(name, version))
+        with open(path.join(self.source_path, ebuild), 'w') as f:
+            f.write(data)
+        return Package(name, self.source_path, category='app-misc',
+                version=version, files=[ebuild])
+
+    def status(self):
+        return self.repo.repo.git.status('--porcelain')
+
+    def commits(self):
+        return len(list(self.repo.repo.iter_commits()))
+
+    def testBatch(self):
+        commits, writes, status = self.commits(), index_stats.writes, self.status()
+        self.repo.merge([self.package(x) for x in ['foo', 'bar', 'baz']]).expect()
+        self.assertEqual(self.commits(), commits + 1)
+        self.assertEqual(index_stats.writes, writes + 1)
+        self.assertEqual(sorted(self.repo.get_packages()),
+                ['app-misc/bar', 'app-misc/baz', 'app-misc/foo'])
+        self.assertEqual(self.status(), status)
+
+    def testBatchFailure(self):
+        self.repo.merge(self.package('foo', data='EAPI=6\n')).expect()
+        commits, status = self.commits(), self.status()
+        update = self.package('foo', data='EAPI=7\n')
+        broken = self.package('bar')
+        broken.filemap['app-misc/bar/files/missing.patch'] = path.join(
+                self.source_path, 'missing.patch')
+        self.assertTrue(self.repo.merge([update, self.package('baz'), broken]).is_err())
+        self.assertEqual(self.commits(), commits)
+        self.assertEqual(self.status(), status)
+        with open(path.join(self.repo_dir, 'app-misc', 'foo', 'foo-1.ebuild')) as f:
+            self.assertEqual(f.read(), 'EAPI=6\n')
+        self.assertFalse(self.repo.world.dirty)
+        self.assertEqual(self.repo.get_packages(), ['app-misc/foo'])
+        # the repository is usable afterwards
+        self.repo.merge(self.package('baz')).expect()
+        self.assertEqual(sorted(self.repo.get_packages()), ['app-misc/baz', 'app-misc/foo'])
+
+    def testStagingFailure(self):
+        commits, status = self.commits(), self.status()
+        write_meta = self.repo.write_meta
+        def failing_write_meta(pkgdir, package, manifests):
+            if package.name == 'baz':
+                raise OSError('No space left on device')
+            write_meta(pkgdir, package, manifests)
+        self.repo.write_meta = failing_write_meta
+        self.assertTrue(self.repo.merge([self.package('foo'), self.package('baz')]).is_err())
+        self.assertEqual(self.commits(), commits)
+        self.assertEqual(self.status(), status)
+        self.assertFalse(self.repo.world.dirty)
+        self.assertEqual(self.repo.get_packages(), [])
+
+    def testIndexWrites(self):
+        writes = index_stats.writes
+        self.repo.merge(self.package('foo')).expect()
+        self.assertEqual(index_stats.writes, writes + 1)
+        self.repo.remove_package('foo').expect()
+        self.assertEqual(index_stats.writes, writes + 2)
+        self.assertEqual(self.repo.get_packages(), [])
+        self.assertFalse(path.exists(path.join(self.repo_dir, 'app-misc', 'foo')))
+
+    def testPatchList(self):
+        self.repo.merge(self.package('foo')).expect()
+        self.repo.merge(PatchList('app-misc', 'foo', '1', None))
+        self.assertEqual(self.repo.get_packages(), ['app-misc/foo'])
@@ -0,0 +1,125 @@
+import unittest
+
+from pomu.search import PSPrompt
+
+class Source():
+    """A search data source stub: entry i has i % 4 ebuilds"""
+    def page_count(self):
+        return 1
+
+    def get_page(self, page):
+        return [('app-misc/pkg{}'.format(i), 'Package {}'.format(i)) for i in range(10)]
+
+    def list_items(self, ident):
+        n = int(ident[len('app-misc/pkg'):]) % 4
+        return [('{}{}'.format(ident, v), str(v), 'gentoo') for v in range(n)]
+
+class Window():
+    width, height = 80, 7
+
+class PSPromptTests(unittest.TestCase):
+    def setUp(self):
+        self.prompt = PSPrompt(Source())
+        self.prompt.window = Window()
+
+    def rows(self):
+        """Maps rows to (entry index, row within the entry) with a linear scan"""
+        return [(i, j) for i, entry in enumerate(self.prompt.entries) for j in range(len(entry))]
+
+    def expand(self, i):
+        self.prompt.idx = self.prompt.offsets[i]
+        self.prompt.toggle()
+
+    def check(self):
+        rows = self.rows()
+        self.assertEqual(len(self.prompt), len(rows))
+        for idx, row in enumerate(rows):
+            self.assertEqual(self.prompt.locate(idx), row)
+        self.assertEqual(self.prompt.get_idx(len(rows)), ((None, None), 0))
+
+    def testLocate(self):
+        self.check()
+        self.assertEqual(self.prompt.locate(0), (0, 0))
+        self.assertEqual(self.prompt.locate(9), (9, 0))
+        for i in [3, 0, 9, 5, 7]:
+            self.expand(i)
+            self.check()
+        # the first and the last rows of the expanded entries
+        self.assertEqual(self.prompt.locate(self.prompt.offsets[3]), (3, 0))
+        self.assertEqual(self.prompt.locate(self.prompt.offsets[3] + 3), (3, 3))
+        self.assertEqual(self.prompt.locate(self.prompt.offsets[4] - 1), (3, 3))
+        self.assertEqual(self.prompt.locate(self.prompt.offsets[4]), (4, 0))
+        self.assertEqual(self.prompt.locate(len(self.prompt) - 1), (9, 1))
+        # entry 0 has no ebuilds, so expanding it adds no rows
+        self.assertEqual(self.prompt.offsets[:2], [0, 1])
+
+    def testCollapse(self):
+        for i in range(10):
+            self.expand(i)
+        self.check()
+        self.assertEqual(len(self.prompt), 10 + sum(i % 4 for i in range(10)))
+        for i in [9, 3, 5]:
+            self.expand(i) # collapses it
+            self.check()
+        self.assertEqual(self.prompt.locate(self.prompt.offsets[3] + 1), (4, 0))
+        # selecting an ebuild does not change the rows
+        offsets = list(self.prompt.offsets)
+        self.prompt.idx = self.prompt.offsets[7] + 2
+        self.prompt.toggle()
+        self.assertEqual(self.prompt.offsets, offsets)
+        self.assertEqual(self.prompt.entries[7].selected(), [('app-misc/pkg71', '1', 'gentoo')])
+
+    def testTarget(self):
+        self.expand(2)
+        self.prompt.idx = self.prompt.offsets[2] + 2
+        entry, child = self.prompt.get_target()
+        self.assertIs(entry, self.prompt.entries[2])
+        self.assertEqual(child, (False, ('app-misc/pkg21', '1', 'gentoo')))
+        self.prompt.idx = self.prompt.offsets[3]
+        self.assertEqual(self.prompt.get_target(), (self.prompt.entries[3], None))
+
+    def testScrolling(self):
+        h = Window.height - 2
+        self.expand(1)
+        rows = self.rows()
+        for idx in range(len(rows)):
+            self.prompt.idx = idx
+            lst = self.prompt.lens()
+            self.assertEqual(self.prompt.top, max(0, idx - h + 1))
+            self.assertEqual(len(lst), h)
+            self.assertIs(lst[idx - self.prompt.top][0], self.prompt.entries[rows[idx][0]])
+        # moving the cursor within the viewport does not scroll it
+        top = self.prompt.top
+        for _ in range(h - 1):
+            self.prompt.process_event('<UP>')
+            self.prompt.lens()
+            self.assertEqual(self.prompt.top, top)
+        self.prompt.process_event('<UP>')
+        self.prompt.lens()
+        self.assertEqual(self.prompt.top, top - 1)
+        # the rows past the end are blank
+        self.prompt.idx = 0
+        self.prompt.top = 0
+        self.expand(1) # collapses it
+        self.prompt.idx = len(self.prompt)
+        self.assertEqual(self.prompt.lens()[-1], (None, None))
+
+    def testCollapseScrolled(self):
+        h = Window.height - 2
+        for i in [8, 9]:
+            self.expand(i)
+        # the cursor at the last ebuild of the last entry
+        self.prompt.idx = len(self.prompt) - 1
+        self.prompt.lens()
+        self.assertEqual(self.prompt.top, len(self.prompt) - h)
+        self.prompt.idx = self.prompt.offsets[9]
+        self.prompt.toggle() # collapses it
+        lst = self.prompt.lens()
+        self.assertEqual(self.prompt.top, len(self.prompt) - h)
+        self.assertNotIn((None, None), lst)
+        self.assertIs(lst[self.prompt.idx - self.prompt.top][0], self.prompt.entries[9])
+        # the viewport stays filled, once the other entry gets collapsed too
+        self.expand(8)
+        self.prompt.idx = self.prompt.offsets[9]
+        self.assertEqual(self.prompt.lens()[-1][0], self.prompt.entries[9])
+        self.assertEqual(self.prompt.top, len(self.prompt) - h)
@@ -0,0 +1,47 @@
+import shutil
+import subprocess
+import sys
+import unittest
+
+from os import path, makedirs
+from tempfile import mkdtemp
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+# modules, which are too heavy to be imported by every invocation
+HEAVY = ['portage', 'git', 'curtsies', 'lxml', 'requests', 'pbraw', 'xmlrpc', 'patch']
+
+def imported_modules(code):
+    """Runs code in a fresh interpreter, listing the modules it has imported"""
+    code += '\nimport sys\nprint(" ".join(sys.modules))\n'
+    res = subprocess.run([sys.executable, '-c', code], cwd=ROOT,
+            stdout=subprocess.PIPE, check=True)
+    return set(res.stdout.decode('utf-8').split('\n')[-2].split())
+
+class StartupTests(unittest.TestCase):
+    def setUp(self):
+        self.repo_dir = mkdtemp()
+        makedirs(path.join(self.repo_dir, 'metadata', 'pomu'))
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+
+    def assertLight(self, modules):
+        self.assertEqual([m for m in HEAVY if m in modules], [])
+
+    def testCliImport(self):
+        self.assertLight(imported_modules('import pomu.cli'))
+
+    def testStatus(self):
+        self.assertLight(imported_modules(
+            'from pomu.cli import main\n'
+            'main.main(["--no-portage", "--repo-path", {!r}, "status"], standalone_mode=False)'
+            .format(self.repo_dir)))
+
+    def testBackendOnDemand(self):
+        modules = imported_modules(
+            'from pomu.source import dispatcher\n'
+            'dispatcher.backend("fs")')
+        self.assertIn('pomu.source.file', modules)
+        self.assertNotIn('pomu.source.bugz', modules)
+        self.assertNotIn('pomu.source.url', modules)
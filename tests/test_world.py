@@ -0,0 +1,88 @@
+import shutil
+import subprocess
+import unittest
+
+from os import path, makedirs
+from tempfile import mkdtemp
+
+from pomu.repo.world import WorldIndex, meta_dir
+
+def git(cwd, *args):
+    subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.org']
+            + list(args), cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+
+class WorldIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.pomu_dir = path.join(self.dir, 'metadata', 'pomu')
+        self.index_file = path.join(self.dir, '.git', 'pomu', 'world.idx')
+        makedirs(self.pomu_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_pkg(self, category, name, version, slot='0', backend='portage'):
+        pkgdir = meta_dir(self.pomu_dir, category, name, slot)
+        makedirs(pkgdir, exist_ok=True)
+        with open(path.join(pkgdir, 'VERSION'), 'w') as f:
+            f.write(version)
+        with open(path.join(pkgdir, 'BACKEND'), 'w') as f:
+            f.write(backend + '\n')
+
+    def write_world(self, *specs):
+        with open(path.join(self.pomu_dir, 'world'), 'w') as f:
+            f.write(''.join(x + '\n' for x in specs))
+
+    def index(self):
+        return WorldIndex(self.pomu_dir, self.index_file, self.dir)
+
+    def testRebuild(self):
+        self.write_pkg('app-misc', 'foo', '1.0')
+        self.write_pkg('dev-libs', 'bar', '2', slot='2', backend='bugz')
+        self.write_world('app-misc/foo', 'dev-libs/bar:2')
+        world = self.index()
+        self.assertEqual(world.get('foo').version, '1.0')
+        self.assertEqual(world.get('bar', slot='2').backend, 'bugz')
+        self.assertTrue(path.isfile(self.index_file))
+        # a fresh index reads the persistent one, without rebuilding it
+        world = WorldIndex.__new__(WorldIndex)
+        world.rebuild = None
+        WorldIndex.__init__(world, self.pomu_dir, self.index_file, self.dir)
+        self.assertEqual(sorted(world.specs()), ['app-misc/foo', 'dev-libs/bar:2'])
+
+    def testAddRemove(self):
+        world = self.index()
+        world.add('app-misc', 'foo', '0', '1.0', 'portage')
+        world.add('app-misc', 'bar', '1', '2.0')
+        world.add('app-misc', 'foo', '0', '1.1', 'portage')
+        with open(path.join(self.pomu_dir, 'world')) as f:
+            self.assertEqual(f.read(), 'app-misc/foo\napp-misc/bar:1\n')
+        self.assertEqual(self.index().get('foo').version, '1.1')
+        self.assertEqual(world.remove('app-misc', 'foo').version, '1.1')
+        self.assertIsNone(world.remove('app-misc', 'foo'))
+        world = self.index()
+        self.assertIsNone(world.get('foo'))
+        self.assertEqual(world.specs(), ['app-misc/bar:1'])
+
+    def testDuplicates(self):
+        self.write_pkg('app-misc', 'foo', '1.0')
+        self.write_world('app-misc/foo', 'app-misc/foo', ' app-misc/foo ', '')
+        world = self.index()
+        self.assertEqual(len(world), 1)
+        self.assertEqual(world.specs(), ['app-misc/foo'])
+
+    def testMetadataChange(self):
+        self.write_pkg('app-misc', 'foo', '1.0')
+        self.write_world('app-misc/foo')
+        git(self.dir, 'init', '-q')
+        git(self.dir, 'add', 'metadata')
+        git(self.dir, 'commit', '-q', '-m', 'foo-1.0')
+        self.assertEqual(self.index().get('foo').version, '1.0')
+        # a commit (or a checkout) changing the metadata, but not the world file
+        self.write_pkg('app-misc', 'foo', '2.0', backend='url')
+        git(self.dir, 'commit', '-q', '-am', 'foo-2.0')
+        world = self.index()
+        self.assertEqual(world.get('foo').version, '2.0')
+        git(self.dir, 'reset', '-q', '--hard', 'HEAD^')
+        self.assertEqual(world.get('foo').version, '1.0')
+        self.assertEqual(world.get('foo').backend, 'portage')
@@ -0,0 +1,132 @@
+import os
+import shutil
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import mkdtemp
+
+from pomu.data.zugaina import SearchCache, ZugainaDataSource
+from pomu.util.http import http_cache
+
+def search_page(page):
+    items = ''.join('<a href="/dev-libs/pkg{0}"><div>dev-libs/pkg{0}<span>Package {0}</span></div></a>'
+            .format(i) for i in range((page - 1) * 50, min(page * 50, 60)))
+    return ('<html><body><div class="pager"><span>Results 60</span></div>'
+            '<div id="search_results">' + items + '</div></body></html>')
+
+def item_page(name):
+    return ('<html><body><div id="ebuild_list"><ul><div id="gentoo">'
+            '<li><a href="/AJAX/Ebuild/{0}1">{0}</a><div><b>{0}-1.0</b></div></li>'
+            '</div></ul></div></body></html>'.format(name))
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    requests = {}
+    connections = 0
+
+    def setup(self):
+        Handler.connections += 1
+        super().setup()
+
+    def do_GET(self):
+        Handler.requests[self.path] = Handler.requests.get(self.path, 0) + 1
+        if self.path.startswith('/Search'):
+            body = search_page(int(self.path.rpartition('=')[2]))
+        else:
+            body = item_page(self.path.rpartition('/')[2])
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class ZugainaTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = 'http://127.0.0.1:{}/'.format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Handler.requests, Handler.connections = {}, 0
+        self.cache_dir = http_cache._directory = mkdtemp()
+        self.search_dir = mkdtemp()
+        self.ds = self.source()
+
+    def tearDown(self):
+        self.ds.close()
+        http_cache._directory = None
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(self.search_dir)
+
+    def source(self, ttl=60):
+        return ZugainaDataSource('pkg', self.base, jobs=2,
+                cache=SearchCache(ttl, directory=self.search_dir))
+
+    def testSearch(self):
+        self.assertEqual(self.ds.page_count(), 2)
+        page = self.ds.get_page(1)
+        self.assertEqual(len(page), 50)
+        self.assertEqual(page[3], ('dev-libs/pkg3', 'Package 3'))
+        self.assertEqual(self.ds.list_items('dev-libs/pkg3'), [('pkg31', '1.0', 'gentoo')])
+        self.assertEqual(len(self.ds.get_page(2)), 10)
+
+    def testPrefetch(self):
+        self.ds.get_page(1)
+        self.ds.pool.shutdown(wait=True) # waits for the prefetches to complete
+        self.assertIn(2, self.ds.pagecache)
+        self.assertEqual(len(self.ds.itemcache), 50)
+        for i in range(50):
+            self.ds.list_items('dev-libs/pkg{}'.format(i))
+        self.assertTrue(all(x == 1 for x in Handler.requests.values()))
+        self.assertLessEqual(Handler.connections, 3)
+
+    def testPersistentCache(self):
+        page = self.ds.get_page(1)
+        items = self.ds.list_items('dev-libs/pkg3')
+        self.ds.pool.shutdown(wait=True)
+        Handler.requests = {}
+        ds = self.source()
+        self.assertEqual(ds.page_count(), 2)
+        self.assertEqual(ds.get_page(1), page)
+        self.assertEqual(ds.list_items('dev-libs/pkg3'), items)
+        ds.close()
+        self.assertEqual(Handler.requests, {})
+        ds = self.source(ttl=0)
+        ds.get_page(1)
+        ds.close()
+        self.assertIn('/Search?search=pkg&page=1', Handler.requests)
+
+    def testRawPages(self):
+        self.ds.get_page(1)
+        self.ds.list_items('dev-libs/pkg3')
+        self.ds.pool.shutdown(wait=True)
+        # only the parsed pages are kept
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        self.assertTrue(os.listdir(self.search_dir))
+
+    def testCacheSize(self):
+        cache = SearchCache(60, max_size=64, directory=self.search_dir)
+        cache.put('a', {'items': []})
+        self.assertEqual(cache.get('a'), {'items': []})
+        cache.put('b', {'items': [['dev-libs/pkg1', 'Package 1']] * 4})
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+
+    def testIterResults(self):
+        res = list(self.ds.iter_results(limit=55))
+        self.assertEqual(len(res), 55)
+        self.assertEqual(res[54], ('dev-libs/pkg54', 'Package 54'))
+        self.assertEqual(len(list(self.ds.iter_results())), 60)
+        self.assertEqual(list(self.ds.iter_results(limit=0)), [])
+        self.assertFalse(any(x.startswith('/dev-libs') for x in Handler.requests))